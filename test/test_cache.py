@@ -0,0 +1,221 @@
+import pytest
+
+import os
+import time
+from backports.tempfile import TemporaryDirectory
+
+from velox.cache import LocalCache, get_cache
+from velox.lite import save_object, load_object
+
+import boto3
+from moto import mock_s3
+
+import logging
+logging.basicConfig(level=logging.DEBUG)
+
+TEST_BUCKET = 'ci-velox-bucket'
+
+
+def _put(cache, key, nbytes):
+    with cache.writer(key) as path:
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * nbytes)
+
+
+def test_lru_eviction():
+    with TemporaryDirectory() as d:
+        cache = LocalCache(d, max_bytes=250)
+
+        _put(cache, 'a', 100)
+        time.sleep(0.01)
+        _put(cache, 'b', 100)
+        time.sleep(0.01)
+
+        # touching `a` makes `b` the least recently used entry
+        assert cache.get('a') == os.path.join(d, 'a')
+        time.sleep(0.01)
+        _put(cache, 'c', 100)
+
+        assert sorted(os.listdir(d)) == ['a', 'c']
+        assert cache.get('b') is None
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['entries'] == 2
+        assert stats['bytes'] == 200
+
+        # an entry larger than the budget is kept, everything else is not
+        _put(cache, 'd', 300)
+        assert os.listdir(d) == ['d']
+
+
+def test_writes_are_atomic():
+    with TemporaryDirectory() as d:
+        cache = LocalCache(d)
+        with pytest.raises(RuntimeError):
+            with cache.writer('a') as path:
+                with open(path, 'wb') as fp:
+                    fp.write(b'partial')
+                assert cache.get('a') is None
+                raise RuntimeError('interrupted download')
+
+        assert os.listdir(d) == []
+
+
+def test_invalid_entries():
+    with TemporaryDirectory() as d:
+        cache = LocalCache(d)
+        _put(cache, 'a', 10)
+        assert cache.get('a', expected_size=11) is None
+        assert os.listdir(d) == []
+
+        for key in ['', '.hidden', '../escape', 'sub/key']:
+            with pytest.raises(ValueError):
+                cache.path(key)
+
+
+@mock_s3
+def test_fetch():
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    conn.Object(TEST_BUCKET, 'blob.bin').put(Body=b'foobar')
+
+    with TemporaryDirectory() as d:
+        cache = get_cache(os.path.join(d, 'cache'))
+        assert get_cache(os.path.join(d, 'cache')) is cache
+
+        for _ in range(2):
+            path = cache.fetch('s3://{}/blob.bin'.format(TEST_BUCKET))
+            with open(path, 'rb') as fp:
+                assert fp.read() == b'foobar'
+
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+        # overwriting the source changes its ETag, so it is fetched again
+        conn.Object(TEST_BUCKET, 'blob.bin').put(Body=b'bazqux')
+        path = cache.fetch('s3://{}/blob.bin'.format(TEST_BUCKET))
+        with open(path, 'rb') as fp:
+            assert fp.read() == b'bazqux'
+        assert cache.misses == 2
+
+
+def test_fetch_revalidates_local_source():
+    with TemporaryDirectory() as d:
+        cache = LocalCache(os.path.join(d, 'cache'))
+        source = os.path.join(d, 'blob.bin')
+        with open(source, 'wb') as fp:
+            fp.write(b'foobar')
+
+        assert cache.fetch(source) == cache.fetch(source)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        # same size, new bytes - only the modification time gives it away
+        with open(source, 'wb') as fp:
+            fp.write(b'bazqux')
+        os.utime(source, (time.time() + 10, time.time() + 10))
+        with open(cache.fetch(source), 'rb') as fp:
+            assert fp.read() == b'bazqux'
+        assert (cache.hits, cache.misses) == (1, 2)
+
+        # entries without a validator are refetched unless asked not to
+        cache.remove('blob.bin')
+        _put(cache, 'blob.bin', 6)
+        assert cache.fetch(source, revalidate=False) is not None
+        assert (cache.hits, cache.misses) == (2, 2)
+        cache.fetch(source)
+        assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_held_entries_are_not_evicted():
+    with TemporaryDirectory() as d:
+        cache = LocalCache(os.path.join(d, 'cache'), max_bytes=150)
+        source = os.path.join(d, 'blob.bin')
+        with open(source, 'wb') as fp:
+            fp.write(b'x' * 100)
+
+        with cache.fetched(source) as path:
+            time.sleep(0.01)
+            _put(cache, 'b', 100)
+            # the least recently used entry is in use, so it stays
+            assert sorted(os.listdir(cache.directory)) == \
+                ['.blob.bin.lock', '.blob.bin.validator', 'b', 'blob.bin']
+            cache.clear()
+            assert os.path.exists(path)
+
+        # once released, it is evicted along with its lock file
+        _put(cache, 'c', 100)
+        assert os.listdir(cache.directory) == ['c']
+
+
+def test_fetched_refetches_evicted_entries():
+    with TemporaryDirectory() as d:
+        cache = LocalCache(os.path.join(d, 'cache'))
+        source = os.path.join(d, 'blob.bin')
+        with open(source, 'wb') as fp:
+            fp.write(b'foobar')
+
+        fetch = cache.fetch
+        fetched = []
+
+        def fetch_then_evict(*args, **kwargs):
+            # as if another process evicted it before it could be held
+            path = fetch(*args, **kwargs)
+            fetched.append(path)
+            if len(fetched) == 1:
+                cache.clear()
+            return path
+
+        cache.fetch = fetch_then_evict
+        with cache.fetched(source) as path:
+            with open(path, 'rb') as fp:
+                assert fp.read() == b'foobar'
+        assert len(fetched) == 2
+        assert cache.misses == 2
+
+
+def test_lite_load_through_cache():
+    with TemporaryDirectory() as prefix:
+        with TemporaryDirectory() as d:
+            cache = LocalCache(d)
+            save_object({'foo': 'bar'}, 'obj', prefix, versioned=True)
+
+            for _ in range(2):
+                o = load_object('obj', prefix, versioned=True,
+                                local_cache_dir=cache)
+                assert o == {'foo': 'bar'}
+
+            assert cache.hits == 1
+            assert cache.misses == 1
+            assert cache.stats()['entries'] == 1
+
+
+def _fetch_in_worker(args):
+    directory, source = args
+    cache = LocalCache(directory)
+    with open(cache.fetch(source), 'rb') as fp:
+        assert len(fp.read()) == os.path.getsize(source)
+    return cache.misses
+
+
+def test_fetch_across_processes():
+    import multiprocessing
+
+    with TemporaryDirectory() as d:
+        source = os.path.join(d, 'blob.bin')
+        with open(source, 'wb') as fp:
+            fp.write(os.urandom(8 * 1024 ** 2))
+
+        pool = multiprocessing.Pool(8)
+        try:
+            misses = pool.map(_fetch_in_worker,
+                              [(os.path.join(d, 'cache'), source)] * 16)
+        finally:
+            pool.close()
+            pool.join()
+
+        # exactly one process copied the blob, everyone else waited for it
+        assert sum(misses) == 1
+        assert sorted(os.listdir(os.path.join(d, 'cache'))) == \
+            ['.blob.bin.lock', '.blob.bin.validator', 'blob.bin']
@@ -0,0 +1,119 @@
+import pytest
+
+import os
+from backports.tempfile import TemporaryDirectory
+from hashlib import sha256
+
+from velox import chunking
+from velox.cache import LocalCache
+from velox.chunking import chunk_boundaries
+from velox.filesystem import configure, get_s3_client
+
+import boto3
+from moto import mock_s3
+
+from velox_test_utils import create_class, RESET
+
+TEST_BUCKET = 'ci-velox-bucket'
+
+DATA = os.urandom(1024 ** 2)
+# an edit in the middle of DATA
+EDITED = DATA[:500000] + b'an insertion' + DATA[500000:]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(chunking, 'CHUNK_MIN_SIZE', 4096)
+    monkeypatch.setattr(chunking, 'CHUNK_MASK_BITS', 13)
+    monkeypatch.setattr(chunking, 'CHUNK_MAX_SIZE', 64 * 1024)
+
+
+@pytest.fixture
+def chunked(small_chunks):
+    configure(chunked=True)
+    yield
+    configure(chunked=False)
+    RESET()
+
+
+def _digests(data):
+    start, digests = 0, []
+    for end in chunk_boundaries(data):
+        digests.append(sha256(data[start:end]).hexdigest())
+        start = end
+    return digests
+
+
+def test_boundaries(small_chunks):
+    ends = chunk_boundaries(DATA)
+    assert ends[-1] == len(DATA)
+    sizes = [b - a for a, b in zip([0] + ends, ends)]
+    assert all(4096 <= size <= 64 * 1024 for size in sizes[:-1])
+
+    assert chunk_boundaries(b'') == []
+    with pytest.raises(ValueError):
+        chunk_boundaries(DATA, mask_bits=32)
+
+
+def test_numpy_and_python_boundaries_agree(small_chunks):
+    data = DATA[:200000]
+    ends = chunk_boundaries(data)
+    candidates = chunking._candidates_python(data, 13)
+    assert candidates == chunking._candidates_numpy(data, 13)
+    assert len(candidates) > 0 and set(ends[:-1]) <= set(candidates)
+
+
+def test_edits_only_move_nearby_boundaries(small_chunks):
+    before, after = _digests(DATA), _digests(EDITED)
+    assert len(set(after) - set(before)) <= 2
+
+
+def test_chunked_save_load_local(chunked):
+    from velox.filesystem import read_metadata
+
+    Model = create_class('chunked')
+    with TemporaryDirectory() as d:
+        store = os.path.join(d, '.velox_blobs', 'chunks')
+
+        Model(DATA).save(prefix=d)
+        n_chunks = len(os.listdir(store))
+        path = Model(EDITED).save(prefix=d)
+        # only the chunks around the edit are new
+        assert len(os.listdir(store)) - n_chunks <= 2
+        assert os.path.getsize(path) < 64 * 1024
+
+        o = Model.load(prefix=d)
+        assert o.obj() == EDITED
+        assert o.current_sha == read_metadata(path)['sha256']
+
+
+@mock_s3
+def test_chunked_cached_load_fetches_missing_chunks(chunked):
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    prefix = 's3://{}/chunked'.format(TEST_BUCKET)
+    Model = create_class('chunked')
+
+    calls = []
+
+    def count(params, **kwargs):
+        if '/.velox_blobs/chunks/' in '/' + params.get('Key', ''):
+            calls.append(params['Key'])
+
+    with TemporaryDirectory() as cache_dir:
+        cache = LocalCache(cache_dir)
+        Model(DATA).save(prefix=prefix)
+        assert Model.load(prefix=prefix, local_cache_dir=cache).obj() == DATA
+        # without a cache, the payload is still assembled from its chunks
+        assert Model.load(prefix=prefix, stream=True).obj() == DATA
+
+        Model(EDITED).save(prefix=prefix)
+        events = get_s3_client().meta.events
+        events.register('provide-client-params.s3.GetObject', count)
+        try:
+            o = Model.load(prefix=prefix, local_cache_dir=cache)
+        finally:
+            events.unregister('provide-client-params.s3.GetObject', count)
+
+        assert o.obj() == EDITED
+        assert 0 < len(calls) <= 2
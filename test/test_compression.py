@@ -0,0 +1,132 @@
+import pytest
+
+import io
+import os
+from backports.tempfile import TemporaryDirectory
+
+from velox import VeloxObject, register_object
+from velox.compression import (available_codecs, CompressingWriter,
+                               decompressing_reader)
+from velox.lite import save_object, load_object
+
+import boto3
+from moto import mock_s3
+
+from velox_test_utils import create_class, RESET
+
+TEST_BUCKET = 'ci-velox-bucket'
+
+PAYLOAD = b''.join(str(i).encode() for i in range(200000))
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_codec_roundtrip(codec):
+    buf = io.BytesIO()
+    with CompressingWriter(buf, codec) as writer:
+        for i in range(0, len(PAYLOAD), 4096):
+            writer.write(PAYLOAD[i:i + 4096])
+
+    assert len(buf.getvalue()) < len(PAYLOAD)
+
+    buf.seek(0)
+    assert decompressing_reader(buf, codec).read() == PAYLOAD
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_decompression_is_bounded(codec):
+    from velox.compression import _READ_SIZE
+
+    size = 64 * 1024 ** 2
+    buf = io.BytesIO()
+    with CompressingWriter(buf, codec) as writer:
+        for _ in range(size // (1024 ** 2)):
+            writer.write(bytes(1024 ** 2))
+    buf.seek(0)
+
+    reader = decompressing_reader(buf, codec)
+    read, largest = 0, 0
+    for chunk in iter(lambda: reader.read(64 * 1024), b''):
+        assert not chunk.strip(b'\0')
+        read += len(chunk)
+        largest = max(largest, len(reader.raw._pending))
+    assert read == size
+    if codec in {'zlib', 'lzma', 'lz4'}:
+        assert largest <= _READ_SIZE
+
+
+def test_stdlib_codecs_available():
+    assert 'zlib' in available_codecs()
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        CompressingWriter(io.BytesIO(), 'notacodec')
+
+    with pytest.raises(ValueError):
+        register_object(registered_name='foo', codec='notacodec')
+
+    RESET()
+
+
+def _compressed_class(codec):
+    @register_object(registered_name='compressed', codec=codec, codec_level=1)
+    class Compressed(VeloxObject):
+
+        def __init__(self, o=None):
+            super(Compressed, self).__init__()
+            self._o = o
+
+        def _save(self, fileobject):
+            fileobject.write(self._o)
+
+        @classmethod
+        def _load(cls, fileobject):
+            return cls(fileobject.read())
+
+    return Compressed
+
+
+def test_compressed_save_load_local():
+    Compressed = _compressed_class('zlib')
+    with TemporaryDirectory() as d:
+        path = Compressed(PAYLOAD).save(prefix=d)
+        assert os.path.getsize(path) < len(PAYLOAD)
+        assert Compressed.load(prefix=d)._o == PAYLOAD
+
+    RESET()
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_compressed_save_load_s3(stream):
+    Compressed = _compressed_class('zlib')
+    with mock_s3():
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.create_bucket(Bucket=TEST_BUCKET)
+        prefix = 's3://{}/compressed'.format(TEST_BUCKET)
+
+        Compressed(PAYLOAD).save(prefix=prefix, stream=stream)
+        o = Compressed.load(prefix=prefix, stream=stream)
+        assert o._o == PAYLOAD
+
+    RESET()
+
+
+def test_uncompressed_class_unaffected():
+    Model = create_class('uncompressed')
+    with TemporaryDirectory() as d:
+        Model({'foo': 'bar'}).save(prefix=d)
+        assert Model.load(prefix=d).obj() == {'foo': 'bar'}
+
+    RESET()
+
+
+@pytest.mark.parametrize('codec', available_codecs())
+def test_lite_codec(codec):
+    obj = {'payload': PAYLOAD}
+    with TemporaryDirectory() as d:
+        save_object(obj, 'compressed', d, codec=codec)
+        assert os.path.getsize(os.path.join(d, 'compressed')) < len(PAYLOAD)
+        assert load_object('compressed', d) == obj
+
+        with pytest.raises(ValueError):
+            save_object(obj, 'other', d, codec='notacodec')
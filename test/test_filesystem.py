@@ -9,7 +9,9 @@ import numpy as np
 
 
 from velox.filesystem import (get_aware_filepath, find_matching_files,
-                              stitch_filename, ensure_exists, parse_s3)
+                              stitch_filename, ensure_exists, parse_s3,
+                              configure, read_manifest, write_manifest,
+                              update_manifest)
 
 from velox.tools import timestamp, obtain_padding_bytes
 
@@ -47,6 +49,20 @@ def test_aware_filepath():
                 assert f.read() == 'foobar'
 
 
+def test_aware_filepath_local_write_keeps_extension():
+    with TemporaryDirectory() as d:
+        fp = os.path.join(d, 'file.npy')
+        with get_aware_filepath(fp, 'wb') as f:
+            # written to a hidden file until closed, named like the target
+            assert os.path.basename(f.name).startswith('.')
+            assert os.path.basename(f.name).endswith('.file.npy')
+            assert not os.path.exists(fp)
+            np.save(f, np.arange(3))
+
+        assert os.listdir(d) == ['file.npy']
+        assert (np.load(fp) == np.arange(3)).all()
+
+
 @mock_s3
 def test_aware_filepath_with_type_hint():
     conn = boto3.resource('s3', region_name='us-east-1')
@@ -74,6 +90,211 @@ def test_aware_filepath_with_type_hint():
                 assert type_hint == 'numpy.ndarray'
 
 
+@mock_s3
+def test_streaming_s3_read():
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    x = np.random.normal(0, 1, (10, ))
+    payload = pickle.dumps(np.arange(10000))
+
+    fp = 's3://{}/file.bin'.format(TEST_BUCKET)
+    with get_aware_filepath(fp, 'wb') as f:
+        f.write(payload)
+        f.write(obtain_padding_bytes(x))
+
+    with get_aware_filepath(fp, 'rb', yield_type_hint=True, stream=True) as \
+            (f, type_hint):
+        assert type_hint == 'numpy.ndarray'
+        assert f.name == fp
+        assert np.all(pickle.load(f) == np.arange(10000))
+        assert f.read() == b''
+        f.seek(-10, 2)
+        assert f.read() == payload[-10:]
+
+    with get_aware_filepath(fp, 'rb', stream=True) as f:
+        assert f.read() == payload
+
+    empty = 's3://{}/empty.bin'.format(TEST_BUCKET)
+    with get_aware_filepath(empty, 'w') as f:
+        pass
+    with get_aware_filepath(empty, 'r', stream=True) as f:
+        assert f.read() == ''
+
+
+@mock_s3
+def test_streaming_s3_read_all_in_one_request():
+    from velox.filesystem import get_s3_client
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    payload = os.urandom(512 * 1024)
+
+    fp = 's3://{}/file.bin'.format(TEST_BUCKET)
+    with get_aware_filepath(fp, 'wb') as f:
+        f.write(payload)
+
+    calls = []
+
+    def count(**kwargs):
+        calls.append(kwargs)
+
+    events = get_s3_client().meta.events
+    with get_aware_filepath(fp, 'rb', stream=True) as f:
+        events.register('before-call.s3.GetObject', count)
+        try:
+            assert f.read() == payload
+        finally:
+            events.unregister('before-call.s3.GetObject', count)
+
+    assert len(calls) == 1
+
+
+@pytest.fixture
+def small_parts():
+    from velox.filesystem import S3_MIN_PART_SIZE
+    configure(multipart_part_size=S3_MIN_PART_SIZE, transfer_workers=2)
+    yield S3_MIN_PART_SIZE
+    configure(multipart_part_size=8 * 1024 ** 2, transfer_workers=8)
+
+
+@mock_s3
+def test_streaming_multipart_upload(small_parts):
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    payload = os.urandom(2 * small_parts + 1234)
+
+    fp = 's3://{}/big.bin'.format(TEST_BUCKET)
+    with get_aware_filepath(fp, 'wb', stream=True) as f:
+        for i in range(0, len(payload), 1024 ** 2):
+            f.write(payload[i:i + 1024 ** 2])
+        assert f.seek(0, 2) == len(payload)
+
+    obj = conn.Object(TEST_BUCKET, 'big.bin')
+    # multipart ETags are suffixed with the number of parts
+    assert obj.e_tag.strip('"').endswith('-3')
+    assert obj.get()['Body'].read() == payload
+
+    small = 's3://{}/small.txt'.format(TEST_BUCKET)
+    with get_aware_filepath(small, 'w', stream=True) as f:
+        f.write('foobar')
+    with get_aware_filepath(small, 'r') as f:
+        assert f.read() == 'foobar'
+
+
+@mock_s3
+def test_streaming_upload_aborts_on_error(small_parts):
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+
+    fp = 's3://{}/broken.bin'.format(TEST_BUCKET)
+    with pytest.raises(RuntimeError):
+        with get_aware_filepath(fp, 'wb', stream=True) as f:
+            f.write(os.urandom(small_parts + 1))
+            raise RuntimeError('failed mid-save')
+
+    assert not list(conn.Bucket(TEST_BUCKET).objects.all())
+    assert not list(conn.Bucket(TEST_BUCKET).multipart_uploads.all())
+
+
+@mock_s3
+def test_parallel_upload_file(small_parts):
+    from velox.filesystem import upload_file
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    payload = os.urandom(small_parts + 1234)
+
+    with TemporaryDirectory() as d:
+        local = os.path.join(d, 'big.bin')
+        with open(local, 'wb') as f:
+            f.write(payload)
+        upload_file(local, 's3://{}/big.bin'.format(TEST_BUCKET))
+
+    obj = conn.Object(TEST_BUCKET, 'big.bin')
+    assert obj.e_tag.strip('"').endswith('-2')
+    assert obj.get()['Body'].read() == payload
+
+
+@mock_s3
+def test_parallel_ranged_download():
+    from velox.filesystem import download_file
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    payload = os.urandom(10 * 1024 + 17)
+    conn.Object(TEST_BUCKET, 'blob.bin').put(Body=payload)
+    fp = 's3://{}/blob.bin'.format(TEST_BUCKET)
+
+    configure(download_chunk_size=1024, transfer_workers=4)
+    try:
+        with TemporaryDirectory() as d:
+            local = os.path.join(d, 'blob.bin')
+            assert download_file(fp, local) == len(payload)
+            with open(local, 'rb') as f:
+                assert f.read() == payload
+
+            assert download_file(fp, local, length=2049) == 2049
+            with open(local, 'rb') as f:
+                assert f.read() == payload[:2049]
+
+        with get_aware_filepath(fp, 'rb') as f:
+            assert f.read() == payload
+    finally:
+        configure(download_chunk_size=8 * 1024 ** 2, transfer_workers=8)
+
+
+def test_local_read_is_zero_copy():
+    x = np.random.normal(0, 1, (10, ))
+    with TemporaryDirectory() as d:
+        fp = os.path.join(d, 'file.txt')
+        with get_aware_filepath(fp, 'wb') as f:
+            f.write(b'foobarbaz')
+            f.write(obtain_padding_bytes(x))
+        size = os.path.getsize(fp)
+
+        with get_aware_filepath(fp, 'rb', yield_type_hint=True) as \
+                (f, type_hint):
+            # we operate on the original file, not on a copy of it
+            assert f.raw._raw.name == fp
+            assert type_hint == 'numpy.ndarray'
+            f.seek(-3, 2)
+            assert f.read() == b'baz'
+            f.seek(3)
+            assert f.read(3) == b'bar'
+            assert f.raw._copy_directory is None
+
+            # reopening by name sees the payload only
+            with open(f.name, 'rb') as g:
+                assert g.read() == b'foobarbaz'
+            assert os.path.basename(f.name) == 'file.txt'
+            copy = f.name
+        assert not os.path.exists(copy)
+
+        assert os.path.getsize(fp) == size
+        assert glob(os.path.join(d, '*')) == [fp]
+
+
+def test_shared_s3_client():
+    from velox import filesystem
+
+    client = filesystem.get_s3_client()
+    assert filesystem.get_s3_client() is client
+    assert client.meta.config.max_pool_connections == 16
+
+    configure(max_pool_connections=32)
+    try:
+        resized = filesystem.get_s3_client()
+        assert resized is not client
+        assert resized.meta.config.max_pool_connections == 32
+    finally:
+        configure(max_pool_connections=16)
+
+    # a forked child must never reuse its parent's connections
+    filesystem._POOL['pid'] = -1
+    assert filesystem.get_s3_client() is not client
+    assert filesystem._POOL['pid'] == os.getpid()
+
+
 def test_stitch_filename():
 
     reference = 's3://myBucket/file.txt'
@@ -95,6 +316,35 @@ def test_ensure_exists():
         ensure_exists(os.path.join(d, timestamp()))
 
 
+@mock_s3
+def test_ensure_exists_is_cached():
+    from velox.filesystem import get_s3_client
+
+    calls = []
+
+    def count(event_name, **kwargs):
+        calls.append(event_name)
+
+    events = get_s3_client().meta.events
+    events.register('before-call.s3', count)
+    try:
+        bucket = 'velox-{}'.format(timestamp())
+        ensure_exists('s3://{}/some/prefix'.format(bucket))
+        assert 'before-call.s3.CreateBucket' in calls
+        assert 'before-call.s3.ListBuckets' not in calls
+
+        del calls[:]
+        ensure_exists('s3://{}/some/prefix'.format(bucket))
+        ensure_exists('s3://{}/another/prefix'.format(bucket))
+        assert not calls
+    finally:
+        events.unregister('before-call.s3', count)
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    ensure_exists('s3://{}'.format(TEST_BUCKET))
+
+
 def test_bad_s3():
     with pytest.raises(ValueError):
         with TemporaryDirectory() as d:
@@ -126,3 +376,183 @@ def test_list_contents():
 
         assert len(s3match) == nb_files
         assert len(fsmatch) == nb_files
+
+
+@pytest.fixture
+def manifests_enabled():
+    configure(use_manifest=True)
+    yield
+    configure(use_manifest=False)
+
+
+@mock_s3
+def test_manifest_roundtrip(manifests_enabled):
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+
+    with TemporaryDirectory() as d:
+        for prefix in ['s3://{}/pfx'.format(TEST_BUCKET), d]:
+            assert read_manifest(prefix) is None
+
+            for i in range(3):
+                path = stitch_filename(prefix, 'file-{}.txt'.format(i))
+                with get_aware_filepath(path, 'w') as f:
+                    f.write('foobar-{}'.format(i))
+                update_manifest(path)
+
+            entries = read_manifest(prefix)
+            assert sorted(entries) == ['file-0.txt', 'file-1.txt',
+                                       'file-2.txt']
+            assert entries['file-0.txt'] == len('foobar-0')
+
+            matches = find_matching_files(prefix, '*txt')
+            assert list(map(os.path.basename, matches)) == [
+                'file-2.txt', 'file-1.txt', 'file-0.txt'
+            ]
+
+
+@mock_s3
+def test_manifest_answers_lookups(manifests_enabled):
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    prefix = 's3://{}/pfx'.format(TEST_BUCKET)
+
+    with get_aware_filepath(prefix + '/file-0.txt', 'w') as f:
+        f.write('foobar')
+
+    # entries only known to the manifest prove the listing was skipped
+    write_manifest(prefix, {'file-0.txt': 6, 'ghost.txt': 10, 'empty.txt': 0})
+    assert find_matching_files(prefix, '*txt') == ['ghost.txt', 'file-0.txt']
+    assert find_matching_files(prefix, '*txt', use_manifest=False) == \
+        ['file-0.txt']
+
+    # no manifest matches means we fall back to a listing
+    assert find_matching_files(prefix, 'file-0*') == ['file-0.txt']
+
+
+def test_manifest_local_staleness(manifests_enabled):
+    with TemporaryDirectory() as d:
+        path = os.path.join(d, 'file-0.txt')
+        with open(path, 'w') as f:
+            f.write('foobar')
+        update_manifest(path)
+        assert read_manifest(d) == {'file-0.txt': 6}
+
+        time.sleep(0.01)
+        with open(os.path.join(d, 'file-1.txt'), 'w') as f:
+            f.write('written behind velox')
+
+        assert read_manifest(d) is None
+        assert find_matching_files(d, '*txt') == [
+            os.path.join(d, 'file-1.txt'), os.path.join(d, 'file-0.txt')
+        ]
+
+
+@mock_s3
+def test_manifest_s3_removed_file(manifests_enabled):
+    from velox.filesystem import resolve_matching_file
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    prefix = 's3://{}/pfx'.format(TEST_BUCKET)
+
+    for i in range(2):
+        path = prefix + '/file-{}.txt'.format(i)
+        with get_aware_filepath(path, 'w') as f:
+            f.write('foobar')
+        update_manifest(path)
+
+    def newest(filelist):
+        return filelist[0]
+
+    assert resolve_matching_file(prefix, 'file*', newest) == 'file-1.txt'
+
+    # a file removed behind our back is noticed once it is picked
+    conn.Object(TEST_BUCKET, 'pfx/file-1.txt').delete()
+    assert find_matching_files(prefix, 'file*')[0] == 'file-1.txt'
+    assert resolve_matching_file(prefix, 'file*', newest) == 'file-0.txt'
+    assert read_manifest(prefix) is None
+
+    # and the next save rebuilds the manifest from a listing
+    path = prefix + '/file-2.txt'
+    with get_aware_filepath(path, 'w') as f:
+        f.write('foobar')
+    update_manifest(path)
+    assert read_manifest(prefix) == {'file-0.txt': 6, 'file-2.txt': 6}
+
+
+@mock_s3
+def test_manifest_s3_concurrent_update(manifests_enabled):
+    from botocore.exceptions import ClientError
+    from velox.filesystem import get_s3_client
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    prefix = 's3://{}/pfx'.format(TEST_BUCKET)
+
+    for i in range(2):
+        with get_aware_filepath(prefix + '/file-{}.txt'.format(i), 'w') as f:
+            f.write('foobar')
+    update_manifest(prefix + '/file-0.txt')
+
+    conditions = []
+
+    def concurrent_save(params, **kwargs):
+        if not params['Key'].endswith('manifest.json'):
+            return
+        conditions.append(params.get('IfMatch', params.get('IfNoneMatch')))
+        if len(conditions) == 1:
+            # another saver gets in between our read and our write
+            write_manifest(prefix, {'file-0.txt': 6, 'other.txt': 6})
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}},
+                              'PutObject')
+
+    events = get_s3_client().meta.events
+    events.register('provide-client-params.s3.PutObject', concurrent_save)
+    try:
+        update_manifest(prefix + '/file-1.txt')
+    finally:
+        events.unregister('provide-client-params.s3.PutObject',
+                          concurrent_save)
+
+    # the update was retried against the manifest written in between (by an
+    # unconditional write of its own)
+    first, concurrent, retried = conditions
+    assert concurrent is None
+    assert None not in (first, retried) and first != retried
+    assert read_manifest(prefix) == {
+        'file-0.txt': 6, 'file-1.txt': 6, 'other.txt': 6
+    }
+
+
+@mock_s3
+def test_manifest_s3_update_gives_up(manifests_enabled):
+    from botocore.exceptions import ClientError
+    from velox.filesystem import get_s3_client
+
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    prefix = 's3://{}/pfx'.format(TEST_BUCKET)
+
+    for i in range(2):
+        with get_aware_filepath(prefix + '/file-{}.txt'.format(i), 'w') as f:
+            f.write('foobar')
+    update_manifest(prefix + '/file-0.txt')
+
+    def always_conflict(params, **kwargs):
+        if params['Key'].endswith('manifest.json'):
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}},
+                              'PutObject')
+
+    events = get_s3_client().meta.events
+    events.register('provide-client-params.s3.PutObject', always_conflict)
+    try:
+        update_manifest(prefix + '/file-1.txt')
+    finally:
+        events.unregister('provide-client-params.s3.PutObject',
+                          always_conflict)
+
+    # no manifest is better than one silently missing a file
+    assert read_manifest(prefix) is None
+    assert find_matching_files(prefix, 'file*') == ['file-1.txt',
+                                                    'file-0.txt']
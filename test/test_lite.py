@@ -142,6 +142,11 @@ def test_load_full_velox_with_sha(name, prefix):
 
         assert isinstance(result, tuple)
         assert len(result) == 2
+
+        # the hash is recorded at save time and is stable across saves
+        instance.save(prefix)
+        _, sha = load_object(name, prefix, versioned=True, return_sha=True)
+        assert sha == result[1]
     finally:
         velox_test_utils.RESET()
 
@@ -160,3 +165,74 @@ def test_load_secret_mismatch(name, prefix, versioned, secret):
     save_object('foo', name, prefix, versioned=versioned, secret=secret)
     with pytest.raises(RuntimeError):
         load_object(name, prefix, versioned=versioned, secret='WrongSecret')
+
+
+def test_legacy_binary_readable(name, prefix, secret):
+    import itsdangerous
+    from velox.filesystem import get_aware_filepath, stitch_filename
+
+    serializer = itsdangerous.Serializer(secret or 'velox', serializer=dill)
+    data = {'data': dill.dumps({'foo': 'bar'}), 'class': 'dill'}
+    with get_aware_filepath(stitch_filename(prefix, name), 'wb') as f:
+        serializer.dump(data, f)
+
+    assert load_object(name, prefix, secret=secret) == {'foo': 'bar'}
+    with pytest.raises(RuntimeError):
+        load_object(name, prefix, secret='WrongSecret')
+
+
+def test_tampered_binary_rejected(name, secret):
+    with TemporaryDirectory() as d:
+        filename = save_object({'foo': 'bar'}, name, d, secret=secret)
+        with open(filename, 'rb') as f:
+            blob = bytearray(f.read())
+
+        assert blob.startswith(b'VXLITE')
+
+        # flip a byte of the payload, and then truncate the trailer
+        blob[-50] ^= 0xFF
+        for tampered in (blob, blob[:-10]):
+            with open(filename, 'wb') as f:
+                f.write(tampered)
+            with pytest.raises(RuntimeError):
+                load_object(name, d, secret=secret)
+
+        # truncated anywhere, including within the header
+        for size in (8, 10, 12, 40, len(blob) - 1):
+            with open(filename, 'wb') as f:
+                f.write(bytes(blob[:size]))
+            with pytest.raises(RuntimeError, match='Malformed'):
+                load_object(name, d, secret=secret)
+
+
+class _FailingSave(object):
+
+    def _save(self, fobj):
+        fobj.write(b'partial')
+        raise ValueError('serialization failed')
+
+
+def test_failed_save_leaves_nothing(name, prefix):
+    with pytest.raises(ValueError):
+        save_object(_FailingSave(), name, prefix)
+
+    from velox.filesystem import find_matching_files
+    assert not find_matching_files(prefix, name)
+    if not prefix.startswith('s3://'):
+        assert os.listdir(prefix) == []
+
+
+def test_streaming_multipart_save(name):
+    from velox.filesystem import configure, S3_MIN_PART_SIZE
+    payload = os.urandom(2 * S3_MIN_PART_SIZE + 1234)
+    configure(multipart_part_size=S3_MIN_PART_SIZE)
+    try:
+        with mock_s3():
+            conn = boto3.resource('s3', region_name='us-east-1')
+            conn.create_bucket(Bucket=TEST_BUCKET)
+            prefix = 's3://{}/path'.format(TEST_BUCKET)
+
+            save_object(velox_test_utils.FooBar(payload), name, prefix)
+            assert load_object(name, prefix).foo == payload
+    finally:
+        configure(multipart_part_size=8 * 1024 ** 2)
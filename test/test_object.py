@@ -245,9 +245,12 @@ def test_local_cache_load():
             filename = os.path.basename(p)
 
             # if the load function is trying to load from the cache, this
-            # causes an unpickling error
-            with open(os.path.join(cache_dir, filename), 'w+') as fp:
-                fp.write('0000000000')
+            # causes an unpickling error (the cache would catch a corrupt copy
+            # of a different size)
+            cached = os.path.join(cache_dir, filename)
+            size = os.path.getsize(cached)
+            with open(cached, 'w+') as fp:
+                fp.write('0' * size)
 
             with pytest.raises(Exception):
                 _ = Model.load(prefix=prefix_dir, local_cache_dir=cache_dir)
@@ -314,3 +317,484 @@ def test_raises_on_empty_file(tmpdir):
         _ = Model.load(prefix=prefix)
 
     RESET()
+
+
+def test_manifest_resolution():
+    from velox.filesystem import configure, read_manifest
+
+    Model = create_class('foobar')
+    configure(use_manifest=True)
+    try:
+        with TemporaryDirectory() as d:
+            Model({'foo': 'bar'}).save(prefix=d)
+            p = Model({'foo': 'baz'}).save(prefix=d)
+
+            assert os.path.basename(p) in read_manifest(d)
+            assert Model.load(prefix=d).obj()['foo'] == 'baz'
+    finally:
+        configure(use_manifest=False)
+
+    RESET()
+
+
+def test_manifest_resolution_after_removal_from_s3():
+    import boto3
+    from moto import mock_s3
+    from velox.filesystem import configure, parse_s3
+
+    Model = create_class('foobar')
+    configure(use_manifest=True)
+    try:
+        with mock_s3():
+            conn = boto3.resource('s3', region_name='us-east-1')
+            conn.create_bucket(Bucket='ci-velox-bucket')
+            prefix = 's3://ci-velox-bucket/models'
+
+            Model({'foo': 'bar'}).save(prefix=prefix)
+            p = Model({'foo': 'baz'}).save(prefix=prefix)
+            conn.Object(*parse_s3(p)).delete()
+
+            assert Model.load(prefix=prefix).obj()['foo'] == 'bar'
+    finally:
+        configure(use_manifest=False)
+
+    RESET()
+
+
+def test_streaming_load_from_s3():
+    import boto3
+    from moto import mock_s3
+
+    Model = create_class('foobar')
+    with mock_s3():
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.create_bucket(Bucket='ci-velox-bucket')
+        prefix = 's3://ci-velox-bucket/models'
+
+        Model({'foo': 'bar'}).save(prefix=prefix)
+        assert Model.load(prefix=prefix, stream=True).obj() == {'foo': 'bar'}
+
+        VeloxModel({1: 2}).save(prefix=prefix)
+        o = load_velox_object('veloxmodel', prefix=prefix, stream=True)
+        assert o._o[1] == 2
+
+    RESET()
+
+
+def test_streaming_save_to_s3():
+    import boto3
+    from moto import mock_s3
+
+    Model = create_class('foobar')
+    with mock_s3():
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.create_bucket(Bucket='ci-velox-bucket')
+        prefix = 's3://ci-velox-bucket/models'
+
+        Model({'foo': 'bar'}).save(prefix=prefix, stream=True)
+        assert Model.load(prefix=prefix).obj() == {'foo': 'bar'}
+
+    RESET()
+
+
+def test_load_velox_object_fetches_once():
+    import boto3
+    from moto import mock_s3
+    from velox.filesystem import get_s3_client
+
+    calls = []
+
+    def count(event_name, **kwargs):
+        calls.append(event_name.split('.')[-1])
+
+    with mock_s3():
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.create_bucket(Bucket='ci-velox-bucket')
+        prefix = 's3://ci-velox-bucket/models'
+        VeloxModel({1: 2}).save(prefix=prefix)
+
+        events = get_s3_client().meta.events
+        events.register('before-call.s3', count)
+        try:
+            o = load_velox_object('veloxmodel', prefix=prefix)
+        finally:
+            events.unregister('before-call.s3', count)
+
+    assert o._o[1] == 2
+    # one listing, one tail read for the type hint, one download
+    assert calls == ['ListObjectsV2', 'GetObject', 'GetObject']
+
+
+def test_load_velox_object_from_local_cache():
+    with TemporaryDirectory() as prefix_dir:
+        with TemporaryDirectory() as cache_dir:
+            p = VeloxModel({1: 2}).save(prefix=prefix_dir)
+            for _ in range(2):
+                o = load_velox_object('veloxmodel', prefix=prefix_dir,
+                                      local_cache_dir=cache_dir)
+                assert o._o[1] == 2
+            assert [f for f in os.listdir(cache_dir)
+                    if not f.startswith('.')] == [os.path.basename(p)]
+
+
+def test_footer_metadata():
+    import hashlib
+    from velox.filesystem import read_metadata
+
+    with TemporaryDirectory() as d:
+        path = VeloxModel({1: 2}).save(prefix=d)
+        meta = read_metadata(path)
+
+        assert VeloxModel.load(prefix=d)._o == {1: 2}
+        assert meta['class'] == 'test_object.VeloxModel'
+        assert meta['registered_name'] == 'veloxmodel'
+        assert meta['version'] == '0.1.0'
+        assert meta['codec'] is None
+        with open(path, 'rb') as f:
+            blob = f.read()
+        assert meta['payload_length'] < len(blob)
+        assert meta['sha256'] == hashlib.sha256(
+            blob[:meta['payload_length']]).hexdigest()
+        assert 'created' in meta
+
+        # truncated files are detected rather than loaded
+        with open(path, 'wb') as f:
+            f.write(blob[:10] + blob[meta['payload_length']:])
+        with pytest.raises(IOError):
+            VeloxModel.load(prefix=d)
+
+
+def test_footer_metadata_with_one_ranged_read():
+    import boto3
+    from moto import mock_s3
+    from velox.filesystem import get_s3_client, read_metadata
+
+    calls = []
+
+    def count(event_name, **kwargs):
+        calls.append(event_name.split('.')[-1])
+
+    with mock_s3():
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.create_bucket(Bucket='ci-velox-bucket')
+        path = VeloxModel({1: 2}).save(prefix='s3://ci-velox-bucket/models')
+
+        events = get_s3_client().meta.events
+        events.register('before-call.s3', count)
+        try:
+            meta = read_metadata(path)
+        finally:
+            events.unregister('before-call.s3', count)
+
+    assert meta['registered_name'] == 'veloxmodel'
+    assert calls == ['GetObject']
+
+
+def test_footer_hash_with_filename_hook():
+    import hashlib
+    from velox.filesystem import read_metadata
+
+    @register_object(registered_name='byname')
+    class ByName(VeloxObject):
+
+        def _save(self, fileobject):
+            with open(fileobject.name, 'wb') as f:
+                f.write(b'written by name')
+
+        @classmethod
+        def _load(cls, fileobject):
+            assert fileobject.read() == b'written by name'
+            return cls()
+
+    with TemporaryDirectory() as d:
+        path = ByName().save(prefix=d)
+        assert read_metadata(path)['sha256'] == \
+            hashlib.sha256(b'written by name').hexdigest()
+        ByName.load(prefix=d)
+
+    RESET()
+
+
+def test_load_hook_reopening_by_name():
+
+    @register_object(registered_name='byname')
+    class ByName(VeloxObject):
+
+        def __init__(self, content=None):
+            super(ByName, self).__init__()
+            self.content = content
+
+        def _save(self, fileobject):
+            fileobject.write(self.content)
+
+        @classmethod
+        def _load(cls, fileobject):
+            with open(fileobject.name, 'rb') as f:
+                return cls(f.read())
+
+    with TemporaryDirectory() as d:
+        ByName(b'read back by name').save(prefix=d)
+        assert ByName.load(prefix=d).content == b'read back by name'
+
+    RESET()
+
+
+def test_identical_resave_skipped_by_content_sha():
+    from velox.filesystem import read_metadata
+
+    with TemporaryDirectory() as d:
+        path = VeloxModel({1: 2}).save(prefix=d)
+        o = VeloxModel.load(prefix=d)
+        assert o.current_sha == read_metadata(path)['sha256']
+
+        # the same bytes under a new name are recognized without a download
+        time.sleep(1.1)
+        other = VeloxModel({1: 2}).save(prefix=d)
+        assert other != path
+        with pytest.raises(VeloxConstraintError):
+            VeloxModel.load(prefix=d, skip_sha=o.current_sha)
+
+        VeloxModel({1: 3}).save(prefix=d)
+        assert VeloxModel.load(prefix=d, skip_sha=o.current_sha)._o == {1: 3}
+
+
+@pytest.fixture
+def content_addressed():
+    from velox.filesystem import configure
+    configure(content_addressed=True)
+    yield
+    configure(content_addressed=False)
+
+
+def test_content_addressed_save_load(content_addressed):
+    from velox.filesystem import read_metadata, blob_path
+
+    with TemporaryDirectory() as d:
+        first = VeloxModel({1: 2}).save(prefix=d)
+        second = VeloxModel({1: 2}).save(prefix=d)
+        meta = read_metadata(second)
+
+        # identical payloads are stored once, behind small pointer records
+        assert meta['blob'] == read_metadata(first)['blob'] == meta['sha256']
+        assert os.listdir(os.path.join(d, '.velox_blobs')) == [meta['blob']]
+        assert os.path.getsize(second) < os.path.getsize(
+            blob_path(d, meta['blob']))
+
+        o = VeloxModel.load(prefix=d)
+        assert o._o == {1: 2}
+        assert o.current_sha == meta['sha256']
+        assert load_velox_object('veloxmodel', prefix=d)._o == {1: 2}
+
+        VeloxModel({1: 3}).save(prefix=d)
+        assert len(os.listdir(os.path.join(d, '.velox_blobs'))) == 2
+        assert VeloxModel.load(prefix=d)._o == {1: 3}
+
+
+def test_content_addressed_cache_shared_across_versions(content_addressed):
+    from velox.cache import LocalCache
+
+    with TemporaryDirectory() as d, TemporaryDirectory() as cache_dir:
+        cache = LocalCache(cache_dir)
+        VeloxModel({1: 2}).save(prefix=d)
+        assert VeloxModel.load(prefix=d, local_cache_dir=cache)._o == {1: 2}
+
+        VeloxModel({1: 2}).save(prefix=d)
+        assert VeloxModel.load(prefix=d, local_cache_dir=cache)._o == {1: 2}
+        # the new pointer is a miss, but the blob it points at is a hit
+        assert cache.stats()['hits'] == 1
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_content_addressed_s3(content_addressed, stream):
+    import boto3
+    from moto import mock_s3
+    from velox.filesystem import get_s3_client
+
+    calls = []
+
+    def count(event_name, **kwargs):
+        calls.append(event_name.split('.')[-1])
+
+    with mock_s3():
+        conn = boto3.resource('s3', region_name='us-east-1')
+        conn.create_bucket(Bucket='ci-velox-bucket')
+        prefix = 's3://ci-velox-bucket/models'
+        VeloxModel({1: 2}).save(prefix=prefix)
+
+        events = get_s3_client().meta.events
+        events.register('before-call.s3', count)
+        try:
+            VeloxModel({1: 2}).save(prefix=prefix)
+        finally:
+            events.unregister('before-call.s3', count)
+
+        # an identical save only checks for the blob and writes a pointer
+        assert calls == ['HeadObject', 'PutObject']
+        keys = [o.key for o in conn.Bucket('ci-velox-bucket').objects.all()]
+        assert len([k for k in keys if '/.velox_blobs/' in k]) == 1
+
+        assert VeloxModel.load(prefix=prefix, stream=stream)._o == {1: 2}
+
+
+def test_atomic_swap():
+
+    @register_object(registered_name='atomicpair', atomic_swap=True)
+    class Pair(VeloxObject):
+
+        def __init__(self, value=None):
+            super(Pair, self).__init__()
+            self.a = value
+            self.b = value
+
+        def _save(self, fileobject):
+            pickle.dump((self.a, self.b), fileobject)
+
+        @classmethod
+        def _load(cls, fileobject):
+            o = cls()
+            o.a, o.b = pickle.load(fileobject)
+            return o
+
+        def pair(self):
+            return self.a, self.b
+
+    with TemporaryDirectory() as d:
+        Pair(1).save(prefix=d)
+
+        o = Pair(0)
+        o.reload(prefix=d)
+        assert o.pair() == (1, 1)
+        first_sha = o.current_sha
+        assert first_sha is not None
+
+        # the swap replaces one reference, and the state it replaces is let go
+        assert not hasattr(o, 'a') and not hasattr(o, 'b')
+        assert o._job_pointer is None
+
+        Pair(2).save(prefix=d)
+        o.reload(prefix=d)
+        assert o.pair() == (2, 2)
+        assert o.current_sha != first_sha
+
+        # what is saved is the version being served
+        o.save(prefix=d)
+        assert Pair.load(prefix=d).pair() == (2, 2)
+
+    RESET()
+
+
+def test_atomic_swap_delegating_getattr():
+
+    @register_object(registered_name='atomicdelegate', atomic_swap=True)
+    class Delegate(VeloxObject):
+
+        def __init__(self, managed=None):
+            super(Delegate, self).__init__()
+            self._managed = managed
+
+        def _save(self, fileobject):
+            pickle.dump(self._managed, fileobject)
+
+        @classmethod
+        def _load(cls, fileobject):
+            return cls(pickle.load(fileobject))
+
+        def __getattr__(self, name):
+            return getattr(self._managed, name)
+
+    with TemporaryDirectory() as d:
+        Delegate({'foo': 1}).save(prefix=d)
+        o = Delegate({})
+        o.reload(prefix=d)
+        assert o.get('foo') == 1
+
+        Delegate({'foo': 2}).save(prefix=d)
+        o.reload(prefix=d)
+        assert o.get('foo') == 2
+        assert '_managed' not in o.__dict__
+
+        with pytest.raises(AttributeError):
+            o.notanattribute
+
+        # as while unpickling, before any state is set
+        with pytest.raises(AttributeError):
+            Delegate.__new__(Delegate).get
+
+    RESET()
+
+
+def test_atomic_swap_concurrent_readers():
+    import sys
+    import threading
+
+    @register_object(registered_name='atomicreaders', atomic_swap=True)
+    class Pair(VeloxObject):
+
+        def __init__(self, value=None):
+            super(Pair, self).__init__()
+            self.a = value
+            self.b = value
+
+        def _save(self, fileobject):
+            pickle.dump((self.a, self.b), fileobject)
+
+        @classmethod
+        def _load(cls, fileobject):
+            o = cls()
+            o.a, o.b = pickle.load(fileobject)
+            return o
+
+        def pair(self, pause=0):
+            a = self.a
+            time.sleep(pause)
+            return a, self.b
+
+    with TemporaryDirectory() as d:
+        Pair(0).save(prefix=d)
+        o = Pair.load(prefix=d)
+
+        done = threading.Event()
+        seen, errors = [], []
+
+        def read(pause):
+            try:
+                while not done.is_set():
+                    a, b = o.pair(pause)
+                    assert a == b
+                    seen.append(a)
+            except Exception as e:
+                errors.append(e)
+
+        # slow readers straddle swaps, fast ones race to make them
+        readers = [threading.Thread(target=read, args=(pause, ))
+                   for pause in [0.0005] * 4 + [0] * 4]
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        for reader in readers:
+            reader.start()
+        try:
+            for value in range(1, 11):
+                Pair(value).save(prefix=d)
+                if value % 2:
+                    o.reload(prefix=d)
+                else:
+                    # load in the background, and leave it to the readers
+                    # to race each other to swap the new version in
+                    o._VeloxObject__incr_underway = True
+                    o._VeloxObject__replacement = \
+                        o._VeloxObject__load_async(Pair.loadpath(d), None)
+                deadline = time.time() + 10
+                while o.pair() != (value, value) and time.time() < deadline:
+                    time.sleep(0.01)
+                assert o.pair() == (value, value)
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+            sys.setswitchinterval(switch_interval)
+
+        # every call was served by exactly one version
+        assert errors == []
+        assert seen and set(seen) <= set(range(11))
+
+    RESET()
@@ -0,0 +1,61 @@
+import pytest
+
+import gc
+import time
+from backports.tempfile import TemporaryDirectory
+
+from velox import scheduling
+
+from velox_test_utils import create_class, RESET
+
+import logging
+logging.basicConfig(level=logging.DEBUG)
+
+
+def test_objects_share_one_scheduler():
+    Model = create_class('foobar')
+
+    with TemporaryDirectory() as d:
+        Model({'foo': 'bar'}).save(prefix=d)
+
+        objects = [Model({}) for _ in range(20)]
+        for o in objects:
+            o.reload(prefix=d, scheduled=True, seconds=0.5)
+
+        # all of them are served by one job, polling their shared prefix
+        scheduler = scheduling.get_scheduler()
+        jobs = len(scheduler.get_jobs())
+        assert len(set(o._job_pointer.watcher for o in objects)) == 1
+
+        time.sleep(1.5)
+        for o in objects:
+            assert o.obj()['foo'] == 'bar'
+
+        for o in objects:
+            o.cancel_scheduled_reload()
+        assert len(scheduler.get_jobs()) == jobs - 1
+
+    RESET()
+
+
+def test_collected_object_cancels_its_job():
+    Model = create_class('foobar')
+
+    with TemporaryDirectory() as d:
+        o = Model({})
+        o.reload(prefix=d, scheduled=True, seconds=10)
+        watcher = o._job_pointer.watcher
+
+        del o
+        gc.collect()
+
+        assert watcher.subscriptions == []
+
+    RESET()
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        scheduling.configure(reload_workers=0)
+    with pytest.raises(ValueError):
+        scheduling.configure(foo=1)
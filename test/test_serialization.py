@@ -0,0 +1,189 @@
+import pytest
+
+import io
+import mmap
+import os
+import pickle
+from backports.tempfile import TemporaryDirectory
+
+import dill
+import numpy as np
+
+from velox.filesystem import get_aware_filepath
+from velox.lite import save_object, load_object
+from velox.serialization import dump, load, OOB_ALIGNMENT
+from velox.wrapper import SimplePickle
+
+import boto3
+from moto import mock_s3
+
+TEST_BUCKET = 'ci-velox-bucket'
+
+needs_protocol_5 = pytest.mark.skipif(pickle.HIGHEST_PROTOCOL < 5,
+                                      reason='requires pickle protocol 5')
+
+
+def _arrays():
+    return {
+        'weights': np.random.normal(0, 1, (256, 64)),
+        'fortran': np.asfortranarray(np.random.normal(0, 1, (64, 32))),
+        'strided': np.arange(10000)[::3],
+        'small': np.arange(4),
+    }
+
+
+def _assert_equal(a, b):
+    assert sorted(a) == sorted(b)
+    for k in a:
+        np.testing.assert_array_equal(a[k], b[k])
+
+
+def _base(arr):
+    while isinstance(arr, np.ndarray) and arr.base is not None:
+        arr = arr.base
+    if isinstance(arr, memoryview):
+        return arr.obj
+    return arr
+
+
+def test_roundtrip_in_memory():
+    obj = _arrays()
+    buf = io.BytesIO()
+    dump(obj, buf)
+    buf.seek(0)
+    _assert_equal(load(buf), obj)
+
+
+@needs_protocol_5
+def test_aligned_views_over_read_buffer():
+    buf = io.BytesIO()
+    dump(_arrays(), buf)
+    buf.seek(0)
+    loaded = load(buf)
+
+    for k in ('weights', 'fortran'):
+        assert not loaded[k].flags.owndata
+        assert loaded[k].flags.writeable
+        assert loaded[k].ctypes.data % OOB_ALIGNMENT == 0
+
+
+@needs_protocol_5
+def test_mmapped_views_over_local_file():
+    obj = _arrays()
+    with TemporaryDirectory() as d:
+        path = os.path.join(d, 'arrays')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 17)  # offset the stream within the file
+            dump(obj, f)
+
+        with open(path, 'rb') as f:
+            f.seek(17)
+            loaded = load(f)
+        _assert_equal(loaded, obj)
+        assert isinstance(_base(loaded['weights']), mmap.mmap)
+        # copy-on-write, so the file is left untouched
+        loaded['weights'][:] = 0
+
+        with open(path, 'rb') as f:
+            f.seek(17)
+            readonly = load(f, mmap_mode='r')
+        _assert_equal(readonly, obj)
+        assert not readonly['weights'].flags.writeable
+
+
+def test_plain_dill_readable():
+    buf = io.BytesIO(dill.dumps({'foo': 'bar'}))
+    assert load(buf) == {'foo': 'bar'}
+
+
+def test_in_band():
+    buf = io.BytesIO()
+    dump({'foo': 'bar'}, buf, out_of_band=False)
+    assert buf.getvalue() == dill.dumps({'foo': 'bar'})
+
+
+@pytest.mark.parametrize('location', ['local', 's3'])
+def test_lite_out_of_band(location):
+    obj = _arrays()
+    with TemporaryDirectory() as d, mock_s3():
+        prefix = d
+        if location == 's3':
+            conn = boto3.resource('s3', region_name='us-east-1')
+            conn.create_bucket(Bucket=TEST_BUCKET)
+            prefix = 's3://{}/arrays'.format(TEST_BUCKET)
+        save_object(obj, 'arrays', prefix, out_of_band=True)
+        _assert_equal(load_object('arrays', prefix), obj)
+
+
+def test_simple_pickle_out_of_band():
+    obj = _arrays()
+    with TemporaryDirectory() as d:
+        SimplePickle(obj, out_of_band=True).save(prefix=d)
+        loaded = SimplePickle.load(prefix=d)
+        _assert_equal(loaded._managed_object, obj)
+
+        path = loaded.loadpath(prefix=d)
+        with get_aware_filepath(path, 'rb') as f:
+            assert f.read(8) == b'VXOOB001'
+
+        # plain SimplePickle saves are still dill dumps
+        SimplePickle({'foo': 'bar'}).save(prefix=d)
+        assert SimplePickle.load(prefix=d)._managed_object == {'foo': 'bar'}
+
+
+def _assert_shared(loaded):
+    assert not loaded['weights'].flags.writeable
+    assert isinstance(_base(loaded['weights']), mmap.mmap)
+
+
+def test_lite_mmap_load():
+    obj = _arrays()
+    with TemporaryDirectory() as d:
+        save_object(obj, 'arrays', d, out_of_band=True)
+
+        loaded = load_object('arrays', d, mmap=True)
+        _assert_equal(loaded, obj)
+        if pickle.HIGHEST_PROTOCOL >= 5:
+            _assert_shared(loaded)
+
+        # without mmap, arrays are read into private, writable buffers
+        private = load_object('arrays', d)['weights']
+        assert private.flags.writeable
+        assert not isinstance(_base(private), mmap.mmap)
+
+
+@mock_s3
+def test_lite_mmap_load_from_cache():
+    conn = boto3.resource('s3', region_name='us-east-1')
+    conn.create_bucket(Bucket=TEST_BUCKET)
+    prefix = 's3://{}/arrays'.format(TEST_BUCKET)
+    obj = _arrays()
+    save_object(obj, 'arrays', prefix, out_of_band=True)
+
+    with pytest.raises(ValueError):
+        load_object('arrays', prefix, mmap=True)
+
+    with TemporaryDirectory() as cache_dir:
+        loaded = load_object('arrays', prefix, mmap=True,
+                             local_cache_dir=cache_dir)
+        _assert_equal(loaded, obj)
+        if pickle.HIGHEST_PROTOCOL >= 5:
+            _assert_shared(loaded)
+
+
+def test_velox_object_mmap_load():
+    from velox.obj import load_velox_object
+
+    obj = _arrays()
+    with TemporaryDirectory() as d:
+        SimplePickle(obj, out_of_band=True).save(prefix=d)
+        for loaded in (SimplePickle.load(prefix=d, mmap=True),
+                       load_velox_object('simplepickle', prefix=d,
+                                         mmap=True)):
+            _assert_equal(loaded._managed_object, obj)
+            if pickle.HIGHEST_PROTOCOL >= 5:
+                _assert_shared(loaded._managed_object)
+
+        private = SimplePickle.load(prefix=d)._managed_object['weights']
+        assert private.flags.writeable
+        assert not isinstance(_base(private), mmap.mmap)
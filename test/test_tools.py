@@ -1,6 +1,7 @@
 import pytest
 import pickle
 import numpy as np
+import threading
 
 from velox import VeloxObject, register_object
 from velox.tools import (fullname, import_from_qualified_name,
@@ -35,3 +36,107 @@ def test_obtain_padding_bytes():
     assert len(b) == VELOX_NEW_FILE_EXTRAS_LENGTH
     assert VELOX_NEW_FILE_SIGNATURE in b
     assert obtain_qualified_name(b) == 'numpy.ndarray'
+
+
+def test_structured_footer_roundtrip():
+    from velox.tools import build_footer, footer_length, parse_footer
+
+    meta = {'class': 'foo.Bar', 'codec': None, 'payload_length': 3}
+    footer = build_footer(meta)
+    blob = b'abc' + footer
+
+    assert footer_length(blob) == len(footer)
+    assert parse_footer(blob) == meta
+
+    # a partial tail still tells us how much we need to read
+    assert footer_length(blob[-20:]) == len(footer)
+    with pytest.raises(ValueError):
+        parse_footer(blob[-20:])
+
+
+def test_legacy_footer_parsed():
+    from velox.tools import footer_length, parse_footer
+
+    x = np.random.normal(0, 1, (10, ))
+    blob = b'payload' + obtain_padding_bytes(x)
+
+    assert footer_length(blob) == VELOX_NEW_FILE_EXTRAS_LENGTH
+    assert parse_footer(blob) == {'class': 'numpy.ndarray'}
+    assert parse_footer(b'payload') is None
+
+
+def test_threaded_runs_on_bounded_pool():
+    import threading
+    import time
+    from velox.tools import threaded, configure
+
+    configure(threaded_workers=2, threaded_queue_size=1)
+    try:
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        @threaded
+        def fn(x):
+            with lock:
+                running.append(x)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(x)
+            return threading.current_thread().name
+
+        names = [f.result() for f in [fn(i) for i in range(8)]]
+        assert max(peak) == 2
+        assert all(name.startswith('velox-threaded') for name in names)
+
+        with pytest.raises(ValueError):
+            configure(threaded_workers=0)
+    finally:
+        configure(threaded_workers=4, threaded_queue_size=64)
+
+
+def _run_queued_calls_and_exit(setup=()):
+    import os
+    import subprocess
+    import sys
+
+    script = '\n'.join(list(setup) + [
+        'import sys',
+        'import time',
+        'from velox.tools import threaded, configure',
+        'configure(threaded_workers=1)',
+        '@threaded',
+        'def fn(x):',
+        '    time.sleep(0.5)',
+        '    sys.stdout.write("{}\\n".format(x))',
+        '    sys.stdout.flush()',
+        'futures = [fn(i) for i in range(4)]',
+        'time.sleep(0.1)',
+    ])
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+        [p for p in [env.get('PYTHONPATH')] if p])
+    return subprocess.check_output([sys.executable, '-c', script], env=env)
+
+
+@pytest.mark.skipif(not hasattr(threading, '_register_atexit'),
+                    reason='threading exit hooks unavailable')
+def test_threaded_abandons_queued_calls_at_exit():
+    output = _run_queued_calls_and_exit()
+
+    # the running call is finished, the queued ones never start
+    assert output.split() == [b'0']
+
+
+def test_threaded_exit_without_threading_hooks():
+    output = _run_queued_calls_and_exit(setup=[
+        'import threading',
+        'import concurrent.futures.thread',
+        'if hasattr(threading, "_register_atexit"):',
+        '    del threading._register_atexit',
+    ])
+
+    # shutting down still exits cleanly, after running the queued calls
+    assert output.split() == [b'0', b'1', b'2', b'3']
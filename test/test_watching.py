@@ -0,0 +1,212 @@
+import pytest
+
+import os
+import time
+from backports.tempfile import TemporaryDirectory
+
+from velox import filesystem, watching
+
+from velox_test_utils import create_class, RESET
+
+import logging
+logging.basicConfig(level=logging.DEBUG)
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def test_routes_new_files_to_matching_subscribers():
+    with TemporaryDirectory() as d:
+        seen = {'a': [], 'b': []}
+        watcher = watching.PrefixWatcher(d, seconds=60)
+        for name in seen:
+            watcher.subscribe(
+                match=lambda filename, name=name: filename.startswith(name),
+                callback=seen[name].append
+            )
+
+        with open(os.path.join(d, 'a1'), 'w') as fp:
+            fp.write('x')
+        watcher.poll()
+        assert seen == {'a': [['a1']], 'b': []}
+
+        # nothing changed, nobody is told anything
+        watcher.poll()
+        assert seen == {'a': [['a1']], 'b': []}
+
+        with open(os.path.join(d, 'b1'), 'w') as fp:
+            fp.write('x')
+        with open(os.path.join(d, 'a2'), 'w') as fp:
+            fp.write('x')
+        watcher.poll()
+        assert seen == {'a': [['a1'], ['a2', 'a1']], 'b': [['b1']]}
+
+        for subscription in watcher.subscriptions:
+            subscription.cancel()
+
+
+def test_one_listing_per_interval(monkeypatch):
+    listings = []
+    list_prefix = filesystem._list_prefix
+
+    def counting(prefix):
+        listings.append(prefix)
+        return list_prefix(prefix)
+
+    monkeypatch.setattr(filesystem, '_list_prefix', counting)
+
+    RESET()
+    ModelA = create_class('foo')
+    ModelB = create_class('bar', version='1.0.0', constraints='<2.0.0')
+    ModelC = create_class('bar', version='2.0.0')
+
+    with TemporaryDirectory() as d:
+        ModelA({'foo': 'a'}).save(prefix=d)
+        ModelC({'foo': 'c'}).save(prefix=d)
+
+        objects = [ModelA() for _ in range(10)] + \
+            [ModelB() for _ in range(10)]
+        for o in objects:
+            o.reload(prefix=d, scheduled=True, seconds=0.5)
+
+        assert _wait_for(lambda: all(o.current_sha is not None
+                                     for o in objects[:10]))
+        # twenty objects, but only as many listings as there were intervals
+        assert 1 <= len(listings) <= 3
+        for o in objects[:10]:
+            assert o.obj() == {'foo': 'a'}
+        # the only `bar` there is doesn't satisfy the version constraints
+        for o in objects[10:]:
+            assert o.current_sha is None
+
+        ModelB({'foo': 'b'}).save(prefix=d)
+        assert _wait_for(lambda: all(o.current_sha is not None
+                                     for o in objects[10:]))
+        for o in objects[10:]:
+            assert o.obj() == {'foo': 'b'}
+
+        for o in objects:
+            o.cancel_scheduled_reload()
+        assert watching._WATCHERS == {}
+
+    RESET()
+
+
+@pytest.mark.skipif(not watching.notifications_available('.'),
+                    reason='filesystem notifications unavailable')
+def test_notified_of_files_renamed_into_place():
+    import threading
+
+    with TemporaryDirectory() as d:
+        with open(os.path.join(d, 'a1'), 'w') as fp:
+            fp.write('x')
+
+        seen = []
+        event = threading.Event()
+
+        def callback(filenames):
+            seen.append(filenames)
+            event.set()
+
+        subscription = watching.watch(d, match=lambda f: f.startswith('a'),
+                                      callback=callback, notify=True)
+        assert isinstance(subscription.watcher,
+                          watching.NotifyingPrefixWatcher)
+
+        # what is already there is handed over when subscribing
+        assert event.wait(5)
+        assert seen == [['a1']]
+        event.clear()
+
+        temp = os.path.join(d, '.a2.tmp')
+        with open(temp, 'w') as fp:
+            fp.write('x')
+        os.rename(temp, os.path.join(d, 'a2'))
+        assert event.wait(5)
+        assert seen[-1] == ['a2', 'a1']
+
+        subscription.cancel()
+        assert watching._WATCHERS == {}
+
+
+def test_notify_falls_back_to_polling_on_s3():
+    watcher = watching.get_watcher('s3://bucket/prefix', notify=True)
+    assert type(watcher) is watching.PrefixWatcher
+    assert watcher.interval_trigger_args == \
+        watching.NOTIFY_FALLBACK_INTERVAL
+
+
+def test_notify_reload():
+    RESET()
+    Model = create_class('foobar')
+
+    with TemporaryDirectory() as d:
+        o = Model()
+        o.reload(prefix=d, scheduled=True, notify=True)
+
+        Model({'foo': 'bar'}).save(prefix=d)
+        assert _wait_for(lambda: o.current_sha is not None)
+        assert o.obj() == {'foo': 'bar'}
+
+        o.cancel_scheduled_reload()
+
+    RESET()
+
+
+def test_failed_reload_is_retried():
+    import dill
+    from velox import VeloxObject, register_object
+
+    RESET()
+    failures = []
+
+    @register_object(registered_name='flaky')
+    class Flaky(VeloxObject):
+
+        def __init__(self, o=None):
+            super(Flaky, self).__init__()
+            self._o = o
+
+        def _save(self, fileobject):
+            dill.dump(self._o, fileobject)
+
+        @classmethod
+        def _load(cls, fileobject):
+            if not failures:
+                failures.append(1)
+                raise IOError('transient network error')
+            return cls(dill.load(fileobject))
+
+        def obj(self):
+            return self._o
+
+    with TemporaryDirectory() as d:
+        Flaky('v1').save(prefix=d)
+
+        o = Flaky()
+        o.reload(prefix=d, scheduled=True, seconds=0.2)
+
+        # the first load fails, and the object is left serving what it had
+        assert _wait_for(lambda: failures)
+        assert o.obj() in (None, 'v1')
+
+        assert _wait_for(lambda: o.obj() == 'v1')
+        first_sha = o.current_sha
+
+        # removing the newest version rolls back to the one before it
+        time.sleep(0.01)
+        newest = Flaky('v2').save(prefix=d)
+        assert _wait_for(lambda: o.obj() == 'v2')
+        os.remove(newest)
+        assert _wait_for(lambda: o.obj() == 'v1')
+        assert o.current_sha == first_sha
+
+        o.cancel_scheduled_reload()
+
+    RESET()
@@ -311,11 +311,19 @@ __version__ = '0.5.1'
 from .obj import (VeloxObject, register_object, load_velox_object,
                   register_object)
 
+from . import cache
+from . import chunking
+from . import compression
 from . import filesystem
 from . import exceptions
 from . import tools
 from . import obj
 from . import wrapper
 from . import lite
+from . import scheduling
+from . import serialization
+from . import watching
 
-__all__ = ['filesystem', 'exceptions', 'tools', 'obj', 'wrapper', 'lite']
+__all__ = ['cache', 'chunking', 'compression', 'filesystem', 'exceptions',
+           'tools', 'obj', 'wrapper', 'lite', 'scheduling', 'serialization',
+           'watching']
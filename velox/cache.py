@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+## `velox.cache`
+
+The `velox.cache` submodule provides a size-bounded, least-recently-used cache
+of blobs on the local filesystem, which both the `velox.obj` and `velox.lite`
+APIs can load through (see the `local_cache_dir` keyword arguments of
+`velox.obj.VeloxObject.load`, `velox.obj.load_velox_object`, and
+`velox.lite.load_object`).
+
+Entries are written atomically (to a temporary file that is renamed into
+place), so readers never see a partially written blob. Fetches are coordinated
+across processes sharing a cache directory with file locks, so that when many
+worker processes on a host load the same blob, exactly one of them downloads it
+while the others wait and then read the cached copy. Entries are also locked
+while they are being read (see `velox.cache.LocalCache.fetched`), and are not
+evicted until they are released.
+
+Each fetched entry records a validator of the version it was copied from (its
+ETag on S3, or its size and modification time on a local filesystem, see
+`velox.filesystem.read_validator`). Fetching an entry again only costs a HEAD
+request or a stat to revalidate it, and the bytes are fetched again only if
+the source has changed since.
+
+<!--begin_code-->
+
+    #!python
+    from velox.cache import get_cache
+    from velox.lite import load_object
+
+    cache = get_cache('/var/cache/velox', max_bytes=10 * 1024 ** 3)
+
+    clf = load_object('CustomerModel', prefix='s3://myprodbucket/ml/models',
+                      local_cache_dir=cache)
+
+    print(cache.stats())
+<!--end_code-->
+"""
+
+from contextlib import contextmanager
+import errno
+import json
+import logging
+import os
+from tempfile import mkstemp
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from . import filesystem
+
+logger = logging.getLogger(__name__)
+
+_TEMP_PREFIX = '.velox-tmp-'
+_LOCK_SUFFIX = '.lock'
+_VALIDATOR_SUFFIX = '.validator'
+
+_FALLBACK_LOCK = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path, shared=False, blocking=True):
+    """
+    Holds a lock on the file at `path` (creating it if need be), exclusive
+    unless `shared`, yielding whether it was acquired. With `blocking`, it
+    waits until the lock can be acquired, so it always is. On platforms
+    without `fcntl`, exclusive locks only serialize threads within the
+    current process, and shared ones do nothing.
+
+    Whoever holds the exclusive lock on a file may remove it, so a lock that
+    was acquired on a file that has since been removed is acquired again on
+    the file now at `path`.
+    """
+    if fcntl is None:
+        if shared:
+            yield True
+        elif _FALLBACK_LOCK.acquire(blocking):
+            try:
+                yield True
+            finally:
+                _FALLBACK_LOCK.release()
+        else:
+            yield False
+        return
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    while True:
+        with open(path, 'a') as fp:
+            try:
+                fcntl.flock(fp.fileno(), operation)
+            except (IOError, OSError) as err:
+                if blocking or err.errno not in {errno.EACCES, errno.EAGAIN}:
+                    raise
+                break
+            try:
+                current = os.fstat(fp.fileno()).st_ino == os.stat(path).st_ino
+            except OSError:
+                current = False
+            if not current:
+                continue
+            try:
+                yield True
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            return
+    yield False
+
+
+class LocalCache(object):
+    """
+    A cache of blobs in a local `directory`, holding at most `max_bytes`
+    bytes (or an unbounded amount, if `max_bytes` is `None`). When the budget
+    is exceeded, the entries that were accessed least recently are evicted.
+
+    Args:
+    -----
+
+    * `directory (str)`: the directory to keep cached blobs in. It is created
+        if it does not exist.
+
+    * `max_bytes (None | int)`: the byte budget of the cache.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        filesystem.safe_mkdir(self.directory)
+
+    def __repr__(self):
+        return '{}(directory={!r}, max_bytes={!r})'.format(
+            type(self).__name__, self.directory, self.max_bytes)
+
+    def path(self, key):
+        """Returns the path that the entry for `key` is (or would be) at."""
+        if not key or os.path.basename(key) != key or key.startswith('.'):
+            raise ValueError('invalid cache key: {!r}'.format(key))
+        return os.path.join(self.directory, key)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key, expected_size=None):
+        """
+        Looks up the entry for `key`, marking it as most recently used.
+
+        Args:
+        -----
+
+        * `key (str)`: the entry to look up.
+
+        * `expected_size (None | int)`: if passed, an entry of any other size
+            is considered invalid, and is evicted.
+
+        Returns:
+        --------
+
+        The path to the cached blob, or `None` on a miss.
+        """
+        path = self._lookup(key, expected_size)
+        self._count(hit=path is not None)
+        return path
+
+    def _lookup(self, key, expected_size=None, validator=None):
+        path = self.path(key)
+        if validator is not None:
+            if self._read_validator(key) != validator:
+                logger.debug('cache entry {} is missing or out of date'
+                             .format(key))
+                return None
+            expected_size = validator['size']
+        try:
+            size = os.path.getsize(path)
+            if expected_size is not None and size != expected_size:
+                logger.warning('evicting cache entry {} of size {} (expected '
+                               '{})'.format(key, size, expected_size))
+                self.remove(key)
+                return None
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            return None
+        logger.debug('cache hit for {}'.format(key))
+        return path
+
+    @contextmanager
+    def writer(self, key):
+        """
+        Context manager yielding a temporary path to write the entry for `key`
+        to. The entry is atomically moved into place on a clean exit (and
+        discarded otherwise), after which the cache is trimmed back to its
+        budget.
+        """
+        fd, temp_path = mkstemp(dir=self.directory, prefix=_TEMP_PREFIX)
+        os.close(fd)
+        try:
+            yield temp_path
+            getattr(os, 'replace', os.rename)(temp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.debug('cached {}'.format(key))
+        self.evict(keep=key)
+
+    def _lock_path(self, key):
+        return os.path.join(self.directory, '.' + key + _LOCK_SUFFIX)
+
+    def _validator_path(self, key):
+        return os.path.join(self.directory, '.' + key + _VALIDATOR_SUFFIX)
+
+    def _read_validator(self, key):
+        try:
+            with open(self._validator_path(key), 'r') as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_validator(self, key, validator):
+        fd, temp_path = mkstemp(dir=self.directory, prefix=_TEMP_PREFIX)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(validator, fp)
+        getattr(os, 'replace', os.rename)(temp_path,
+                                          self._validator_path(key))
+
+    def _remove_validator(self, key):
+        try:
+            os.remove(self._validator_path(key))
+        except OSError:
+            pass
+
+    def fetch(self, path, key=None, expected_size=None, revalidate=True):
+        """
+        Returns a local path holding the bytes of `path` (which can be on S3),
+        copying them into the cache on a miss. The validator of the version
+        copied is recorded alongside the entry.
+
+        Args:
+        -----
+
+        * `path (str)`: the blob to cache, either `/path/to/file.fmt`, or
+            `s3://myBucketName/this/is/a.key`
+
+        * `key (None | str)`: the entry to cache the blob under. Defaults to
+            the filename of `path`.
+
+        * `expected_size (None | int)`: see `velox.cache.LocalCache.get`.
+
+        * `revalidate (bool)`: Whether or not to check (with a HEAD request
+            on S3, or a stat on a local filesystem) that `path` is unchanged
+            since the cached copy was fetched, fetching it again otherwise.
+            Entries without a recorded validator are always fetched again.
+            Can be turned off for blobs that never change once written, such
+            as those in a content-addressed store.
+        """
+        if key is None:
+            key = os.path.basename(path)
+        validator = None
+        if revalidate:
+            validator = filesystem.read_validator(path)
+        cached = self._lookup(key, expected_size, validator)
+        if cached is None:
+            with _file_lock(self._lock_path(key)):
+                # someone else may have fetched it while we were waiting
+                cached = self._lookup(key, expected_size, validator)
+                if cached is None:
+                    self._count(hit=False)
+                    logger.info('cache miss for {} - fetching {}'
+                                .format(key, path))
+                    # the validator goes first and comes back last, so that
+                    # nobody matches a new validator against old bytes
+                    self._remove_validator(key)
+                    with self.writer(key) as temp_path:
+                        validator = filesystem.fetch_file(
+                            path, temp_path, validator=validator)
+                    self._write_validator(key, validator)
+                    return self.path(key)
+        self._count(hit=True)
+        return cached
+
+    @contextmanager
+    def hold(self, key, expected_size=None):
+        """
+        Context manager yielding the path to the entry for `key`, or `None`
+        on a miss, like `velox.cache.LocalCache.get` (but without counting
+        towards the statistics of the cache). Until it exits, the entry is
+        not evicted, by this or any other process sharing the cache
+        directory.
+        """
+        with _file_lock(self._lock_path(key), shared=True):
+            yield self._lookup(key, expected_size)
+
+    @contextmanager
+    def fetched(self, path, key=None, expected_size=None, revalidate=True):
+        """
+        Context manager yielding the path returned by
+        `velox.cache.LocalCache.fetch` (taking the same arguments). Until it
+        exits, the entry is not evicted, by this or any other process sharing
+        the cache directory, so the entry should be opened within it.
+        """
+        if key is None:
+            key = os.path.basename(path)
+        while True:
+            self.fetch(path, key=key, expected_size=expected_size,
+                       revalidate=revalidate)
+            with self.hold(key, expected_size) as cached:
+                if cached is not None:
+                    yield cached
+                    return
+            logger.debug('cache entry {} was evicted before it could be held '
+                         '- fetching it again'.format(key))
+
+    def remove(self, key):
+        """Evicts the entry for `key`, if there is one."""
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+        self._remove_validator(key)
+
+    def _entries(self):
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith('.'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, filename))
+        return entries
+
+    def evict(self, keep=None):
+        """
+        Evicts the least recently used entries (other than `keep`) until the
+        cache is within its byte budget.
+        """
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                if self._evict(key):
+                    logger.debug('evicted {} ({} bytes)'.format(key, size))
+                    total -= size
+
+    def _evict(self, key):
+        # entries that are being fetched or held are left alone
+        lock_path = self._lock_path(key)
+        with _file_lock(lock_path, blocking=False) as acquired:
+            if not acquired:
+                logger.debug('not evicting {}, which is in use'.format(key))
+                return False
+            self.remove(key)
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+        return True
+
+    def clear(self):
+        """Evicts every entry that is not in use."""
+        for _, _, key in self._entries():
+            self._evict(key)
+
+    def stats(self):
+        """
+        Returns a `dict` with the number of `hits` and `misses` since the
+        cache was created, as well as its current number of `entries` and
+        their total size in `bytes`.
+        """
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries)
+        }
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_cache(directory, max_bytes=None):
+    """
+    Returns the `velox.cache.LocalCache` shared by this process for
+    `directory`, so that statistics accumulate across loads.
+
+    Args:
+    -----
+
+    * `directory (str | velox.cache.LocalCache)`: the cache directory. If a
+        `velox.cache.LocalCache` is passed, it is returned as-is.
+
+    * `max_bytes (None | int)`: if passed, sets the byte budget of the cache.
+    """
+    if isinstance(directory, LocalCache):
+        return directory
+    with _CACHES_LOCK:
+        cache = _CACHES.get(os.path.abspath(directory))
+        if cache is None:
+            cache = LocalCache(directory)
+            _CACHES[cache.directory] = cache
+    if max_bytes is not None:
+        cache.max_bytes = max_bytes
+    return cache
+
+
+__all__ = ['LocalCache', 'get_cache']
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+## `velox.chunking`
+
+The `velox.chunking` submodule provides a chunked layout for the
+content-addressed store (see `velox.filesystem.store_blob`), so that successive
+versions of an object which share most of their bytes also share most of their
+storage and transfers. Payloads are split into chunks at content-defined
+boundaries, found with a gear hash so that an edit only moves the boundaries
+around it. Each chunk is stored once under its SHA256, and the pointer record
+of each version lists its chunks. Loads through a local cache (see
+`velox.cache`) then only fetch the chunks that the cache doesn't already hold.
+
+<!--begin_code-->
+
+    #!python
+    from velox.filesystem import configure
+
+    configure(chunked=True)
+
+    EmbeddingModel(embeddings).save(prefix='s3://myprodbucket/ml/models')
+<!--end_code-->
+
+Boundaries are found with NumPy if it is installed, and with a (much slower)
+pure Python scan otherwise. Both find the same boundaries.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+import logging
+import mmap
+import os
+import shutil
+import struct
+import uuid
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from . import filesystem
+from .tools import build_footer
+
+logger = logging.getLogger(__name__)
+
+# the directory (under the content-addressed store) holding chunks
+VELOX_CHUNK_DIRNAME = 'chunks'
+
+CHUNK_MIN_SIZE = 256 * 1024
+# a boundary is cut wherever the low bits of the hash are all zero, so chunks
+# run about 2 ** CHUNK_MASK_BITS bytes past the minimum on average
+CHUNK_MASK_BITS = 20
+CHUNK_MAX_SIZE = 8 * 1024 ** 2
+
+_SCAN_BLOCK_SIZE = 4 * 1024 ** 2
+
+# random (but fixed, as boundaries must agree across hosts) 32 bit values
+_GEAR = [struct.unpack('>I', sha256(struct.pack('>B', i)).digest()[:4])[0]
+         for i in range(256)]
+
+
+def _candidates_numpy(buf, mask_bits):
+    # The low 32 bits of the gear hash only depend on the last 32 bytes, as
+    # the contribution of every earlier byte has been shifted out of them, so
+    # we can compute them for a whole block at once, by doubling the window.
+    data = np.frombuffer(buf, dtype=np.uint8)
+    gear = np.array(_GEAR, dtype=np.uint32)
+    mask = np.uint32((1 << mask_bits) - 1)
+    found = []
+    for start in range(0, len(data), _SCAN_BLOCK_SIZE):
+        lo = max(start - 31, 0)
+        h = gear[data[lo:start + _SCAN_BLOCK_SIZE]]
+        shift = 1
+        while shift < min(32, len(h)):
+            h[shift:] += h[:-shift] << np.uint32(shift)
+            shift *= 2
+        found.extend((np.flatnonzero((h[start - lo:] & mask) == 0) +
+                      start + 1).tolist())
+    return found
+
+
+def _candidates_python(buf, mask_bits):
+    mask = (1 << mask_bits) - 1
+    found = []
+    h = 0
+    for start in range(0, len(buf), _SCAN_BLOCK_SIZE):
+        block = bytearray(buf[start:start + _SCAN_BLOCK_SIZE])
+        for i, b in enumerate(block):
+            h = ((h << 1) + _GEAR[b]) & mask
+            if not h:
+                found.append(start + i + 1)
+    return found
+
+
+def chunk_boundaries(buf, min_size=None, mask_bits=None, max_size=None):
+    """
+    Splits `buf` into content-defined chunks.
+
+    Args:
+    -----
+
+    * `buf (bytes | memoryview)`: the data to split.
+
+    * `min_size (None | int)`: the minimum size of a chunk (other than the
+        last one). Defaults to `velox.chunking.CHUNK_MIN_SIZE`.
+
+    * `mask_bits (None | int)`: the number of bits of the hash that must be
+        zero at a boundary, so that chunks run `2 ** mask_bits` bytes past
+        `min_size` on average. Defaults to `velox.chunking.CHUNK_MASK_BITS`.
+
+    * `max_size (None | int)`: the maximum size of a chunk. Defaults to
+        `velox.chunking.CHUNK_MAX_SIZE`.
+
+    Returns:
+    --------
+
+    A list of the (exclusive) end offsets of the chunks of `buf`.
+    """
+    min_size = CHUNK_MIN_SIZE if min_size is None else min_size
+    mask_bits = CHUNK_MASK_BITS if mask_bits is None else mask_bits
+    max_size = CHUNK_MAX_SIZE if max_size is None else max_size
+    if not 0 < mask_bits < 32:
+        raise ValueError('mask_bits must be between 1 and 31')
+
+    if np is not None:
+        candidates = _candidates_numpy(buf, mask_bits)
+    else:  # pragma: no cover
+        candidates = _candidates_python(buf, mask_bits)
+
+    ends = []
+    start, index = 0, 0
+    while start < len(buf):
+        limit = min(start + max_size, len(buf))
+        index = bisect_left(candidates, start + min_size, index)
+        if index < len(candidates) and candidates[index] <= limit:
+            end = candidates[index]
+        else:
+            end = limit
+        ends.append(end)
+        start = end
+    return ends
+
+
+def chunk_path(prefix, digest):
+    """
+    Returns the path of the chunk with SHA256 `digest` in the
+    content-addressed store at `prefix`.
+    """
+    return filesystem.blob_path(prefix, '{}/{}'.format(VELOX_CHUNK_DIRNAME,
+                                                       digest))
+
+
+def _store_chunk(prefix, digest, data, session=None):
+    """Stores a chunk unless it is already stored, returning whether it was."""
+    path = chunk_path(prefix, digest)
+    if not filesystem.is_s3_path(prefix):
+        if os.path.exists(path):
+            return False
+        directory = os.path.dirname(path)
+        filesystem.safe_mkdir(directory)
+        temp_fp = os.path.join(directory, '.{}.{}.tmp'.format(
+            digest, uuid.uuid4().hex))
+        try:
+            with open(temp_fp, 'wb') as fp:
+                fp.write(data)
+            getattr(os, 'replace', os.rename)(temp_fp, path)
+        except BaseException:
+            if os.path.exists(temp_fp):
+                os.remove(temp_fp)
+            raise
+        return True
+
+    from botocore.exceptions import ClientError
+    client = filesystem.get_s3_client(session)
+    bucket, key = filesystem.parse_s3(path)
+    try:
+        client.head_object(Bucket=bucket, Key=key)
+        return False
+    except ClientError as err:
+        if err.response.get('Error', {}).get('Code') not in \
+                {'404', 'NoSuchKey', 'NotFound'}:
+            raise
+    client.put_object(Bucket=bucket, Key=key, Body=bytes(data))
+    return True
+
+
+def store_chunks(filepath, prefix, length, session=None):
+    """
+    Splits the first `length` bytes of the local file at `filepath` into
+    content-defined chunks, and stores those that aren't stored already in the
+    content-addressed store at `prefix`, concurrently (see the
+    `transfer_workers` setting of `velox.filesystem.configure`).
+
+    Returns:
+    --------
+
+    A list of the `[digest, size]` of every chunk, in order.
+    """
+    if not length:
+        return []
+    with open(filepath, 'rb') as fp:
+        mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        view = memoryview(mapped)[:length]
+        try:
+            chunks, pieces, start = [], {}, 0
+            for end in chunk_boundaries(view):
+                digest = sha256(view[start:end]).hexdigest()
+                chunks.append([digest, end - start])
+                pieces.setdefault(digest, (start, end))
+                start = end
+
+            workers = min(filesystem._SETTINGS['transfer_workers'],
+                          len(pieces))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_store_chunk, prefix, digest,
+                                    view[start:end], session)
+                    for digest, (start, end) in pieces.items()
+                ]
+                stored = sum(future.result() for future in futures)
+        finally:
+            view.release()
+    finally:
+        mapped.close()
+
+    logger.debug('stored {} of {} distinct chunks ({} in total)'.format(
+        stored, len(pieces), len(chunks)))
+    return chunks
+
+
+def _copy_chunk(source, filepath, offset, size, session=None):
+    """Writes the chunk at `source` into place at `offset` in `filepath`."""
+    if filesystem.is_s3_path(source):
+        bucket, key = filesystem.parse_s3(source)
+        data = filesystem.get_s3_client(session).get_object(
+            Bucket=bucket, Key=key)['Body'].read()
+    else:
+        with open(source, 'rb') as fp:
+            data = fp.read()
+    if len(data) != size:
+        raise IOError('chunk {} holds {} bytes, but {} were expected'
+                      .format(source, len(data), size))
+    with open(filepath, 'r+b') as fp:
+        fp.seek(offset)
+        fp.write(data)
+
+
+def _layout(chunks):
+    offset, layout = 0, []
+    for digest, size in chunks:
+        layout.append((digest, offset, size))
+        offset += size
+    return layout, offset
+
+
+def fetch_chunks(path, metadata, filepath, session=None):
+    """
+    Assembles the payload of the chunked pointer record at `path` (with velox
+    `metadata`, see `velox.filesystem.read_metadata`) into the local file
+    `filepath`, fetching its chunks concurrently.
+    """
+    prefix = os.path.dirname(path)
+    layout, length = _layout(metadata['chunks'])
+    with open(filepath, 'wb') as fp:
+        fp.truncate(length)
+    logger.debug('assembling {} bytes from {} chunks'.format(length,
+                                                             len(layout)))
+    if not layout:
+        return
+    workers = min(filesystem._SETTINGS['transfer_workers'], len(layout))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_copy_chunk, chunk_path(prefix, digest),
+                            filepath, offset, size, session)
+            for digest, offset, size in layout
+        ]
+        for future in futures:
+            future.result()
+
+
+@contextmanager
+def fetch_cached(cache, path, metadata):
+    """
+    Context manager yielding the path of a copy of the object behind the
+    chunked pointer record at `path` (with velox `metadata`) in the
+    `velox.cache.LocalCache` `cache`. The copy is assembled from chunks held
+    in the cache, and only the chunks missing from it are fetched. Until it
+    exits, the copy is not evicted (see `velox.cache.LocalCache.hold`).
+    """
+    key = metadata['sha256']
+    if cache.get(key) is None:
+        _assemble_cached(cache, path, metadata)
+    while True:
+        # held, it may still have been evicted since it was assembled
+        with cache.hold(key) as cached:
+            if cached is not None:
+                yield cached
+                return
+        _assemble_cached(cache, path, metadata)
+
+
+def _assemble_cached(cache, path, metadata):
+    prefix = os.path.dirname(path)
+    chunks = dict((digest, size) for digest, size in metadata['chunks'])
+
+    def fetch(digest):
+        return cache.fetch(chunk_path(prefix, digest),
+                           key=_chunk_key(digest),
+                           expected_size=chunks[digest], revalidate=False)
+
+    workers = min(filesystem._SETTINGS['transfer_workers'],
+                  max(len(chunks), 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(fetch, list(chunks)))
+
+    footer = dict(metadata)
+    del footer['chunks']
+    with cache.writer(metadata['sha256']) as temp_path:
+        with open(temp_path, 'wb') as out:
+            for digest, size in metadata['chunks']:
+                with _held_chunk(cache, prefix, digest, size) as chunk:
+                    with open(chunk, 'rb') as fp:
+                        shutil.copyfileobj(fp, out)
+            out.write(build_footer(footer))
+
+
+def _chunk_key(digest):
+    return '{}.chunk'.format(digest)
+
+
+@contextmanager
+def _held_chunk(cache, prefix, digest, size):
+    with cache.hold(_chunk_key(digest), expected_size=size) as held:
+        if held is not None:
+            yield held
+            return
+    # evicted since it was fetched
+    with cache.fetched(chunk_path(prefix, digest), key=_chunk_key(digest),
+                       expected_size=size, revalidate=False) as held:
+        yield held
+
+
+__all__ = ['chunk_boundaries', 'store_chunks', 'fetch_chunks',
+           'fetch_cached']
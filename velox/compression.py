@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+## `velox.compression`
+
+The `velox.compression` submodule provides pluggable compression codecs for
+saved objects. The `zlib` codec is always available, `lzma` is available on
+Python 3, and `zstd` and `lz4` become available when the `zstandard` and `lz4`
+packages are installed.
+
+The codec an object was saved with is recorded alongside it, so that loads
+decompress transparently, in a streaming fashion. A codec (and a codec level)
+can be chosen for every save of a class through `velox.obj.register_object`,
+or for a single save through `velox.lite.save_object`.
+
+<!--begin_code-->
+
+    #!python
+    @register_object(registered_name='embeddings', codec='zlib', codec_level=6)
+    class Embeddings(VeloxObject):
+        ...
+
+    save_object(clf, 'CustomerModel', prefix='s3://myprodbucket/ml/models',
+                codec='lzma')
+<!--end_code-->
+
+Additional codecs can be made available with `velox.compression.register_codec`.
+Note that compressed objects can only be saved and loaded by `_save` and
+`_load` methods that write to and read from the file object they are passed,
+rather than from its name.
+"""
+
+import io
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+_CODECS = {}
+
+_READ_SIZE = 256 * 1024
+
+
+def register_codec(name, compressor, decompressor):
+    """
+    Makes a codec available under `name`.
+
+    Args:
+    -----
+
+    * `name (str)`: the name to record in saved files. It cannot contain a
+        `:`, or the velox padding character `%`.
+
+    * `compressor (callable)`: takes a compression level (or `None`, for the
+        codec default) and returns an object with `compress(data)` and
+        `flush()` methods, such as a `zlib.compressobj`.
+
+    * `decompressor (callable)`: takes no arguments and returns an object
+        with a `decompress(data)` method, such as a `zlib.decompressobj`.
+
+    Raises:
+    -------
+
+    * `ValueError` if `name` is invalid.
+    """
+    if not name or ':' in name or '%' in name:
+        raise ValueError('invalid codec name: {!r}'.format(name))
+    _CODECS[name] = (compressor, decompressor)
+
+
+def available_codecs():
+    """Returns the sorted names of all usable codecs."""
+    return sorted(_CODECS)
+
+
+def _get_codec(name):
+    try:
+        return _CODECS[name]
+    except KeyError:
+        raise ValueError('unknown or unavailable codec {!r} - available '
+                         'codecs are {}'.format(name, available_codecs()))
+
+
+def check_codec(name):
+    """
+    Raises a `ValueError` if `name` is not the name of a usable codec.
+    """
+    _get_codec(name)
+
+
+class CompressingWriter(io.RawIOBase):
+    """
+    Write-only file object compressing everything written to it with `codec`
+    into `fileobject`. Closing it flushes the compressor, but leaves
+    `fileobject` open.
+    """
+
+    def __init__(self, fileobject, codec, level=None):
+        compressor, _ = _get_codec(codec)
+        self._fileobject = fileobject
+        self._compressor = compressor(level)
+        self._position = 0
+        self.name = getattr(fileobject, 'name', None)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        self._position += len(data)
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._fileobject.write(compressed)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # only tolerate no-op seeks to the end of what has been written
+        if (offset == 0 and whence in {io.SEEK_CUR, io.SEEK_END}) or \
+                (whence == io.SEEK_SET and offset == self._position):
+            return self._position
+        raise io.UnsupportedOperation('compressed streams are not seekable')
+
+    def close(self):
+        if not self.closed:
+            remaining = self._compressor.flush()
+            if remaining:
+                self._fileobject.write(remaining)
+        super(CompressingWriter, self).close()
+
+
+class _DecompressingReader(io.RawIOBase):
+
+    def __init__(self, fileobject, codec):
+        _, decompressor = _get_codec(codec)
+        self._fileobject = fileobject
+        self._decompressor = decompressor()
+        self._pending = b''
+        self._offset = 0
+        self._eof = False
+
+    @property
+    def name(self):
+        # looked up lazily, as naming a bounded view may copy it to disk
+        return getattr(self._fileobject, 'name', None)
+
+    def readable(self):
+        return True
+
+    def _decompress(self):
+        # Codecs that can (zlib, lzma, lz4) hand back at most `_READ_SIZE`
+        # bytes at a time, and hold on to the input they have yet to inflate,
+        # so that highly compressible payloads never balloon in memory.
+        d = self._decompressor
+        tail = getattr(d, 'unconsumed_tail', None)
+        if tail:
+            return d.decompress(tail, _READ_SIZE)
+        if getattr(d, 'eof', False):
+            self._eof = True
+            return b''
+        if getattr(d, 'needs_input', True) is False:
+            return d.decompress(b'', _READ_SIZE)
+        chunk = self._fileobject.read(_READ_SIZE)
+        if not chunk:
+            self._eof = True
+            flush = getattr(d, 'flush', None)
+            return b'' if flush is None else flush()
+        if tail is not None or hasattr(d, 'needs_input'):
+            return d.decompress(chunk, _READ_SIZE)
+        return d.decompress(chunk)
+
+    def readinto(self, b):
+        while self._offset == len(self._pending) and not self._eof:
+            self._pending, self._offset = self._decompress(), 0
+        n = min(len(b), len(self._pending) - self._offset)
+        b[:n] = memoryview(self._pending)[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._fileobject.close()
+        super(_DecompressingReader, self).close()
+
+
+def decompressing_reader(fileobject, codec):
+    """
+    Returns a buffered, read-only file object yielding the decompressed
+    contents of `fileobject`, which was compressed with `codec`. Closing it
+    closes `fileobject`.
+    """
+    return io.BufferedReader(_DecompressingReader(fileobject, codec),
+                             buffer_size=_READ_SIZE)
+
+
+register_codec('zlib', lambda level: zlib.compressobj(
+    -1 if level is None else level), zlib.decompressobj)
+
+try:
+    import lzma
+    register_codec('lzma', lambda level: lzma.LZMACompressor(preset=level),
+                   lzma.LZMADecompressor)
+except ImportError:  # pragma: no cover
+    logger.debug('lzma codec unavailable')
+
+try:
+    import zstandard
+    register_codec(
+        'zstd',
+        lambda level: zstandard.ZstdCompressor(
+            level=3 if level is None else level).compressobj(),
+        lambda: zstandard.ZstdDecompressor().decompressobj()
+    )
+except ImportError:
+    logger.debug('zstd codec unavailable - install zstandard to enable it')
+
+
+class _LZ4Compressor(object):
+
+    def __init__(self, level):
+        import lz4.frame
+        self._compressor = lz4.frame.LZ4FrameCompressor(
+            compression_level=0 if level is None else level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b''
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header, self._header = self._header, b''
+        return header + self._compressor.flush()
+
+
+try:
+    import lz4.frame
+    register_codec('lz4', _LZ4Compressor, lz4.frame.LZ4FrameDecompressor)
+except ImportError:
+    logger.debug('lz4 codec unavailable - install lz4 to enable it')
+
+
+__all__ = ['register_codec', 'available_codecs', 'CompressingWriter',
+           'decompressing_reader']
@@ -7,19 +7,203 @@ The `velox.filesystem` submodule provides support utilities related to
 managing files (and by extension, S3) to the Velox ecosystem.
 """
 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from contextlib import contextmanager
 import errno
 import fnmatch
 from glob import glob
+import io
+import json
 import logging
 import os
 import shutil
 from tempfile import mkstemp, mkdtemp
+import threading
+import uuid
 
-from .tools import get_file_meta, obtain_qualified_name
+from .compression import decompressing_reader
+from .tools import (read_footer, footer_length, parse_footer,
+                    VELOX_FOOTER_READ_SIZE)
 
 logger = logging.getLogger(__name__)
 
+VELOX_MANIFEST_FILENAME = '.velox_manifest.json'
+VELOX_MANIFEST_VERSION = 1
+
+# how many times a save retries recording itself in an S3 manifest that other
+# saves keep replacing concurrently
+VELOX_MANIFEST_UPDATE_ATTEMPTS = 5
+
+# the directory (under a prefix) of the content-addressed store
+VELOX_BLOB_DIRNAME = '.velox_blobs'
+
+# S3 refuses multipart uploads with (non-final) parts smaller than this
+S3_MIN_PART_SIZE = 5 * 1024 ** 2
+
+_SETTINGS = {
+    'use_manifest': False,
+    'content_addressed': False,
+    'chunked': False,
+    'stream_buffer_size': 8 * 1024 ** 2,
+    'multipart_part_size': 8 * 1024 ** 2,
+    'download_chunk_size': 8 * 1024 ** 2,
+    'transfer_workers': 8,
+    'max_pool_connections': 16,
+}
+
+
+def configure(**settings):
+    """
+    Sets process-wide options for the `velox.filesystem` submodule.
+
+    Args:
+    -----
+
+    * `use_manifest (bool)`: Whether or not to maintain and consult a
+        per-prefix manifest (see `velox.filesystem.read_manifest`) when
+        saving and resolving files, rather than listing the whole prefix.
+        Defaults to `False`.
+
+    * `content_addressed (bool)`: Whether or not `velox.obj.VeloxObject.save`
+        stores payloads once per content hash in the store at its prefix,
+        writing only a small pointer record under the timestamped filename
+        (see `velox.filesystem.store_blob`). Defaults to `False`.
+
+    * `chunked (bool)`: Whether or not `velox.obj.VeloxObject.save` splits
+        payloads into content-defined chunks stored in the content-addressed
+        store at its prefix, writing only a pointer record listing them under
+        the timestamped filename (see `velox.chunking`). Defaults to `False`.
+
+    * `stream_buffer_size (int)`: The size in bytes of the read-ahead buffer
+        (and so, of each ranged GET request) used when streaming from S3.
+        Defaults to 8MB.
+
+    * `multipart_part_size (int)`: The size in bytes of each part of a
+        multipart upload to S3. Must be at least 5MB. Defaults to 8MB.
+
+    * `download_chunk_size (int)`: The size in bytes of each byte range
+        fetched when downloading from S3. Defaults to 8MB.
+
+    * `transfer_workers (int)`: The number of threads transferring parts
+        of a single upload to, or byte ranges of a single download from, S3
+        concurrently. Defaults to 8.
+
+    * `max_pool_connections (int)`: The maximum number of HTTP connections
+        kept open by the shared S3 client (see
+        `velox.filesystem.get_s3_client`). This should be at least
+        `transfer_workers`. Defaults to 16.
+
+    Raises:
+    -------
+
+    * `ValueError` if an unknown setting is passed, or if a setting has an
+        invalid value.
+    """
+    unknown = set(settings) - set(_SETTINGS)
+    if unknown:
+        raise ValueError('unknown filesystem settings: {}'
+                         .format(', '.join(sorted(unknown))))
+    if settings.get('multipart_part_size', S3_MIN_PART_SIZE) < \
+            S3_MIN_PART_SIZE:
+        raise ValueError('multipart_part_size must be at least {} bytes'
+                         .format(S3_MIN_PART_SIZE))
+    if settings.get('download_chunk_size', 1) < 1:
+        raise ValueError('download_chunk_size must be positive')
+    if settings.get('transfer_workers', 1) < 1:
+        raise ValueError('transfer_workers must be positive')
+    logger.debug('updating filesystem settings: {}'.format(settings))
+    _SETTINGS.update(settings)
+
+    if 'max_pool_connections' in settings:
+        # the connection pool size is fixed when a client is created
+        with _pool()['lock']:
+            _POOL['client'] = None
+
+
+_POOL = {}
+
+
+def _reset_pool():
+    _POOL.update(pid=os.getpid(), lock=threading.Lock(), session=None,
+                 client=None)
+
+
+def _pool():
+    # sessions, clients, and their connection pools must not be shared with
+    # a forked child, and a lock held by another thread at fork time would
+    # never be released in the child
+    if _POOL.get('pid') != os.getpid():
+        _reset_pool()
+    return _POOL
+
+
+_reset_pool()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def _client_config():
+    from botocore.config import Config
+    return Config(max_pool_connections=_SETTINGS['max_pool_connections'])
+
+
+def get_session():
+    """
+    Returns the `boto3.Session` shared by all S3 operations in this process,
+    creating it on first use (and again after a fork).
+    """
+    pool = _pool()
+    with pool['lock']:
+        if pool['session'] is None:
+            import boto3
+            logger.debug('creating shared boto3 session')
+            pool['session'] = boto3.Session()
+        return pool['session']
+
+
+def get_s3_client(session=None):
+    """
+    Returns a thread-safe S3 client. Unless a custom `session` is passed, the
+    client (and with it, its pool of warm HTTP connections) is shared by all
+    S3 operations in this process, and is recreated after a fork.
+
+    Args:
+    -----
+
+    * `session (None | boto3.Session)`: can pass in a custom boto3 session
+        if need be
+    """
+    if session is not None:
+        return session.client('s3', config=_client_config())
+
+    pool = _pool()
+    client = pool['client']
+    if client is None:
+        session = get_session()
+        with pool['lock']:
+            if pool['client'] is None:
+                logger.debug('creating shared S3 client')
+                pool['client'] = session.client('s3',
+                                                config=_client_config())
+            client = pool['client']
+    return client
+
+
+def _iter_s3_objects(prefix):
+    """
+    Yields a `(key, size)` pair for every S3 object under `prefix`, outside of
+    any content-addressed store.
+    """
+    bucket, key = parse_s3(prefix)
+    if key and not key.endswith('/'):
+        key += '/'
+    paginator = get_s3_client().get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=key):
+        for obj in page.get('Contents', []):
+            if VELOX_BLOB_DIRNAME in obj['Key'].split('/'):
+                continue
+            yield obj['Key'], obj['Size']
+
 
 def _is_non_zero_file(filepath):
     """Check for a file of zero size, with some safety w/ race conditions."""
@@ -29,11 +213,39 @@ def _is_non_zero_file(filepath):
         return False
 
 
-def find_matching_files(prefix, specifier):
+def find_matching_files(prefix, specifier, use_manifest=None):
     """
     Searches for files matching the `specifier` at the `prefix` location
     (which can be on S3).
+
+    If manifests are enabled (either through `use_manifest` or
+    `velox.filesystem.configure`), the search is answered from the manifest
+    at `prefix`, falling back to a full listing when the manifest is missing,
+    stale, or has no matching entries. As files removed from S3 behind our
+    back may linger in a manifest, prefer
+    `velox.filesystem.resolve_matching_file` to pick a file to load.
     """
+    if use_manifest is None:
+        use_manifest = _SETTINGS['use_manifest']
+
+    if use_manifest:
+        entries = read_manifest(prefix)
+        if entries is not None:
+            filelist = sorted([
+                filename for filename, size in entries.items()
+                if fnmatch.fnmatch(filename, specifier) and size > 0
+            ])
+            if filelist:
+                logger.debug('resolved {} files from manifest at {}'
+                             .format(len(filelist), prefix))
+                if not is_s3_path(prefix):
+                    # match the absolute paths given back by a local glob
+                    filelist = [os.path.join(os.path.abspath(prefix), fp)
+                                for fp in filelist]
+                return filelist[::-1]
+            logger.debug('no manifest entries match {} - falling back to '
+                         'listing'.format(specifier))
+
     if not is_s3_path(prefix):
         logger.debug('Searching on filesystem')
         filelist = sorted(glob(os.path.join(
@@ -44,25 +256,917 @@ def find_matching_files(prefix, specifier):
         # make sure we don't have any files that are zero sized
         filelist = [fp for fp in filelist if _is_non_zero_file(fp)]
     else:
-        import boto3
-        S3 = boto3.Session().resource('s3')
-
-        bucket, key = parse_s3(prefix)
-
-        logger.debug('searching in bucket s3://{} with '
-                     'pfx key = {}'.format(bucket, key))
-
-        objs_iterator = S3.Bucket(bucket).objects.filter(Prefix=key)
+        logger.debug('searching in s3 with prefix {}'.format(prefix))
 
         filelist = sorted([
-            os.path.basename(obj.key) for obj in objs_iterator
-            if (fnmatch.fnmatch(os.path.split(obj.key)[-1], specifier) and
-                obj.size > 0)  # make sure we don't have zero byte files
+            os.path.basename(key) for key, size in _iter_s3_objects(prefix)
+            if (fnmatch.fnmatch(os.path.basename(key), specifier) and
+                size > 0 and  # make sure we don't have zero byte files
+                os.path.basename(key) != VELOX_MANIFEST_FILENAME)
         ])
 
     return filelist[::-1]
 
 
+def resolve_matching_file(prefix, specifier, select):
+    """
+    Picks a file out of those matching the `specifier` at the `prefix`
+    location (see `velox.filesystem.find_matching_files`), making sure that
+    it still exists if it was picked from a manifest.
+
+    Args:
+    -----
+
+    * `prefix (str)`: the prefix (can be on S3 or on a local filesystem) to
+        search.
+
+    * `specifier (str)`: the glob pattern the files have to match.
+
+    * `select (callable)`: picks the file out of the list of matching files
+        (sorted by filename, in descending order) and returns it. If the file
+        it picks has been removed since the manifest was written, the
+        manifest is removed (see `velox.filesystem.invalidate_manifest`) and
+        `select` picks again, from a listing of `prefix`.
+
+    Returns:
+    --------
+
+    Whatever `select` returns.
+    """
+    selected = select(find_matching_files(prefix, specifier))
+    if confirm_listed(prefix, selected):
+        return selected
+    return select(find_matching_files(prefix, specifier, use_manifest=False))
+
+
+def confirm_listed(prefix, filename):
+    """
+    Confirms that `filename`, as found at `prefix` by
+    `velox.filesystem.find_matching_files`, still exists. This is only in
+    doubt when manifests are enabled, in which case a missing file means the
+    manifest is stale, and it is removed (see
+    `velox.filesystem.invalidate_manifest`) before returning `False`.
+    """
+    if not _SETTINGS['use_manifest'] or \
+            _file_exists(stitch_filename(prefix, os.path.basename(filename))):
+        return True
+    logger.warning('{} is recorded in the manifest at {} but no longer '
+                   'exists - falling back to listing'
+                   .format(filename, prefix))
+    invalidate_manifest(prefix)
+    return False
+
+
+def _file_exists(path):
+    if not is_s3_path(path):
+        return os.path.isfile(path)
+
+    from botocore.exceptions import ClientError
+    bucket, key = parse_s3(path)
+    try:
+        get_s3_client().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in {'404', 'NoSuchKey', 'NotFound'}:
+            return False
+        raise
+    return True
+
+
+def _list_prefix(prefix):
+    """
+    Lists every (non-hidden, on a local filesystem) file at `prefix`, returning
+    a dictionary mapping filename to size in bytes.
+    """
+    if not is_s3_path(prefix):
+        entries = {}
+        for filepath in glob(os.path.join(os.path.abspath(prefix), '*')):
+            if os.path.isfile(filepath):
+                entries[os.path.basename(filepath)] = \
+                    os.path.getsize(filepath)
+        return entries
+
+    return {
+        os.path.basename(key): size
+        for key, size in _iter_s3_objects(prefix)
+        if os.path.basename(key) != VELOX_MANIFEST_FILENAME
+    }
+
+
+def read_manifest(prefix):
+    """
+    Reads the manifest maintained at `prefix`. A manifest records the name
+    and size of every file saved through Velox to a prefix, so that resolving
+    the best file to load costs a single small read rather than a full
+    listing of the prefix.
+
+    Args:
+    -----
+
+    * `prefix (str)`: the prefix (can be on S3 or on a local filesystem) to
+        read the manifest from.
+
+    Returns:
+    --------
+
+    A `dict` mapping filenames to sizes in bytes, or `None` if there is no
+    manifest at `prefix` or if it is stale. On a local filesystem, where
+    listing file names is cheap, a manifest is considered stale unless it
+    records exactly the (non-hidden) files in the directory. On S3, objects
+    written without going through Velox will not be seen until the manifest
+    is rebuilt, and those removed are only noticed once they are picked (see
+    `velox.filesystem.resolve_matching_file`).
+    """
+    return _read_manifest(prefix)[0]
+
+
+def _read_manifest(prefix):
+    """
+    Returns a tuple of the entries of the manifest at `prefix` (see
+    `velox.filesystem.read_manifest`) and, on S3, of the ETag of the manifest
+    object, or `None` if there is no manifest object.
+    """
+    manifest_path = stitch_filename(prefix, VELOX_MANIFEST_FILENAME)
+    etag = None
+
+    if not is_s3_path(prefix):
+        try:
+            with open(manifest_path, 'r') as fp:
+                raw = fp.read()
+        except (IOError, OSError):
+            logger.debug('no manifest found at {}'.format(prefix))
+            return None, etag
+    else:
+        from botocore.exceptions import ClientError
+        bucket, key = parse_s3(manifest_path)
+        try:
+            response = get_s3_client().get_object(
+                Bucket=bucket, Key=key
+            )
+        except ClientError:
+            logger.debug('no manifest found at {}'.format(prefix))
+            return None, etag
+        etag = response['ETag']
+        raw = response['Body'].read().decode('utf-8')
+
+    try:
+        manifest = json.loads(raw)
+    except ValueError:
+        logger.warning('ignoring corrupt manifest at {}'.format(prefix))
+        return None, etag
+
+    if manifest.get('version') != VELOX_MANIFEST_VERSION:
+        logger.warning('ignoring manifest with unknown version {} at {}'
+                       .format(manifest.get('version'), prefix))
+        return None, etag
+
+    entries = manifest['files']
+    if not is_s3_path(prefix) and \
+            set(entries) != set(_list_filenames(prefix)):
+        logger.debug('manifest at {} is stale'.format(prefix))
+        return None, etag
+    return entries, etag
+
+
+def _list_filenames(prefix):
+    # only names are compared, so there is no need to stat every file
+    for entry in os.scandir(prefix):
+        if not entry.name.startswith('.') and entry.is_file():
+            yield entry.name
+
+
+def _manifest_body(entries):
+    return json.dumps({
+        'version': VELOX_MANIFEST_VERSION,
+        'files': entries
+    }, sort_keys=True)
+
+
+def write_manifest(prefix, entries):
+    """
+    Writes a manifest of `entries` (a `dict` mapping filenames to sizes in
+    bytes) to `prefix`, replacing any existing manifest.
+    """
+    raw = _manifest_body(entries)
+    manifest_path = stitch_filename(prefix, VELOX_MANIFEST_FILENAME)
+
+    if not is_s3_path(prefix):
+        fd, temp_fp = mkstemp(dir=prefix, prefix=VELOX_MANIFEST_FILENAME)
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(raw)
+        getattr(os, 'replace', os.rename)(temp_fp, manifest_path)
+    else:
+        bucket, key = parse_s3(manifest_path)
+        get_s3_client().put_object(
+            Bucket=bucket, Key=key, Body=raw.encode('utf-8')
+        )
+    logger.debug('wrote manifest with {} entries to {}'
+                 .format(len(entries), prefix))
+
+
+def update_manifest(path):
+    """
+    Records the file at `path` in the manifest of its prefix, if manifests
+    are enabled through `velox.filesystem.configure`. A missing (or stale)
+    manifest is bootstrapped from a full listing of the prefix.
+
+    On S3, the manifest is only replaced if nobody else has replaced it since
+    it was read, and the update is otherwise retried from a fresh read, so
+    that concurrent saves to one prefix do not drop each other's entries.
+
+    Args:
+    -----
+
+    * `path (str)`: path to a file that has just been saved. Can be
+            either `/path/to/desired/file.fmt`, or
+            `s3://myBucketName/this/is/a.key`
+    """
+    if not _SETTINGS['use_manifest']:
+        return
+
+    prefix, filename = os.path.split(path)
+
+    if not is_s3_path(prefix):
+        # a local listing is cheap enough to pay on every save, and it picks
+        # up anything written to the directory behind our back
+        write_manifest(prefix, _list_prefix(prefix))
+        return
+
+    from botocore.exceptions import ClientError
+    bucket, key = parse_s3(path)
+    size = get_s3_client().head_object(
+        Bucket=bucket, Key=key
+    )['ContentLength']
+
+    for _ in range(VELOX_MANIFEST_UPDATE_ATTEMPTS):
+        entries, etag = _read_manifest(prefix)
+        if entries is None:
+            logger.info('bootstrapping manifest at {}'.format(prefix))
+            entries = _list_prefix(prefix)
+        entries[filename] = size
+        try:
+            _put_manifest(prefix, entries, etag)
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] not in {
+                    'PreconditionFailed', 'ConditionalRequestConflict'}:
+                raise
+            logger.debug('manifest at {} was replaced concurrently - '
+                         'retrying update'.format(prefix))
+
+    # rather than leave a manifest behind that silently misses this file,
+    # we remove it, so that lookups list the prefix until it is rebuilt
+    logger.warning('gave up on recording {} in the manifest at {} after {} '
+                   'attempts - removing it'
+                   .format(filename, prefix, VELOX_MANIFEST_UPDATE_ATTEMPTS))
+    invalidate_manifest(prefix)
+
+
+def invalidate_manifest(prefix):
+    """
+    Removes the manifest at `prefix` (if any), so that lookups list the
+    prefix until the next save rebuilds the manifest from a listing.
+    """
+    manifest_path = stitch_filename(prefix, VELOX_MANIFEST_FILENAME)
+    if not is_s3_path(prefix):
+        try:
+            os.remove(manifest_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    else:
+        bucket, key = parse_s3(manifest_path)
+        get_s3_client().delete_object(Bucket=bucket, Key=key)
+    logger.debug('removed manifest at {}'.format(prefix))
+
+
+def _put_manifest(prefix, entries, etag):
+    """
+    Writes a manifest of `entries` to the S3 `prefix`, provided that the
+    manifest object there still has the ETag `etag` (or, if `etag` is `None`,
+    that there still is none).
+    """
+    bucket, key = parse_s3(stitch_filename(prefix, VELOX_MANIFEST_FILENAME))
+    if etag is None:
+        condition = {'IfNoneMatch': '*'}
+    else:
+        condition = {'IfMatch': etag}
+    get_s3_client().put_object(
+        Bucket=bucket, Key=key, Body=_manifest_body(entries).encode('utf-8'),
+        **condition
+    )
+    logger.debug('wrote manifest with {} entries to {}'
+                 .format(len(entries), prefix))
+
+
+class _ViewReader(io.RawIOBase):
+    """
+    Base class for read-only, seekable views over the first `length` bytes of
+    some underlying storage. Subclasses implement `_read_at`, which fills a
+    `memoryview` with the bytes starting at an absolute position.
+    """
+
+    def __init__(self, length, name=None):
+        self._length = length
+        self._position = 0
+        self.name = name
+
+    def _read_at(self, position, view):
+        raise NotImplementedError
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        remaining = self._length - self._position
+        if remaining <= 0:
+            return 0
+        view = memoryview(b)
+        if len(view) > remaining:
+            view = view[:remaining]
+        n = self._read_at(self._position, view) or 0
+        self._position += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._length + offset
+        else:
+            raise ValueError('invalid whence: {}'.format(whence))
+        if position < 0:
+            raise ValueError('negative seek position {}'.format(position))
+        self._position = position
+        return position
+
+    def tell(self):
+        return self._position
+
+    def readall(self):
+        # `io.RawIOBase.readall` reads in small chunks, and every call to
+        # `_read_at` may cost a request, so we read the rest in one go
+        buf = bytearray(max(self._length - self._position, 0))
+        view = memoryview(buf)
+        received = 0
+        while received < len(buf):
+            n = self.readinto(view[received:])
+            if not n:
+                break
+            received += n
+        view.release()
+        del buf[received:]
+        return bytes(buf)
+
+
+class _BoundedReader(_ViewReader):
+    """
+    Read-only, seekable view over the `length` bytes of a raw file object
+    starting at `offset`, used to hide the velox footer from `_load` hooks
+    without copying or truncating the underlying file.
+
+    Reading through the view never copies anything. Hooks that reopen the
+    file by `name` instead get a temporary copy of just the viewed bytes,
+    made the first time `name` is asked for and removed on close.
+    """
+
+    def __init__(self, raw, length, offset=0, name=None):
+        self._raw = raw
+        self._offset = offset
+        self._copy_directory = None
+        if name is None:
+            name = getattr(raw, 'name', None)
+        super(_BoundedReader, self).__init__(length, name=name)
+
+    @property
+    def name(self):
+        if self._name is None or self._covers_raw():
+            return self._name
+        if self._copy_directory is None:
+            self._copy_directory = mkdtemp()
+            logger.debug('copying viewed bytes of {} to {} for access by name'
+                         .format(self._name, self._copy_directory))
+            with io.open(self._copy_path(), 'wb') as f:
+                self._copy_to(f)
+        return self._copy_path()
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+
+    def _copy_path(self):
+        # keep the basename, as some loaders go by the file extension
+        return os.path.join(self._copy_directory, os.path.basename(self._name))
+
+    def _covers_raw(self):
+        try:
+            size = os.fstat(self._raw.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return False
+        return self._offset == 0 and self._length == size
+
+    def _copy_to(self, fileobject):
+        buf = bytearray(1024 ** 2)
+        position = 0
+        while position < self._length:
+            view = memoryview(buf)[:min(len(buf), self._length - position)]
+            n = self._read_at(position, view)
+            if not n:
+                break
+            fileobject.write(view[:n])
+            position += n
+
+    def _read_at(self, position, view):
+        self._raw.seek(self._offset + position)
+        return self._raw.readinto(view)
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+            if self._copy_directory is not None:
+                shutil.rmtree(self._copy_directory, ignore_errors=True)
+        super(_BoundedReader, self).close()
+
+
+class _S3RangeReader(_ViewReader):
+    """
+    Read-only, seekable view over the first `length` bytes of an S3 object,
+    where every read is served by a ranged GET request.
+    """
+
+    def __init__(self, client, bucket, key, length, name=None):
+        super(_S3RangeReader, self).__init__(length, name=name)
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+
+    def _read_at(self, position, view):
+        response = self._client.get_object(
+            Bucket=self._bucket, Key=self._key,
+            Range='bytes={}-{}'.format(position, position + len(view) - 1)
+        )
+        body = response['Body']
+        received = 0
+        while received < len(view):
+            chunk = body.read(len(view) - received)
+            if not chunk:
+                break
+            view[received:received + len(chunk)] = chunk
+            received += len(chunk)
+        return received
+
+
+class _S3MultipartWriter(io.RawIOBase):
+    """
+    Write-only file object that uploads to S3 as it is written to. Bytes are
+    accumulated into parts of `part_size` bytes which are uploaded by up to
+    `workers` threads while the caller keeps writing, bounding memory use to
+    roughly `(workers + 1) * part_size` bytes. The upload is completed when the
+    file object is closed, and objects smaller than a single part are sent
+    with a plain PUT.
+    """
+
+    def __init__(self, client, bucket, key, part_size, workers, name=None):
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = part_size
+        self._workers = workers
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._executor = None
+        self._parts = []
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        buffered = len(self._buffer)
+        self._buffer.extend(b)
+        n = len(self._buffer) - buffered
+        self._position += n
+        while len(self._buffer) >= self._part_size:
+            self._submit(bytes(self._buffer[:self._part_size]))
+            del self._buffer[:self._part_size]
+        return n
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # we can only ever be at the end of what has been written, but we
+        # tolerate no-op seeks from callers making sure of just that
+        if (offset == 0 and whence in {io.SEEK_CUR, io.SEEK_END}) or \
+                (whence == io.SEEK_SET and offset == self._position):
+            return self._position
+        raise io.UnsupportedOperation('streaming uploads are not seekable')
+
+    def _submit(self, body):
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(
+                Bucket=self._bucket, Key=self._key
+            )['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+            logger.debug('started multipart upload {} to s3://{}/{}'
+                         .format(self._upload_id, self._bucket, self._key))
+
+        in_flight = [part for part in self._parts if not part.done()]
+        if len(in_flight) >= self._workers:
+            wait(in_flight, return_when=FIRST_COMPLETED)
+
+        # surface failed parts as early as possible
+        for part in self._parts:
+            if part.done():
+                part.result()
+
+        self._parts.append(self._executor.submit(
+            self._upload_part, len(self._parts) + 1, body
+        ))
+
+    def _upload_part(self, number, body):
+        response = self._client.upload_part(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id,
+            PartNumber=number, Body=body
+        )
+        logger.debug('uploaded part {} ({} bytes)'.format(number, len(body)))
+        return {'ETag': response['ETag'], 'PartNumber': number}
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload_id is None:
+                self._client.put_object(Bucket=self._bucket, Key=self._key,
+                                        Body=bytes(self._buffer))
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                    del self._buffer[:]
+                parts = [part.result() for part in self._parts]
+                self._client.complete_multipart_upload(
+                    Bucket=self._bucket, Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+                logger.debug('completed multipart upload of {} parts'
+                             .format(len(parts)))
+        except Exception:
+            self.abort()
+            raise
+        self._shutdown()
+        super(_S3MultipartWriter, self).close()
+
+    def abort(self):
+        """Abandons the upload, discarding any uploaded parts."""
+        if self.closed:
+            return
+        for part in self._parts:
+            part.cancel()
+        self._shutdown()
+        if self._upload_id is not None:
+            logger.warning('aborting multipart upload to s3://{}/{}'
+                           .format(self._bucket, self._key))
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+            )
+        super(_S3MultipartWriter, self).close()
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def _transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(
+        multipart_threshold=_SETTINGS['multipart_part_size'],
+        multipart_chunksize=_SETTINGS['multipart_part_size'],
+        max_concurrency=_SETTINGS['transfer_workers']
+    )
+
+
+def upload_file(filepath, path, session=None):
+    """
+    Uploads the local file at `filepath` to the S3 location `path`, using a
+    parallel multipart upload configured by the `multipart_part_size` and
+    `transfer_workers` settings (see `velox.filesystem.configure`) for files
+    larger than a single part.
+    """
+    bucket, key = parse_s3(path)
+    logger.debug('uploading {} to bucket = {} with key = {}'.format(
+        filepath, bucket, key))
+    get_s3_client(session).upload_file(filepath, bucket, key,
+                                       Config=_transfer_config())
+
+
+def _download_range(client, bucket, key, filepath, start, end, etag=None):
+    """Writes bytes `[start, end)` of an S3 object into place in `filepath`."""
+    conditions = {} if etag is None else {'IfMatch': etag}
+    response = client.get_object(Bucket=bucket, Key=key,
+                                 Range='bytes={}-{}'.format(start, end - 1),
+                                 **conditions)
+    body = response['Body']
+    with open(filepath, 'r+b') as fp:
+        fp.seek(start)
+        while True:
+            chunk = body.read(1024 ** 2)
+            if not chunk:
+                break
+            fp.write(chunk)
+
+
+def download_file(path, filepath, session=None, length=None, etag=None):
+    """
+    Downloads the S3 object at `path` to the local file `filepath`. The file
+    is preallocated, and objects larger than a single chunk are split into
+    byte ranges that are fetched concurrently, configured by the
+    `download_chunk_size` and `transfer_workers` settings (see
+    `velox.filesystem.configure`).
+
+    Args:
+    -----
+
+    * `path (str)`: an S3 path, written in the form `s3://bucket/foo.bar`
+
+    * `filepath (str)`: the local file to download into.
+
+    * `session (None | boto3.Session)`: can pass in a custom boto3 session
+        if need be
+
+    * `length (None | int)`: the number of leading bytes of the object to
+        download. If not passed, the whole object is downloaded.
+
+    * `etag (None | str)`: if passed, every byte range is only fetched if the
+        object still has this ETag, so that an object overwritten mid-way
+        fails the download rather than mixing bytes of two versions.
+
+    Returns:
+    --------
+
+    `int`: the number of bytes downloaded.
+    """
+    client = get_s3_client(session)
+    bucket, key = parse_s3(path)
+
+    if length is None:
+        length = client.head_object(Bucket=bucket, Key=key)['ContentLength']
+
+    with open(filepath, 'wb') as fp:
+        fp.truncate(length)
+
+    chunk_size = _SETTINGS['download_chunk_size']
+    ranges = [(start, min(start + chunk_size, length))
+              for start in range(0, length, chunk_size)]
+    logger.debug('downloading {} bytes from {} in {} ranges'
+                 .format(length, path, len(ranges)))
+
+    if len(ranges) == 1:
+        _download_range(client, bucket, key, filepath, *ranges[0], etag=etag)
+    elif ranges:
+        workers = min(_SETTINGS['transfer_workers'], len(ranges))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_download_range, client, bucket, key,
+                                filepath, start, end, etag=etag)
+                for start, end in ranges
+            ]
+            for future in futures:
+                future.result()
+    return length
+
+
+def read_validator(path, session=None):
+    """
+    Identifies the current version of the object at `path` without reading
+    it, with a single HEAD request on S3 or a single stat on a local
+    filesystem.
+
+    Args:
+    -----
+
+    * `path (str)`: either `/path/to/file.fmt`, or
+        `s3://myBucketName/this/is/a.key`
+
+    * `session (None | boto3.Session)`: can pass in a custom boto3 session
+        if need be
+
+    Returns:
+    --------
+
+    A JSON serializable `dict` holding the `size` of the object, along with
+    its `etag` on S3 or its `mtime` on a local filesystem. Two validators
+    compare equal only if the object is (very likely) unchanged.
+    """
+    if not is_s3_path(path):
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+    bucket, key = parse_s3(path)
+    response = get_s3_client(session).head_object(Bucket=bucket, Key=key)
+    return {'size': response['ContentLength'], 'etag': response['ETag']}
+
+
+def fetch_file(path, filepath, validator=None, session=None):
+    """
+    Copies the object at `path` (which can be on S3) to the local file
+    `filepath`.
+
+    Args:
+    -----
+
+    * `path (str)`: either `/path/to/file.fmt`, or
+        `s3://myBucketName/this/is/a.key`
+
+    * `filepath (str)`: the local file to copy into.
+
+    * `validator (None | dict)`: the validator of the version of `path` to
+        fetch (see `velox.filesystem.read_validator`), if already known.
+
+    * `session (None | boto3.Session)`: can pass in a custom boto3 session
+        if need be
+
+    Returns:
+    --------
+
+    The validator of the version that was fetched, to be compared against
+    a later `velox.filesystem.read_validator` to tell whether `filepath` is
+    still an up to date copy of `path`.
+    """
+    if validator is None:
+        validator = read_validator(path, session=session)
+    if is_s3_path(path):
+        download_file(path, filepath, session=session,
+                      length=validator['size'], etag=validator['etag'])
+    else:
+        shutil.copyfile(path, filepath)
+    return validator
+
+
+def _read_s3_tail(client, bucket, key, nbytes):
+    """
+    Reads (at most) the last `nbytes` bytes of an S3 object with a single
+    ranged GET request, returning a `(tail, size)` tuple where `size` is the
+    size of the whole object.
+    """
+    from botocore.exceptions import ClientError
+    try:
+        response = client.get_object(Bucket=bucket, Key=key,
+                                     Range='bytes=-{}'.format(nbytes))
+    except ClientError as err:
+        # S3 refuses suffix ranges against empty objects
+        if err.response.get('Error', {}).get('Code') == 'InvalidRange':
+            return b'', 0
+        raise
+    tail = response['Body'].read()
+    content_range = response.get('ContentRange')
+    if content_range:
+        # takes the form `bytes start-end/size`
+        size = int(content_range.rsplit('/', 1)[-1])
+    else:
+        size = len(tail)
+    return tail, size
+
+
+def _check_payload_length(metadata, payload_length, name):
+    if metadata is None:
+        return
+    logger.debug('found velox metadata in footer of {}'.format(name))
+    if _is_pointer(metadata):
+        # pointer records carry the metadata of a payload stored elsewhere
+        return
+    expected = metadata.get('payload_length')
+    if expected is not None and expected != payload_length:
+        raise IOError('{} holds a payload of {} bytes, but its footer '
+                      'records {} - it may be truncated or corrupt'
+                      .format(name, payload_length, expected))
+
+
+def _read_s3_footer(client, bucket, key):
+    """
+    Reads the velox footer of an S3 object with a single ranged GET request
+    (or two, for unusually large footers), returning a `(metadata,
+    payload_length)` tuple.
+    """
+    tail, size = _read_s3_tail(client, bucket, key, VELOX_FOOTER_READ_SIZE)
+    length = footer_length(tail)
+    if length > len(tail) and length <= size:
+        tail, size = _read_s3_tail(client, bucket, key, length)
+    if length > len(tail):
+        return None, size
+    metadata = parse_footer(tail)
+    _check_payload_length(metadata, size - length, key)
+    return metadata, size - length
+
+
+def read_metadata(path, session=None):
+    """
+    Reads the metadata that Velox records in the footer of a saved object
+    without reading its payload (with a single small ranged GET request on
+    S3).
+
+    Args:
+    -----
+
+    * `path (str)`: either `/path/to/file.vx`, or
+        `s3://myBucketName/this/is/a.vx`
+
+    * `session (None | boto3.Session)`: can pass in a custom boto3 session
+        if need be
+
+    Returns:
+    --------
+
+    A dict of metadata, or `None` if the object has no velox footer. Objects
+    saved by earlier versions of Velox only record their `class` (and
+    `codec`), while others also record their `payload_length`, the `sha256`
+    of their payload, their `registered_name` and `version`, the time they
+    were `created`, and any out-of-band `segments` of their payload. The
+    metadata of pointer records into a content-addressed store (see
+    `velox.filesystem.store_blob`) also records the `blob` they point at, or
+    the `chunks` their payload is made of (see `velox.chunking`).
+    """
+    if not is_s3_path(path):
+        with io.open(path, 'rb') as fp:
+            metadata, length = read_footer(fp)
+            fp.seek(0, 2)
+            _check_payload_length(metadata, fp.tell() - length, path)
+        return metadata
+    bucket, key = parse_s3(path)
+    return _read_s3_footer(get_s3_client(session), bucket, key)[0]
+
+
+def _open_s3_stream(client, bucket, key, binary, name=None):
+    """
+    Opens a buffered, streaming view of the S3 object at `key` that ends right
+    before the velox footer, returning a `(fileobject, metadata)` tuple.
+    """
+    metadata, size = _read_s3_footer(client, bucket, key)
+
+    view = io.BufferedReader(
+        _S3RangeReader(client, bucket, key, size, name=name),
+        buffer_size=_SETTINGS['stream_buffer_size']
+    )
+    return _decode_payload(view, metadata, binary), metadata
+
+
+def _open_bounded_view(raw, length, binary, metadata=None, name=None):
+    """
+    Wraps `raw` in a buffered (and, unless `binary`, text decoded) view of its
+    first `length` bytes. Closing the view closes `raw`.
+    """
+    view = io.BufferedReader(_BoundedReader(raw, length, name=name))
+    return _decode_payload(view, metadata, binary)
+
+
+def open_view(raw, offset, length, name=None):
+    """
+    Returns a buffered, read-only, seekable view over the `length` bytes of
+    the seekable file object `raw` starting at `offset`, without copying
+    them. Closing the view closes `raw`.
+    """
+    return io.BufferedReader(
+        _BoundedReader(raw, length, offset=offset, name=name))
+
+
+def file_region(fileobject):
+    """
+    If `fileobject` is a local file, or a view (see
+    `velox.filesystem.open_view`) over one, returns a `(fileno, offset)` tuple
+    such that position 0 of `fileobject` lies at `offset` in the file
+    descriptor `fileno`. Returns `None` otherwise.
+    """
+    offset = 0
+    while True:
+        raw = getattr(fileobject, 'raw', fileobject)
+        if isinstance(raw, _BoundedReader):
+            offset += raw._offset
+            fileobject = raw._raw
+        elif isinstance(raw, io.FileIO):
+            return raw.fileno(), offset
+        else:
+            return None
+
+
+def _decode_payload(view, metadata, binary):
+    """
+    Wraps the binary `view` of a payload in a streaming decompressor if the
+    velox `metadata` records a codec, and in a text decoder unless `binary`.
+    """
+    codec = None if metadata is None else metadata.get('codec')
+    if codec is not None:
+        logger.debug('decompressing payload with codec {}'.format(codec))
+        view = decompressing_reader(view, codec)
+    if binary:
+        return view
+    return io.TextIOWrapper(view)
+
+
 def stitch_filename(prefix, filename):
     if is_s3_path(prefix):
         if prefix.endswith('/'):
@@ -76,20 +1180,24 @@ def stitch_filename(prefix, filename):
     return os.path.join(prefix, filename)
 
 
+# S3 buckets that have already been confirmed to exist by `ensure_exists`
+_CONFIRMED_BUCKETS = set()
+
+
 def ensure_exists(prefix):
     """
     Safely ensures that the specified `prefix` exists. If `prefix` would point
     to a location on a reachable file system, it will safely create the
     necessary directory path respecting race conditions. If `prefix` would
-    point to S3, it creates the bucket, if one doesn't already exist.
+    point to S3, it creates the bucket, if one doesn't already exist. Buckets
+    that are known to exist are remembered for the lifetime of the process,
+    so repeated calls for the same bucket make no requests to S3.
     """
 
     if not is_s3_path(prefix):
         logger.debug('Safely ensuring {} exists.'.format(prefix))
         safe_mkdir(prefix)
     else:
-        import boto3
-
         logger.info('Prefix {} will be on S3'.format(prefix))
 
         bucket, key = parse_s3(prefix)
@@ -97,20 +1205,41 @@ def ensure_exists(prefix):
         logger.debug('S3 bucket = {}'.format(bucket))
         logger.debug('S3 key = {}'.format(key))
 
-        SESSION = boto3.Session()
+        if bucket in _CONFIRMED_BUCKETS:
+            logger.debug('bucket already confirmed to exist')
+            return
 
-        S3 = SESSION.resource('s3')
+        from botocore.exceptions import ClientError
+        client = get_s3_client()
 
-        if bucket in {_.name for _ in S3.buckets.iterator()}:
+        try:
+            client.head_bucket(Bucket=bucket)
             logger.debug('bucket already exists')
-        else:
-            logger.warn('bucket does not exist. Creating it...')
-            S3.create_bucket(
-                Bucket=bucket,
-                CreateBucketConfiguration={
-                    'LocationConstraint': SESSION.region_name
-                }
-            )
+        except ClientError as err:
+            code = err.response.get('Error', {}).get('Code')
+            if code == '403':
+                # the bucket exists, we just aren't allowed to look at it -
+                # any permission problems will surface when writing to it
+                logger.debug('bucket exists, but access is forbidden')
+            elif code in {'404', 'NoSuchBucket'}:
+                logger.warn('bucket does not exist. Creating it...')
+                region = get_session().region_name
+                config = {}
+                # us-east-1 is the default, and can't be asked for explicitly
+                if region and region != 'us-east-1':
+                    config['CreateBucketConfiguration'] = {
+                        'LocationConstraint': region
+                    }
+                try:
+                    client.create_bucket(Bucket=bucket, **config)
+                except ClientError as create_err:
+                    if create_err.response.get('Error', {}).get('Code') != \
+                            'BucketAlreadyOwnedByYou':
+                        raise
+            else:
+                raise
+
+        _CONFIRMED_BUCKETS.add(bucket)
 
 
 def safe_mkdir(path):
@@ -154,11 +1283,155 @@ def parse_s3(pth):
     return split[0], os.sep.join(split[1:])
 
 
+def content_addressed():
+    """
+    Whether or not content addressing is enabled (see
+    `velox.filesystem.configure`).
+    """
+    return _SETTINGS['content_addressed']
+
+
+def chunked():
+    """
+    Whether or not chunked storage is enabled (see
+    `velox.filesystem.configure`).
+    """
+    return _SETTINGS['chunked']
+
+
+def _is_pointer(metadata):
+    return metadata is not None and (metadata.get('blob') is not None or
+                                     metadata.get('chunks') is not None)
+
+
+@contextmanager
+def _open_chunked(path, metadata, binary, session=None,
+                  delete_on_close=True):
+    """
+    Assembles the payload of the chunked pointer record at `path` into a
+    temporary file, and yields a (decoded) file object over it.
+    """
+    from .chunking import fetch_chunks
+    temp_dir = mkdtemp(suffix='tmpfile', prefix='velox_chunks')
+    try:
+        temp_fp = os.path.join(temp_dir, os.path.basename(path))
+        fetch_chunks(path, metadata, temp_fp, session=session)
+        with _decode_payload(io.open(temp_fp, 'rb'), metadata, binary) as f:
+            yield f
+    finally:
+        if delete_on_close:
+            shutil.rmtree(temp_dir)
+
+
+def blob_path(prefix, digest):
+    """
+    Returns the path of the blob holding the payload with SHA256 `digest` in
+    the content-addressed store at `prefix`.
+    """
+    return stitch_filename(prefix, '{}/{}'.format(VELOX_BLOB_DIRNAME, digest))
+
+
+def blob_tempfile(prefix):
+    """
+    Creates (and returns the path of) an empty local file to stage a blob for
+    the content-addressed store at `prefix` in. For a local `prefix`, it is
+    created inside the store, so that it can be renamed into place.
+    """
+    if is_s3_path(prefix):
+        directory = None
+    else:
+        directory = os.path.join(prefix, VELOX_BLOB_DIRNAME)
+        safe_mkdir(directory)
+    fd, temp_fp = mkstemp(dir=directory, prefix='.blob-', suffix='.tmp')
+    os.close(fd)
+    return temp_fp
+
+
+def store_blob(filepath, prefix, digest, session=None):
+    """
+    Stores the local file at `filepath` (a saved object whose payload has
+    SHA256 `digest`) in the content-addressed store at `prefix`, unless an
+    identical blob is already there. Blobs are named after their content, so
+    saving a payload that was saved before (under any name or version) costs
+    a single existence check.
+
+    Args:
+    -----
+
+    * `filepath (str)`: path to the local file to store. It is moved into
+        place for a local `prefix`, and left untouched otherwise.
+
+    * `prefix (str)`: the prefix (can be on S3 or on a local filesystem)
+        holding the store.
+
+    * `digest (str)`: the (hex) SHA256 of the payload of `filepath`.
+
+    * `session (None | boto3.Session)`: can pass in a custom boto3 session
+        if need be
+
+    Returns:
+    --------
+
+    A `(path, stored)` tuple, where `path` is the path of the blob and
+    `stored` is whether it had to be written.
+    """
+    path = blob_path(prefix, digest)
+    if not is_s3_path(prefix):
+        if os.path.exists(path):
+            logger.debug('blob {} already stored'.format(digest))
+            return path, False
+        safe_mkdir(os.path.dirname(path))
+        getattr(os, 'replace', os.rename)(filepath, path)
+        return path, True
+
+    from botocore.exceptions import ClientError
+    bucket, key = parse_s3(path)
+    try:
+        get_s3_client(session).head_object(Bucket=bucket, Key=key)
+        logger.debug('blob {} already stored'.format(digest))
+        return path, False
+    except ClientError as err:
+        if err.response.get('Error', {}).get('Code') not in \
+                {'404', 'NoSuchKey', 'NotFound'}:
+            raise
+    upload_file(filepath, path, session=session)
+    return path, True
+
+
+def pointer_target(path, metadata):
+    """
+    Returns the path of the blob that the object at `path` points at if its
+    velox `metadata` is that of a pointer record, and `None` otherwise.
+    """
+    digest = None if metadata is None else metadata.get('blob')
+    if digest is None:
+        return None
+    return blob_path(os.path.dirname(path), digest)
+
+
 # TODO(@lukedeo): Ensure that if things go wrong, we clean up all velox
 # metadata
+def _type_hint(metadata):
+    if metadata is None:
+        return None
+    clsname = metadata.get('class')
+    logger.debug('found type hint: {} - yielding as part pf payload'
+                 .format(clsname))
+    return clsname
+
+
+def _yielded(f, metadata, yield_type_hint, yield_metadata):
+    if yield_metadata:
+        return f, metadata
+    if yield_type_hint:
+        return f, _type_hint(metadata)
+    return f
+
+
 @contextmanager
 def get_aware_filepath(path, mode='r', session=None, yield_type_hint=False,
-                       delete_on_close=True):
+                       delete_on_close=True, stream=False,
+                       yield_metadata=False):
     """ context handler for dealing with local fs and remote (S3 only...)
 
     Args:
@@ -167,7 +1440,14 @@ def get_aware_filepath(path, mode='r', session=None, yield_type_hint=False,
             either `/path/to/desired/file.fmt`, or
             `s3://myBucketName/this/is/a.key`
 
-    * `mode (str)`: one of {rb, wb, r, w}
+    * `mode (str)`: one of {rb, wb, r, w}. When reading a local file, the
+            file object yielded is a read-only view over the original file
+            which ends right before any velox metadata; its `name` is that of
+            a footer-free temporary copy, made only if `name` is asked for.
+            Payloads that the velox metadata records a compression codec for
+            are decompressed transparently, as they are read. When writing a
+            local file, it is written to a temporary file that is renamed
+            into place on close.
 
     * `session (None | boto3.Session)`: can pass in a custom boto3 session
         if need be
@@ -175,9 +1455,21 @@ def get_aware_filepath(path, mode='r', session=None, yield_type_hint=False,
     * `yield_type_hint (bool)`: Whether or not to yield any type hints from the
         velox metadata. If `True`, then will yield a tuple.
 
+    * `yield_metadata (bool)`: Whether or not to yield the whole velox
+        metadata dict (see `velox.filesystem.read_metadata`), or `None` if
+        there is none, in place of the type hint. If `True`, then will yield a
+        tuple.
+
     * `delete_on_close (bool)`: Whether or not to delete any temporary files
         (only used if `path` is an S3 path.)
 
+    * `stream (bool)`: When reading from S3, whether to yield a seekable,
+        buffered file object backed by ranged GET requests rather than
+        downloading to a temporary file first. When writing to S3, whether to
+        yield a non-seekable file object that uploads parts in parallel as
+        they are written, rather than uploading a temporary file on close.
+        Note that such file objects cannot be re-opened by name.
+
     Example:
     --------
 
@@ -205,100 +1497,160 @@ def get_aware_filepath(path, mode='r', session=None, yield_type_hint=False,
     if not is_s3_path(path):
         logger.debug('opening file = {} on local fs'.format(path))
 
-        metadata = None
-        # If we are reading from a file, we want to extract and truncate the
-        # bytes related to the velox type hint before yielding the file so that
-        # whatever operation the user specified is not compromised by extra
-        # bytes. We then want to add the tail bytes back on to the file after
-        # finishing
-        # if yield_type_hint:
         if read_operation:
-            logger.debug('peforming safe copy to avoid race conditions.')
-            tmpdir = mkdtemp(suffix='tmpdir', prefix='typehint')
-            _, filename = os.path.split(path)
-            tmp_path = os.path.join(tmpdir, filename)
-            shutil.copyfile(src=path, dst=tmp_path)
-            path = tmp_path
-            logger.debug('will now operate on newly allocated file: {}'
+            # Rather than copying the file and truncating the velox footer
+            # off of the copy, we open the original read-only and hand back a
+            # view that ends right before the footer. Only when the file is
+            # reopened by name is a footer-free copy made, on demand.
+            raw = io.open(path, 'rb', buffering=0)
+            try:
+                metadata, length = read_footer(raw)
+                payload_length = os.fstat(raw.fileno()).st_size - length
+                _check_payload_length(metadata, payload_length, path)
+            except Exception:
+                raw.close()
+                raise
+            target = pointer_target(path, metadata)
+            if target is not None or _is_pointer(metadata):
+                raw.close()
+                if target is not None:
+                    logger.debug('following pointer record to {}'
+                                 .format(target))
+                    opened = get_aware_filepath(target, mode)
+                else:
+                    opened = _open_chunked(path, metadata, binary)
+                with opened as f:
+                    yield _yielded(f, metadata, yield_type_hint,
+                                   yield_metadata)
+                return
+            f = _open_bounded_view(raw, payload_length, binary,
+                                   metadata=metadata, name=path)
+        else:
+            # Write next to the destination and rename into place once done,
+            # so that nobody resolves (or loads) a partially written file.
+            # The temporary file keeps the destination's name as its suffix,
+            # as serializers may pick a format from the extension.
+            directory, filename = os.path.split(os.path.abspath(path))
+            temp_fp = os.path.join(directory, '.{}.{}'.format(
+                uuid.uuid4().hex, filename))
+            try:
+                with open(temp_fp, mode) as f:
+                    yield _yielded(f, None, yield_type_hint, yield_metadata)
+                getattr(os, 'replace', os.rename)(temp_fp, path)
+            except BaseException:
+                if os.path.exists(temp_fp):
+                    os.remove(temp_fp)
+                raise
+            logger.debug('successfully closed session with file = {}'
                          .format(path))
-            with open(path, 'r{}+'.format(binary)) as pre_opened_file:
-                # extract out the file ending with the type hint, and
-                metadata = get_file_meta(pre_opened_file, truncate=True)
-                if metadata is not None:
-                    logger.debug('found velox metadata in file signature')
-
-        with open(path, mode) as f:
-            if not yield_type_hint:
-                yield f
-            else:
-                clsname = None
-                if metadata is not None:
-                    clsname = obtain_qualified_name(metadata)
-                    logger.debug(
-                        'found type hint: {} - yielding as part pf payload'
-                        .format(clsname)
-                    )
-
-                yield (f, clsname)
-
-        if yield_type_hint:
-            logger.debug('removing temporary allocations under {}'
-                         .format(tmpdir))
-            shutil.rmtree(tmpdir)
-            logger.debug('cleaned up, releasing')
-        logger.debug('successfully closed session with file = {}'.format(path))
-    else:
-        if session is None:
-            import boto3
-            session = boto3.Session()
+            return
 
-        S3 = session.resource('s3')
+        with f:
+            yield _yielded(f, metadata, yield_type_hint, yield_metadata)
 
-        # fd, temp_fp = mkstemp(suffix='.tmpfile', prefix='s3_tmp', text=False)
-        temp_dir = mkdtemp(suffix='tmpfile', prefix='s3_tmp')
+        logger.debug('successfully closed session with file = {}'.format(path))
+    else:
+        client = get_s3_client(session)
 
         bucket, key = parse_s3(path)
 
         logger.debug('detected bucket = {}, key = {}, mode = {}'.format(
             bucket, key, mode))
 
+        if read_operation and stream:
+            logger.debug('streaming {} with ranged reads'.format(path))
+            f, metadata = _open_s3_stream(client, bucket, key, binary,
+                                          name=path)
+            target = pointer_target(path, metadata)
+            if target is not None:
+                f.close()
+                logger.debug('following pointer record to {}'.format(target))
+                f, _ = _open_s3_stream(client, *parse_s3(target),
+                                       binary=binary, name=target)
+            elif _is_pointer(metadata):
+                # chunks are fetched up front rather than streamed
+                f.close()
+                with _open_chunked(path, metadata, binary, session=session,
+                                   delete_on_close=delete_on_close) as f:
+                    yield _yielded(f, metadata, yield_type_hint,
+                                   yield_metadata)
+                return
+            with f:
+                yield _yielded(f, metadata, yield_type_hint, yield_metadata)
+            logger.debug('closed stream from {}'.format(path))
+            return
+
+        if stream:
+            logger.debug('streaming {} with a multipart upload'.format(path))
+            writer = _S3MultipartWriter(
+                client, bucket, key,
+                part_size=_SETTINGS['multipart_part_size'],
+                workers=_SETTINGS['transfer_workers'], name=path
+            )
+            f = writer
+            if not binary:
+                f = io.TextIOWrapper(io.BufferedWriter(writer))
+            try:
+                yield _yielded(f, None, yield_type_hint, yield_metadata)
+                f.close()
+            except BaseException:
+                writer.abort()
+                raise
+            logger.debug('closed stream to {}'.format(path))
+            return
+
+        # fd, temp_fp = mkstemp(suffix='.tmpfile', prefix='s3_tmp', text=False)
+        temp_dir = mkdtemp(suffix='tmpfile', prefix='s3_tmp')
+
         _, filename = os.path.split(key)
         temp_fp = os.path.join(temp_dir, filename)
 
         if read_operation:
+            # we find the velox footer (and the object size) with a single
+            # small request, so we can leave the footer out of the download
+            metadata, payload_length = _read_s3_footer(client, bucket, key)
+            if _is_pointer(metadata) and metadata.get('blob') is None:
+                shutil.rmtree(temp_dir)
+                with _open_chunked(path, metadata, binary, session=session,
+                                   delete_on_close=delete_on_close) as f:
+                    yield _yielded(f, metadata, yield_type_hint,
+                                   yield_metadata)
+                return
+            source = pointer_target(path, metadata)
+            if source is not None:
+                logger.debug('following pointer record to {}'.format(source))
+                payload_length = _read_s3_footer(client,
+                                                 *parse_s3(source))[1]
+            else:
+                source = path
+
             logger.debug('initiating download to tempfile')
-            S3.Bucket(bucket).download_file(key, temp_fp)
+            download_file(source, temp_fp, session=session,
+                          length=payload_length)
             logger.debug('download to tempfile successful')
+        else:
+            metadata = None
 
-            with open(temp_fp, 'r{}+'.format(binary)) as pre_opened_file:
-                # extract out the file ending with the type hint, and
-                metadata = get_file_meta(pre_opened_file, truncate=True)
-                if metadata is not None:
-                    logger.info('found velox metadata in file signature')
+        if read_operation and metadata is not None and \
+                metadata.get('codec') is not None:
+            f = _decode_payload(open(temp_fp, 'rb'), metadata, binary)
+        else:
+            f = open(temp_fp, mode)
 
-        with open(temp_fp, mode) as f:
+        with f:
             logger.debug('yielding {} with mode {}'.format(temp_fp, mode))
-            if not yield_type_hint:
-                yield f
-            else:
-                clsname = None
-                if metadata is not None:
-                    clsname = obtain_qualified_name(metadata)
-                    logger.debug(
-                        'found type hint: {} - yielding as part pf payload'
-                        .format(clsname)
-                    )
-                yield (f, clsname)
+            yield _yielded(f, metadata, yield_type_hint, yield_metadata)
             logger.debug('closing {}'.format(temp_fp))
 
         if not read_operation:
-            logger.debug('uploading {} to bucket = {} with key = {}'.format(
-                temp_fp, bucket, key))
-            S3.Bucket(bucket).upload_file(temp_fp, key)
+            upload_file(temp_fp, path, session=session)
 
         if delete_on_close:
             logger.debug('removing temporary allocations')
             shutil.rmtree(temp_dir)
             logger.debug('cleaned up, releasing')
 
-__all__ = ['get_aware_filepath', 'ensure_exists']
+
+__all__ = ['get_aware_filepath', 'ensure_exists', 'configure', 'upload_file',
+           'download_file', 'get_s3_client', 'read_metadata', 'store_blob',
+           'read_validator', 'fetch_file']
@@ -55,34 +55,202 @@ verify it's integrity.
 
     # do things with clf...
 <!--end_code-->
+
+Binaries are written as the raw serialized payload between a small header and
+a trailer holding the SHA256 of the payload and an HMAC-SHA256 keyed with the
+secret. On load, the trailer is verified by streaming over the payload in
+chunks, and only then is the payload handed to
+the deserialization hook, so no full in-memory copies are needed. Binaries
+written by earlier versions of Velox (as `itsdangerous` envelopes) remain
+readable.
 """
+import binascii
+from contextlib import contextmanager
+from hashlib import sha256
+import hmac
 import dill
 import io
+import json
 import logging
+import struct
 
 import itsdangerous
 from semantic_version import Version as SemVer, Spec as Specification
 
+from . import cache
+from . import compression
 from . import exceptions
 from . import filesystem
+from . import serialization
 from . import tools
 
 
 DEFAULT_SECRET = 'velox'
 
+VELOX_LITE_MAGIC = b'VXLITE02'
+
+_HEADER_LENGTH = struct.Struct('>I')
+_PAYLOAD_LENGTH = struct.Struct('>Q')
+_DIGEST_SIZE = sha256().digest_size
+_TRAILER_SIZE = _PAYLOAD_LENGTH.size + 2 * _DIGEST_SIZE
+
+_VERIFY_CHUNK_SIZE = 1024 * 1024
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
 
 logger = logging.getLogger(__name__)
 
 
 def _get_deserialization_hook(classname):
     if classname == 'dill':
-        return dill.load
+        return serialization.load
     else:
         classdef = tools.import_from_qualified_name(classname)
         return classdef._load
 
 
-def _get_serialization_hook(obj):
+def _signing_key(secret):
+    secret = secret or DEFAULT_SECRET
+    if not isinstance(secret, bytes):
+        secret = secret.encode('utf-8')
+    return secret
+
+
+class _SigningWriter(io.RawIOBase):
+    """
+    Write-only file object that writes a velox lite binary to `fileobject`:
+    the magic bytes and a length-prefixed JSON `header` up front, then
+    everything written to it as the payload, and on close, a trailer with the
+    payload length, the SHA256 of the payload, and an HMAC-SHA256 (keyed with
+    `secret`) of all the bytes before it. The (hex) SHA256 of the payload is
+    available as `sha` once closed.
+    """
+
+    def __init__(self, fileobject, secret, header):
+        self._fileobject = fileobject
+        self._mac = hmac.new(_signing_key(secret), digestmod=sha256)
+        self._payload_sha = sha256()
+        self._payload_length = 0
+        self.sha = None
+        self.name = getattr(fileobject, 'name', None)
+        header = json.dumps(header, sort_keys=True).encode('utf-8')
+        self._sign(VELOX_LITE_MAGIC + _HEADER_LENGTH.pack(len(header)) +
+                   header)
+
+    def _sign(self, data):
+        self._mac.update(data)
+        self._fileobject.write(data)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        n = memoryview(b).nbytes
+        self._payload_sha.update(b)
+        self._sign(b)
+        self._payload_length += n
+        return n
+
+    def tell(self):
+        return self._payload_length
+
+    def close(self):
+        if not self.closed:
+            self._sign(_PAYLOAD_LENGTH.pack(self._payload_length) +
+                       self._payload_sha.digest())
+            self._fileobject.write(self._mac.digest())
+            self.sha = self._payload_sha.hexdigest()
+        super(_SigningWriter, self).close()
+
+    def discard(self):
+        """Closes the writer without writing the trailer."""
+        super(_SigningWriter, self).close()
+
+
+def _open_signed_payload(fileobject, secret):
+    """
+    Verifies the velox lite binary in the seekable `fileobject` against
+    `secret`, streaming over it in chunks, and returns a `(header, payload,
+    sha)` tuple, where `payload` is a file object over the (verified) payload
+    and `sha` is the SHA256 recorded for it when it was saved. Returns `None`
+    if `fileobject` holds a binary in the legacy `itsdangerous` format.
+
+    Raises:
+    -------
+
+    * `RuntimeError` if the binary is malformed, or does not verify against
+        `secret`.
+    """
+    fileobject.seek(0)
+    magic = fileobject.read(len(VELOX_LITE_MAGIC))
+    if magic != VELOX_LITE_MAGIC:
+        fileobject.seek(0)
+        return None
+
+    mac = hmac.new(_signing_key(secret), digestmod=sha256)
+
+    header_length = fileobject.read(_HEADER_LENGTH.size)
+    if len(header_length) != _HEADER_LENGTH.size:
+        raise RuntimeError('Malformed velox lite binary')
+    (n, ) = _HEADER_LENGTH.unpack(header_length)
+    header = fileobject.read(n)
+    mac.update(magic + header_length + header)
+    payload_start = fileobject.tell()
+
+    fileobject.seek(0, io.SEEK_END)
+    size = fileobject.tell()
+    trailer_start = size - _TRAILER_SIZE
+    if len(header) != n or trailer_start < payload_start:
+        raise RuntimeError('Malformed velox lite binary')
+    fileobject.seek(trailer_start)
+    payload_length = fileobject.read(_PAYLOAD_LENGTH.size + _DIGEST_SIZE)
+    digest = fileobject.read(_DIGEST_SIZE)
+    (length, ) = _PAYLOAD_LENGTH.unpack(payload_length[:_PAYLOAD_LENGTH.size])
+    if payload_start + length != trailer_start:
+        raise RuntimeError('Malformed velox lite binary')
+
+    # Nothing gets deserialized before the whole binary has been verified
+    fileobject.seek(payload_start)
+    buf = memoryview(bytearray(min(_VERIFY_CHUNK_SIZE, length) or 1))
+    remaining = length
+    while remaining:
+        chunk = fileobject.readinto(buf[:min(len(buf), remaining)])
+        if not chunk:
+            raise RuntimeError('Malformed velox lite binary')
+        mac.update(buf[:chunk])
+        remaining -= chunk
+    mac.update(payload_length)
+
+    if not hmac.compare_digest(mac.digest(), digest):
+        raise RuntimeError(
+            'Mismatched secret - deserialization not authorized'
+        )
+
+    sha = binascii.hexlify(payload_length[_PAYLOAD_LENGTH.size:])
+    sha = sha.decode('ascii')
+    payload = filesystem.open_view(fileobject, payload_start, length)
+    return json.loads(header.decode('utf-8')), payload, sha
+
+
+def _load_legacy(fileobject, secret):
+    """
+    Loads a binary written as an `itsdangerous` envelope by an earlier
+    version of Velox, returning a `(header, payload, sha)` tuple like
+    `velox.lite._open_signed_payload`.
+    """
+    serializer = itsdangerous.Serializer(secret or DEFAULT_SECRET,
+                                         serializer=dill)
+    try:
+        data = serializer.load(fileobject)
+    except itsdangerous.BadSignature:
+        raise RuntimeError(
+            'Mismatched secret - deserialization not authorized'
+        )
+    header = {'class': data['class'], 'codec': data.get('codec')}
+    return header, io.BytesIO(data['data']), tools.sha(data['data'])
+
+
+def _get_serialization_hook(obj, out_of_band=False):
     if hasattr(obj, '_save'):
         if not callable(obj._save):
             raise TypeError(
@@ -94,8 +262,10 @@ def _get_serialization_hook(obj):
     # TODO(lukedeo): create multiple cases here where we can handle custom
     # types like Keras models or PyTorch modules.
     else:
-        serialization_hook = lambda buf: dill.dump(obj, buf)
-        # We don't need to know the object class here, we just use dill
+        serialization_hook = lambda buf: serialization.dump(
+            obj, buf, out_of_band=out_of_band)
+        # We don't need to know the object class here, we just use dill (whose
+        # output `velox.serialization.load` also understands)
         deserialization_class = 'dill'
 
     return serialization_hook, deserialization_class
@@ -112,15 +282,33 @@ def _seems_like_nonlite_velox_obj(prefix, name):
     return False
 
 
-def save_object(obj, name, prefix, versioned=False, secret=None, bump='patch'):
+@contextmanager
+def _local_copy(filename, prefix, local_cache_dir):
+    """
+    Yields the path to load `filename` from, which is a copy held in the
+    cache at `local_cache_dir` while loading, if there is one.
+    """
+    if local_cache_dir is None:
+        yield filename
+        return
+    # unlike managed objects, lite binaries aren't named uniquely, so the
+    # prefix they come from is part of the cache key
+    key = '{}_{}'.format(tools.sha(prefix)[:12], filename.split('/')[-1])
+    with cache.get_cache(local_cache_dir).fetched(filename, key=key) as path:
+        logger.debug('will load from local copy {}'.format(path))
+        yield path
+
+
+def save_object(obj, name, prefix, versioned=False, secret=None, bump='patch',
+                codec=None, codec_level=None, out_of_band=False):
     """
     Velox-managed method to save generic Python objects. Affords the ability
     to version saved objects to a common prefix, as well as to sign binaries
     with a secret.
 
     * If `obj` has a callable method called `_save`, it will call the method
-        to save the object with the signature `obj._save(buf)` where buf is an
-        object of type `io.BytesIO`.
+        to save the object with the signature `obj._save(buf)` where buf is a
+        writable (but not seekable) file object.
 
     * Else, will use the fantastic `dill` library to save the
         object generically.
@@ -136,7 +324,7 @@ def save_object(obj, name, prefix, versioned=False, secret=None, bump='patch'):
     -----
 
     * `obj (object)`: Object that is either pickle-able / dill-able or
-        defines a `_save(...)` method to serialize to a `io.BytesIO` object.
+        defines a `_save(...)` method to serialize to a file object.
 
     * `name (str)`: The name to save the object under at the `prefix` location.
 
@@ -154,6 +342,19 @@ def save_object(obj, name, prefix, versioned=False, secret=None, bump='patch'):
         version bump to save the `obj` with. Consult with the
         [semantic versioning website](https://semver.org/) for more information.
 
+    * `codec (str)`: the compression codec to compress the serialized object
+        with (see `velox.compression`). Defaults to the codec `obj` was
+        registered with, if it is a `velox.obj.VeloxObject`, and to no
+        compression otherwise.
+
+    * `codec_level (int)`: the compression level to use with `codec`, or
+        `None` for the codec default.
+
+    * `out_of_band (bool)`: whether to write large buffers held by `obj`
+        (such as NumPy arrays) as raw segments after the pickle stream, so
+        that they are loaded without being copied. See
+        `velox.serialization`. Ignored if `obj` defines `_save`.
+
     Returns:
     --------
 
@@ -165,9 +366,18 @@ def save_object(obj, name, prefix, versioned=False, secret=None, bump='patch'):
 
     * `IOError` if attempting to save an unversioned file that already exists.
 
-    * `ValueError` if a semantic version string cannot be parsed.
+    * `ValueError` if a semantic version string cannot be parsed, or if
+        `codec` is not an available codec.
     """
-    serialization_hook, deserialization_class = _get_serialization_hook(obj)
+    serialization_hook, deserialization_class = _get_serialization_hook(
+        obj, out_of_band=out_of_band)
+
+    if codec is None:
+        codec = getattr(obj, '_codec', None)
+        if codec_level is None:
+            codec_level = getattr(obj, '_codec_level', None)
+    if codec is not None:
+        compression.check_codec(codec)
 
     # Managed objects can either be versioned or unversioned - in the
     # versioned case, they will always have the name
@@ -216,27 +426,41 @@ def save_object(obj, name, prefix, versioned=False, secret=None, bump='patch'):
 
     logger.debug('will use filename: {} for serialization'.format(filename))
     filesystem.ensure_exists(prefix)
-    buf = io.BytesIO()
-    serialization_hook(buf)
-    buf = buf.getvalue()
 
-    data = {
-        'data': buf,
-        'class': deserialization_class
-    }
+    header = {'class': deserialization_class}
+    if codec is not None:
+        header['codec'] = codec
 
-    serializer = itsdangerous.Serializer(secret or DEFAULT_SECRET,
-                                         serializer=dill)
     if secret:
         logger.debug('specified SECRET=<{}>'.format('*' * len(secret)))
-    with filesystem.get_aware_filepath(filename, 'wb') as fileobject:
-        serializer.dump(data, fileobject)
+
+    # The object is serialized straight into the destination (through a
+    # multipart upload on S3), signing it on the fly, so that memory use
+    # doesn't grow with the size of the object.
+    with filesystem.get_aware_filepath(filename, 'wb',
+                                       stream=True) as fileobject:
+        signer = _SigningWriter(fileobject, secret, header)
+        writer = io.BufferedWriter(signer, buffer_size=_WRITE_BUFFER_SIZE)
+        try:
+            if codec is not None:
+                logger.debug('compressing with codec {}'.format(codec))
+                with compression.CompressingWriter(writer, codec,
+                                                   codec_level) as compressor:
+                    serialization_hook(compressor)
+            else:
+                serialization_hook(writer)
+        except BaseException:
+            signer.discard()
+            raise
+        writer.close()
+    logger.debug('saved payload with sha {}'.format(signer.sha))
+    filesystem.update_manifest(filename)
 
     return filename
 
 
 def load_object(name, prefix, versioned=False, version=None, secret=None,
-                return_sha=False):
+                return_sha=False, local_cache_dir=None, mmap=False):
     """
     Velox-managed method to load generic Python objects that have been saved
     via `velox.lite.save_object`. Affords the ability to load versioned
@@ -272,6 +496,15 @@ def load_object(name, prefix, versioned=False, version=None, secret=None,
     * `return_sha (bool)`: Whether or not to return the sha as part of the
         payload. If True, returns (obj, sha), else, just returns obj.
 
+    * `local_cache_dir (str | velox.cache.LocalCache)`: cache directory (or
+        cache, see `velox.cache.get_cache`) to keep a copy of the binary in.
+        If the binary is already in the cache, it is loaded from there.
+
+    * `mmap (bool)`: whether to map the arrays of objects saved with
+        `out_of_band=True` read-only from the binary (or from its copy in
+        `local_cache_dir`) rather than reading them into memory, so that
+        processes loading the same binary share them.
+
     Returns:
     --------
 
@@ -287,51 +520,56 @@ def load_object(name, prefix, versioned=False, version=None, secret=None,
     * `velox.exceptions.RuntimeError` if `secret` does not match the secret
         that was used to save the object or if a pinned version load is
         attempted with an unversioned loading scheme.
+
+    * `ValueError` if `mmap` is requested for a binary on S3 without a
+        `local_cache_dir`.
     """
+    if mmap and local_cache_dir is None and filesystem.is_s3_path(prefix):
+        raise ValueError('memory-mapped loads from S3 require a '
+                         'local_cache_dir to map the binary from')
     if version and not versioned:
         raise RuntimeError('Cannot perform a search against a specific '
                            'version with unversioned loading scheme')
-    try:
-        if versioned:
-            matching_files = filesystem.find_matching_files(
-                prefix=prefix,
-                specifier='{}-v*'.format(name)
+    def select_version(matching_files):
+        if not matching_files:
+            raise exceptions.VeloxConstraintError(
+                'No matching files at prefix: {} with name: {}. '
+                'Did you mean to load this binary with '
+                'an unversioned scheme?'
+                .format(prefix, name)
             )
-            if not matching_files:
+        matched_versions = [SemVer(f.split('-v')[-1])
+                            for f in matching_files]
+
+        if version:
+            best_version = Specification(version).select(matched_versions)
+            if not best_version:
                 raise exceptions.VeloxConstraintError(
-                    'No matching files at prefix: {} with name: {}. '
-                    'Did you mean to load this binary with '
-                    'an unversioned scheme?'
-                    .format(prefix, name)
+                    'No matching files at prefix: {} with '
+                    'name: {} and version: {}. '
+                    .format(prefix, name, version)
                 )
-            matched_versions = [SemVer(f.split('-v')[-1])
-                                for f in matching_files]
-
-            if version:
-                best_version = Specification(version).select(matched_versions)
-                if not best_version:
-                    raise exceptions.VeloxConstraintError(
-                        'No matching files at prefix: {} with '
-                        'name: {} and version: {}. '
-                        .format(prefix, name, version)
-                    )
-            else:
-                best_version = max(matched_versions)
-            filename = filesystem.stitch_filename(prefix,
-                                                  '{}-v{}'
-                                                  .format(name, best_version))
         else:
-            filename = filesystem.stitch_filename(prefix, name)
-            matching_files = filesystem.find_matching_files(
-                prefix=prefix,
-                specifier=name
+            best_version = max(matched_versions)
+        return '{}-v{}'.format(name, best_version)
+
+    def select_unversioned(matching_files):
+        if not matching_files:
+            raise exceptions.VeloxConstraintError(
+                'No matching files at prefix: {} with name: {}. '
+                'Did you mean to load this binary with a versioned scheme?'
+                .format(prefix, name)
             )
-            if not matching_files:
-                raise exceptions.VeloxConstraintError(
-                    'No matching files at prefix: {} with name: {}. '
-                    'Did you mean to load this binary with a versioned scheme?'
-                    .format(prefix, name)
-                )
+        return name
+
+    try:
+        if versioned:
+            filename = filesystem.resolve_matching_file(
+                prefix, '{}-v*'.format(name), select_version)
+        else:
+            filename = filesystem.resolve_matching_file(
+                prefix, name, select_unversioned)
+        filename = filesystem.stitch_filename(prefix, filename)
     # If someone is trying to use this method to load an object from a
     # non-lite version of velox, let's catch that.
     except exceptions.VeloxConstraintError as err:
@@ -340,24 +578,26 @@ def load_object(name, prefix, versioned=False, version=None, secret=None,
                         'managed object. Reverting to load_velox_object')
             from .obj import load_velox_object
             obj = load_velox_object(registered_name=name, prefix=prefix,
-                                    version_constraints=version)
+                                    version_constraints=version,
+                                    local_cache_dir=local_cache_dir,
+                                    mmap=mmap)
             return (obj, obj.current_sha) if return_sha else obj
         raise err
 
     logger.debug('will load from filename: {}'.format(filename))
-    serializer = itsdangerous.Serializer(secret or DEFAULT_SECRET,
-                                         serializer=dill)
 
-    sha = None
-    with filesystem.get_aware_filepath(filename, 'rb') as fileobject:
-        try:
-            data = serializer.load(fileobject)
-        except itsdangerous.BadSignature:
-            raise RuntimeError(
-                'Mismatched secret - deserialization not authorized'
-            )
-        sha = tools.sha(data['data'])
-        deserialization_hook = _get_deserialization_hook(data['class'])
-        obj = deserialization_hook(io.BytesIO(data['data']))
+    with _local_copy(filename, prefix, local_cache_dir) as filename, \
+            filesystem.get_aware_filepath(filename, 'rb') as fileobject:
+        signed = _open_signed_payload(fileobject, secret)
+        if signed is None:
+            logger.debug('{} is a legacy binary'.format(filename))
+            signed = _load_legacy(fileobject, secret)
+        header, payload, sha = signed
+        deserialization_hook = _get_deserialization_hook(header['class'])
+        if header.get('codec') is not None:
+            payload = compression.decompressing_reader(payload,
+                                                       header['codec'])
+        with payload, serialization.default_mmap_mode('r' if mmap else False):
+            obj = deserialization_hook(payload)
 
     return (obj, sha) if return_sha else obj
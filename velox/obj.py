@@ -9,24 +9,37 @@ instances.
 """
 
 from abc import ABCMeta, abstractmethod
-from functools import wraps
+from contextlib import contextmanager
+import datetime
+import fnmatch
+from functools import partial, wraps
 import inspect
+import io
 import logging
 import os
+import threading
 import warnings
+import weakref
 
-from apscheduler.schedulers.background import BackgroundScheduler
 from semantic_version import Version as SemVer, Spec as Specification
 import six
 
 
 from .exceptions import VeloxCreationError, VeloxConstraintError
 
-from .filesystem import (find_matching_files, ensure_exists, stitch_filename,
-                         get_aware_filepath)
+from .cache import get_cache
+from .serialization import default_mmap_mode
+from .compression import CompressingWriter, check_codec
+from .filesystem import (resolve_matching_file, confirm_listed, ensure_exists,
+                         stitch_filename, get_aware_filepath, update_manifest,
+                         is_s3_path, read_metadata, blob_tempfile, store_blob,
+                         pointer_target, content_addressed, chunked)
+from .chunking import store_chunks, fetch_cached
+from . import watching
 
 from .tools import (abstractclassmethod, timestamp, threaded, sha, fullname,
-                    import_from_qualified_name, obtain_padding_bytes)
+                    import_from_qualified_name, build_footer, file_sha256,
+                    HashingWriter)
 
 logger = logging.getLogger(__name__)
 
@@ -140,6 +153,11 @@ class VeloxObject(object):
     # we dont want duplication of model names!
     _registered_object_names = []
 
+    # set per class by `register_object`
+    _codec = None
+    _codec_level = None
+    _atomic_swap = False
+
     def __init__(self):
         """
         Base constructor for managed objects.
@@ -163,37 +181,51 @@ class VeloxObject(object):
             )
         self.__incr_underway = False
         self.__replacement = None
-        self._scheduler = BackgroundScheduler()
+        self.__active = None
+        self.__swap_lock = threading.Lock()
+        self.__calls_underway = 0
         self._job_pointer = None
         self._current_sha = None
         self._parent_instantiated = True
 
     def __del__(self):
-        if hasattr(self, '_scheduler') and self._scheduler.state:
-            self._scheduler.shutdown()
+        if getattr(self, '_job_pointer', None) is not None:
+            self._job_pointer.cancel()
         if self._increment_underway:
             if not self.__replacement.done():
                 self.__replacement.cancel()
 
     def __getstate__(self):
+        active = _active_version(self)
+        if active is not self:
+            # pickle the version that calls are being served by
+            return active.__getstate__()
         # capture what is normally pickled
         state = self.__dict__.copy()
-        del state['_scheduler']
+        del state['_job_pointer']
         del state['_current_sha']
+        state.pop('_VeloxObject__active', None)
+        state.pop('_VeloxObject__swap_lock', None)
+        state.pop('_VeloxObject__calls_underway', None)
         return state
 
     def __setstate__(self, newstate):
-        newstate['_scheduler'] = BackgroundScheduler()
+        newstate['_job_pointer'] = None
         newstate['_current_sha'] = None
+        newstate['_VeloxObject__active'] = None
+        newstate['_VeloxObject__swap_lock'] = threading.Lock()
+        newstate['_VeloxObject__calls_underway'] = 0
         self.__dict__.update(newstate)
 
     @property
     def current_sha(self):
         """
-        Defines the current SHA1 of the filename that has most recently been
-        loaded. If a file has never been loaded, this will be None.
+        Defines the identity of the file that has most recently been loaded:
+        the SHA256 of its payload, as recorded when it was saved, or for files
+        saved by earlier versions of Velox, the SHA1 of its filename. If a file
+        has never been loaded, this will be None.
         """
-        return self._current_sha
+        return _active_version(self)._current_sha
 
     @current_sha.setter
     def current_sha(self, value):
@@ -230,7 +262,7 @@ class VeloxObject(object):
         raise NotImplementedError('super-class de-serialization not allowed')
 
     @_fail_bad_init
-    def save(self, prefix=None):
+    def save(self, prefix=None, stream=False):
         """
         Saves the managed object instance using the user-defined method defined
         in `_save`.
@@ -242,23 +274,119 @@ class VeloxObject(object):
             save the managed object to. If not passed will default to the
             value of the `VELOX_ROOT` env var if set, else, will fall back to
             the current working directory.
+
+        * `stream (bool)`: when saving to S3, whether to hand `_save` a file
+            object that uploads parts in parallel while it is being written
+            to, rather than a temporary file that is uploaded afterwards.
+            Only suitable for `_save` methods that write sequentially to the
+            file object rather than to its name.
+
+        If a `codec` was passed to `velox.obj.register_object`, `_save` is
+        handed a file object that compresses what is written to it on the fly.
+
+        The payload is followed by a footer recording metadata about it (see
+        `velox.filesystem.read_metadata`). If `_save` returns a list of
+        `(offset, length)` segments of its output (as
+        `velox.serialization.dump` does), they are recorded in the footer too.
+
+        If content addressing is enabled through
+        `velox.filesystem.configure`, the file is instead stored once per
+        payload hash in the content-addressed store at the prefix (unless an
+        identical payload was saved before), and the file saved under the
+        timestamped name is a small pointer record to it. If chunking is
+        enabled, the payload is split into chunks that are each stored once
+        (see `velox.chunking`), and the pointer record lists them. Either
+        way, the payload is then staged in a local temporary file, whatever
+        `stream` is.
+
+        An object hot swapped atomically (see `velox.obj.register_object`)
+        saves the version that it has swapped in.
         """
+        active = _active_version(self)
+        if active is not self:
+            return active.save(prefix=prefix, stream=stream)
 
         outpath = self.savepath(prefix=prefix)
         logger.debug('assigned unique filepath: {}'.format(outpath))
 
-        with get_aware_filepath(outpath, 'wb') as fileobject:
-            self._save(fileobject)
-            # Make sure we're at the end of the file when we write out the
-            # padding bytes (for example, if the overridden _save method uses
-            # the filename rather than the handle itself)
-            fileobject.seek(0, 2)
-            fileobject.write(obtain_padding_bytes(self))
+        if chunked() or content_addressed():
+            self._save_content_addressed(outpath)
+        else:
+            with get_aware_filepath(outpath, 'wb',
+                                    stream=stream) as fileobject:
+                self._write_object(fileobject)
+        update_manifest(outpath)
         return outpath
 
+    def _write_object(self, fileobject):
+        """
+        Writes the payload (through `_save`) and footer to `fileobject`,
+        returning the metadata recorded in the footer.
+        """
+        hasher = HashingWriter(fileobject)
+        writer = io.BufferedWriter(hasher)
+        if self._codec is not None:
+            logger.debug('compressing with codec {}'.format(self._codec))
+            with CompressingWriter(writer, self._codec,
+                                   self._codec_level) as compressor:
+                segments = self._save(compressor)
+        else:
+            segments = self._save(writer)
+        writer.flush()
+        # Make sure we're at the end of the file when we write out the
+        # footer (for example, if the overridden _save method uses the
+        # filename rather than the handle itself)
+        fileobject.seek(0, 2)
+        payload_length = fileobject.tell()
+        content_sha = hasher.hexdigest()
+        if payload_length != hasher.length or content_sha is None:
+            fileobject.flush()
+            content_sha = file_sha256(fileobject.name)
+        metadata = self._footer_metadata(payload_length, content_sha,
+                                         segments)
+        fileobject.write(build_footer(metadata))
+        return metadata
+
+    def _save_content_addressed(self, outpath):
+        prefix = get_prefix(outpath)
+        temp_fp = blob_tempfile(prefix)
+        try:
+            with open(temp_fp, 'wb') as fileobject:
+                metadata = self._write_object(fileobject)
+            if chunked():
+                metadata['chunks'] = store_chunks(temp_fp, prefix,
+                                                  metadata['payload_length'])
+            else:
+                blob, stored = store_blob(temp_fp, prefix,
+                                          metadata['sha256'])
+                logger.debug('{} blob {}'.format(
+                    'stored' if stored else 'reusing', blob))
+                metadata['blob'] = metadata['sha256']
+        finally:
+            if os.path.exists(temp_fp):
+                os.remove(temp_fp)
+
+        with get_aware_filepath(outpath, 'wb') as fileobject:
+            fileobject.write(build_footer(metadata))
+
+    def _footer_metadata(self, payload_length, content_sha, segments=None):
+        name, version = self.registered_name.rsplit('_v', 1)
+        metadata = {
+            'class': fullname(self),
+            'codec': self._codec,
+            'payload_length': payload_length,
+            'sha256': content_sha,
+            'registered_name': name,
+            'version': version,
+            'created': datetime.datetime.utcnow().isoformat() + 'Z',
+        }
+        if isinstance(segments, list) and self._codec is None:
+            metadata['segments'] = [list(segment) for segment in segments]
+        return metadata
+
     @classmethod
     def load(cls, prefix=None, specifier=None, skip_sha=None,
-             local_cache_dir=None):
+             local_cache_dir=None, stream=False, mmap=False):
         """
         Loads a managed object instance using the user-defined method defined
         in `_load`.
@@ -274,13 +402,25 @@ class VeloxObject(object):
         * `specifier (str)`: any substrings in the timestamp (as generated by
         `velox.tools.timestamp`) to explicitly search for.
 
-        * `skip_sha (str)`: define a filename SHA1 to skip over.
+        * `skip_sha (str)`: define a content SHA256 (or, for files saved by
+            earlier versions of Velox, a filename SHA1) to skip over. See
+            `velox.obj.VeloxObject.current_sha`.
 
-        * `local_cache_dir (str)`: cache directory to dump a version of the
-            file from when loading. If the promotory version matches an
+        * `local_cache_dir (str | velox.cache.LocalCache)`: cache directory
+            (or cache, see `velox.cache.get_cache`) to dump a version of the
+            file to when loading. If the promotory version matches an
             identifier in the cache, will load from the cache instead
 
+        * `stream (bool)`: when loading from S3, whether to hand `_load` a
+            file object that streams the blob with ranged reads rather than
+            a fully downloaded temporary file. Only suitable for `_load`
+            methods that read from the file object rather than its name.
 
+        * `mmap (bool)`: whether to map the arrays of objects serialized with
+            `velox.serialization` (for example, through
+            `velox.wrapper.SimplePickle`) read-only from the file (or from its
+            copy in `local_cache_dir`) rather than reading them into memory,
+            so that processes loading the same file share them.
 
         Raises:
         -------
@@ -289,88 +429,97 @@ class VeloxObject(object):
             for which a skip was requested
         * `TypeError` if the user-defined `_load` function loads an object that
             does not inherit from `velox.obj.VeloxObject`.
+        * `ValueError` if `mmap` is requested for an object on S3 without a
+            `local_cache_dir`.
 
         """
 
         filepath = cls.loadpath(prefix=prefix, specifier=specifier)
-        filesha = sha(get_filename(filepath))
+        return _load_from_filepath(filepath, cls=cls, skip_sha=skip_sha,
+                                   local_cache_dir=local_cache_dir,
+                                   stream=stream, mmap=mmap)
 
-        if skip_sha == filesha:
-            raise VeloxConstraintError('found sha: {} when sha was explicitly '
-                                       'blacklisted'.format(skip_sha))
-
-        logger.debug('retrieving from filepath: {}'.format(filepath))
-
-        if local_cache_dir is not None:
-            ensure_exists(local_cache_dir)
-            file_identifier = os.path.basename(filepath)
-
-            local_copy = os.path.join(local_cache_dir, file_identifier)
-
-            if os.path.isfile(local_copy):
-                # if the file we want to load is on the local filesystem, load
-                # from there instead
-                filepath = local_copy
-                logger.info('found target file in local cache. will load {} '
-                            'from local copy'.format(file_identifier))
+    def _increment(self):
+        future = self.__replacement
+        if future is None:
+            return
+        replacement = future.result()
+
+        with self.__swap_lock:
+            if self.__replacement is not future:
+                # another thread got to swap this version in first
+                return
+
+            if self.current_sha != replacement.current_sha:
+                logger.debug('will aspire to new version')
+                logger.debug('current sha: {}'.format(self.current_sha))
+                logger.debug('    new sha: {}'
+                             .format(replacement.current_sha))
+
+                if self._atomic_swap:
+                    # calls resolve the active version once, so swapping
+                    # this single reference swaps every attribute at once
+                    self.__active = replacement
+                    if not self.__calls_underway:
+                        self._release_managed_state()
+                else:
+                    for k, v in replacement.__dict__.items():
+                        if (k != '_job_pointer') and \
+                                (not k.startswith('_VeloxObject__')):
+                            self.__dict__[k] = v
             else:
-                logger.info('will dump to {} as cache copy'.format(local_copy))
-
-        with get_aware_filepath(filepath, 'rb', yield_type_hint=True) as \
-                (fileobject, inferred_type):
-            if inferred_type is not None:
-                logger.debug('found inferred_type={}'.format(inferred_type))
-
-            obj = cls._load(fileobject)
-            if not issubclass(type(obj), VeloxObject):
-                raise TypeError('loaded object of type {} must inherit from '
-                                'VeloxObject'.format(cls))
-            obj.current_sha = filesha
-
-            if local_cache_dir is not None and not os.path.isfile(local_copy):
-                logger.info('dumping pulled copy to local filesystem')
-                fileobject.seek(0)
-
-                with open(local_copy, 'wb') as fp:
-                    fp.write(fileobject.read())
-
-                logger.info('cache op successful')
-
-        return obj
+                logger.debug('found matching sha: {}'
+                             .format(self.current_sha))
+                logger.debug('will skip increment')
 
-    def _increment(self):
-        replacement = self.__replacement.result()
-
-        if self._current_sha != replacement.current_sha:
-            logger.debug('will aspire to new version')
-            # logger.debug('current sha: {}'.format(self._current_sha))
-            logger.debug('current sha: {}'.format(self.current_sha))
-            logger.debug('    new sha: {}'.format(replacement.current_sha))
-
-            for k, v in replacement.__dict__.items():
-                if (k not in {'_scheduler', '_job_pointer'}) and \
-                        (not k.startswith('__')):
-                    self.__dict__[k] = v
-        else:
-            logger.debug('found matching sha: {}'.format(self._current_sha))
-            logger.debug('will skip increment'.format(self._current_sha))
+            self.__incr_underway = False
+            self.__replacement = None
 
-        self.__incr_underway = False
-        self.__replacement = None
+    def _begin_call(self):
+        # resolves the version a call is served by, counting the calls
+        # served by this object itself so that its state is only released
+        # once none of them is still running
+        active = self.__dict__.get('_VeloxObject__active')
+        if active is not None:
+            return active
+        with self.__swap_lock:
+            if self.__active is not None:
+                return self.__active
+            self.__calls_underway += 1
+            return self
+
+    def _end_call(self, active):
+        if active is not self:
+            return
+        with self.__swap_lock:
+            self.__calls_underway -= 1
+            if self.__active is not None and not self.__calls_underway:
+                self._release_managed_state()
+
+    def _release_managed_state(self):
+        # once calls are served by a swapped in version, the state this
+        # object was created (or last loaded) with is never read again
+        for k in list(self.__dict__):
+            if k not in _BOOKKEEPING_ATTRIBUTES and \
+                    not k.startswith('_VeloxObject__'):
+                del self.__dict__[k]
 
     @threaded
-    def __load_async(self, prefix, specifier, skip_sha):
+    def __load_async(self, filepath, skip_sha):
         logger.debug('specifying a skip_sha = {}'.format(skip_sha))
 
-        newobj = self.__class__.load(prefix, specifier, skip_sha=skip_sha)
+        newobj = _load_from_filepath(filepath, cls=self.__class__,
+                                     skip_sha=skip_sha)
         self.__incr_underway = False
         return newobj
 
-    def __reload(self, prefix, specifier):
+    def __reload(self, prefix, specifier, filepath=None):
 
         self.__incr_underway = True
         try:
-            self.__replacement = self.__load_async(prefix, specifier,
+            if filepath is None:
+                filepath = self.loadpath(prefix=prefix, specifier=specifier)
+            self.__replacement = self.__load_async(filepath,
                                                    self.current_sha)
             self._increment()
 
@@ -378,9 +527,15 @@ class VeloxObject(object):
             logger.debug('reload skipped. message: {}'.format(ve.args[0]))
             self.__replacement = None
             self.__incr_underway = False
+        except Exception:
+            # leave nothing behind that would fail every later call, so that
+            # the next reload starts afresh
+            self.__replacement = None
+            self.__incr_underway = False
+            raise
 
     def reload(self, prefix=None, specifier=None, scheduled=False,
-               **interval_trigger_args):
+               notify=False, **interval_trigger_args):
         """
         Defines the scheme by which to reload (hot swap) in-place. A scheduled
         reload can be canceled with a call to
@@ -400,11 +555,22 @@ class VeloxObject(object):
         * `scheduled (bool)`: whether or not to run this as a scheduled and
             seperate threaded process (`True`) or to simply to an in-place swap
             (`False`). Only `scheduled=True` can guarantee zero-downtime.
+            Scheduled reloads of all objects watching the same prefix at the
+            same interval share a single listing of the prefix per interval
+            (see `velox.watching`), and an object is only reloaded when a
+            file it could load from appears.
+
+        * `notify (bool)`: for a scheduled reload from a local prefix,
+            whether or not to reload as soon as a new file is completely
+            written to the prefix (through filesystem notifications) rather
+            than by polling the prefix (see `velox.watching.watch`). Where
+            notifications are unavailable, this falls back to polling.
 
         * `interval_trigger_args`: additional arguments to pass the the
-            `BackgroundScheduler` object. Most commonly, you can pass something
-            like `minutes=2` to schedule a poll to the prefix location every
-            two minutes.
+            interval trigger of the reload scheduler shared by all managed
+            objects (see `velox.scheduling`). Most commonly, you can pass
+            something like `minutes=2` to schedule a poll to the prefix
+            location every two minutes.
 
         Raises:
         -------
@@ -414,19 +580,25 @@ class VeloxObject(object):
         """
 
         if scheduled:
-            if not self._scheduler.state:
-                self._scheduler.start()
             if self._job_pointer is not None:
                 raise ValueError('Found already-running job: '
                                  '{}'.format(self._job_pointer.id))
             logger.debug('scheduling with config: '
                          '{}'.format(interval_trigger_args))
 
-            self._job_pointer = self._scheduler.add_job(
-                func=self.__reload,
-                args=(prefix, specifier),
-                trigger='interval',
-                max_instances=1,
+            if prefix is None:
+                prefix = _default_prefix()
+
+            # the watcher only holds a weak reference to us, so that a
+            # scheduled reload doesn't keep an otherwise unused object alive
+            self._job_pointer = watching.watch(
+                prefix,
+                match=_version_matcher(
+                    _file_pattern(get_registration_name(
+                        self.__registered_name), specifier),
+                    _version_specification(self._version_spec)),
+                callback=partial(_watched_reload, weakref.ref(self), prefix),
+                notify=notify,
                 **interval_trigger_args
             )
             logger.debug('launched job {}: {}'
@@ -449,7 +621,7 @@ class VeloxObject(object):
         if self._job_pointer is None:
             raise ValueError('no available job to cancel.')
 
-        self._scheduler.remove_all_jobs()
+        self._job_pointer.cancel()
         self._job_pointer = None
 
     def _register_name(self, name):
@@ -546,6 +718,46 @@ class VeloxObject(object):
         )
 
 
+def _version_matcher(pattern, version_constraints):
+    def match(filename):
+        if not fnmatch.fnmatch(filename, pattern):
+            return False
+        try:
+            return version_constraints is None or \
+                version_constraints.match(get_semver(filename))
+        except (IndexError, ValueError):
+            return False
+    return match
+
+
+def _watched_reload(ref, prefix, filenames):
+    obj = ref()
+    if obj is None:
+        # the object was collected, and its subscription cancelled with it
+        return
+    best_file = _select_best_file(filenames, obj._version_spec)
+    if not confirm_listed(prefix, best_file):
+        # the next poll lists the prefix, and hands us what is really there
+        return
+    obj._VeloxObject__reload(prefix, None,
+                             filepath=stitch_filename(prefix, best_file))
+
+
+_BOOKKEEPING_ATTRIBUTES = ('_job_pointer', '_current_sha',
+                           '_parent_instantiated')
+
+
+def _active_version(obj):
+    """
+    Returns the version of `obj` that calls are served by: the replacement
+    most recently swapped in by an atomic hot swap, or `obj` itself.
+    """
+    # looked up in the instance dict, so as not to recurse into
+    # `__getattr__` on objects that predate atomic swaps
+    active = obj.__dict__.get('_VeloxObject__active')
+    return obj if active is None else active
+
+
 def _zero_downtime(fn):
     @wraps(fn)
     def wrapped(*args, **kwargs):
@@ -554,6 +766,12 @@ def _zero_downtime(fn):
         if hasattr(slf, '_needs_increment') and slf._needs_increment:
             logger.info('model version increment needed')
             slf._increment()
+        if getattr(type(slf), '_atomic_swap', False):
+            active = slf._begin_call()
+            try:
+                return fn(active, *args[1:], **kwargs)
+            finally:
+                slf._end_call(active)
         return fn(*args, **kwargs)
 
     if six.PY3:
@@ -563,6 +781,20 @@ def _zero_downtime(fn):
     return wrapped
 
 
+def _skip_internal_attributes(getattr_fn):
+    @wraps(getattr_fn)
+    def wrapped(self, name):
+        # nothing can be delegated while an object is being set up (for
+        # example, unpickled), and neither can internal attributes or failed
+        # class attributes (such as properties) without recursing
+        if '_parent_instantiated' not in self.__dict__ or \
+                name.startswith('_VeloxObject__') or \
+                name in _BOOKKEEPING_ATTRIBUTES or hasattr(type(self), name):
+            raise AttributeError(name)
+        return getattr_fn(self, name)
+    return wrapped
+
+
 class register_object(object):
 
     """
@@ -599,7 +831,8 @@ class register_object(object):
     """
 
     def __init__(self, registered_name, version='0.1.0-alpha',
-                 version_constraints=None):
+                 version_constraints=None, codec=None, codec_level=None,
+                 atomic_swap=False):
         """ Decorates an object with the required attributes to be managed by
         Velox. Adds zero-downtime reloading to all non-velox-managed
         functionality.
@@ -612,12 +845,26 @@ class register_object(object):
         * `version_constraints (str | list)`: a Sem Ver version constraint
             string  or list of strings specifying versioning restrictions for
             loading.
+        * `codec (str)`: the compression codec to save instances with (see
+            `velox.compression`). If `None`, instances are saved uncompressed.
+        * `codec_level (int)`: the compression level to use with `codec`, or
+            `None` for the codec default.
+        * `atomic_swap (bool)`: whether to hot swap reloaded versions by
+            replacing a single reference to them, rather than by copying
+            their attributes one by one. Every call to a public method is
+            then served by one version throughout, even while a reload swaps
+            in another. Only the attributes read through methods (including
+            `__getattr__`, which is then served by the active version like
+            public methods are) follow swaps. Once a version is swapped in,
+            the object lets go of its own copy of them, so they can no
+            longer be read directly off of it.
 
         Raises:
         -------
 
         * `ValueError` if an invalid SemVer string is passed to either the
-            `version` or `version_constraints` keyword arguments.
+            `version` or `version_constraints` keyword arguments, or if
+            `codec` is not an available codec.
 
         * (on `__call__` invocation) `velox.exceptions.VeloxCreationError` if
             `'{registered_name}_v{version}'` is not globally unique.
@@ -631,6 +878,12 @@ class register_object(object):
         except ValueError:
             raise ValueError('Invalid SemVer string: {}'.format(version))
 
+        if codec is not None:
+            check_codec(codec)
+        self.codec = codec
+        self.codec_level = codec_level
+        self.atomic_swap = atomic_swap
+
         if registered_name in VeloxObject._registered_object_names:
             raise VeloxCreationError('Already a registered class named {}'
                                      .format(registered_name))
@@ -661,6 +914,10 @@ class register_object(object):
 
         setattr(cls, '_registered_spec', True)
 
+        setattr(cls, '_codec', self.codec)
+        setattr(cls, '_codec_level', self.codec_level)
+        setattr(cls, '_atomic_swap', self.atomic_swap)
+
         reserved_attr = {
             'save',
             'reload',
@@ -682,12 +939,20 @@ class register_object(object):
 
                     setattr(cls, attr, _fail_bad_init(_zero_downtime(fn)))
 
+        if self.atomic_swap and '__getattr__' in cls.__dict__:
+            # `__getattr__` is consulted for whatever is missing from the
+            # object, which after a swap is all of its managed state, so it
+            # has to be served by the active version too
+            logger.info('adding zero-reload downtime for __getattr__')
+            setattr(cls, '__getattr__', _skip_internal_attributes(
+                _zero_downtime(cls.__dict__['__getattr__'])))
+
         return cls
 
 
 def load_velox_object(registered_name, prefix=None, specifier=None,
                       version_constraints=None, skip_sha=None,
-                      local_cache_dir=None):
+                      local_cache_dir=None, stream=False, mmap=False):
     """
     Loads a managed object instance by only specifying a registered name (i.e.,
     what is passed to `register_object`). Allows methods to dynamically specify
@@ -710,13 +975,21 @@ def load_velox_object(registered_name, prefix=None, specifier=None,
         string or list of strings specifying versioning restrictions for
         loading.
 
-    * `skip_sha (str)`: define a filename SHA1 to skip over.
+    * `skip_sha (str)`: define a content SHA256 (or, for files saved by
+        earlier versions of Velox, a filename SHA1) to skip over. See
+        `velox.obj.VeloxObject.current_sha`.
 
-    * `local_cache_dir (str)`: cache directory to dump a version of the
-        file from when loading. If the promotory version matches an
+    * `local_cache_dir (str | velox.cache.LocalCache)`: cache directory
+        (or cache, see `velox.cache.get_cache`) to dump a version of the
+        file to when loading. If the promotory version matches an
         identifier in the cache, will load from the cache instead
 
+    * `stream (bool)`: when loading from S3, whether to stream the blob into
+        `_load` with ranged reads rather than downloading it first. See
+        `velox.obj.VeloxObject.load`.
 
+    * `mmap (bool)`: whether to map arrays read-only rather than reading them
+        into memory. See `velox.obj.VeloxObject.load`.
 
     Raises:
     -------
@@ -727,6 +1000,8 @@ def load_velox_object(registered_name, prefix=None, specifier=None,
         for which a skip was requested
     * `TypeError` if the user-defined `_load` function loads an object that
         does not inherit from `velox.obj.VeloxObject`.
+    * `ValueError` if `mmap` is requested for an object on S3 without a
+        `local_cache_dir`.
 
     """
     best_file = _find_best_file(
@@ -736,37 +1011,113 @@ def load_velox_object(registered_name, prefix=None, specifier=None,
         version_constraints=version_constraints
     )
 
-    filepath = None
-    with get_aware_filepath(best_file, 'rb', yield_type_hint=True,
-                            delete_on_close=True) as file_meta:
-        f, inferred_type = file_meta
-        if inferred_type is None:
-            raise RuntimeError((
-                'Expected type hint in file footer - this seems to be a file '
-                'saved with Velox <= 0.2.1. Please use MyClassName.load(...) '
-                'classmethod, or regenerate the file for Velox > 0.2.1.'
-            ))
-
-        # At this point, we just need to load this file! It has had it's type
-        # info stripped at this point, but that doens't matter as we'll use the
-        # classmethod to instantiate the class.
-        filepath = f.name
-
-        # make sure we load from the now-defined prefix. In addition, this
-        # means we don't have to redownload any files from S3.
-        found_prefix = get_prefix(filepath)
-        found_specifier = get_specifier(filepath)
-
-        # We use the inferred type from the file footer to access the
-        # classmethod to instantiate a new object
-        found_class = import_from_qualified_name(inferred_type)
-
-    return found_class.load(
-        prefix=prefix,
-        specifier=found_specifier,
-        skip_sha=skip_sha,
-        local_cache_dir=local_cache_dir
-    )
+    # We use the inferred type from the file footer to find the class to
+    # instantiate the object with, all while fetching the file only once.
+    return _load_from_filepath(best_file, skip_sha=skip_sha,
+                               local_cache_dir=local_cache_dir, stream=stream,
+                               mmap=mmap)
+
+
+def _load_from_filepath(filepath, cls=None, skip_sha=None,
+                        local_cache_dir=None, stream=False, mmap=False):
+    """
+    Loads a managed object instance from the (already resolved) `filepath`,
+    using the `_load` method of `cls`. If `cls` is not passed, it is inferred
+    from the type hint in the footer of the file. See
+    `velox.obj.VeloxObject.load` for the remaining arguments.
+
+    Raises:
+    -------
+
+    * `RuntimeError` if `cls` is not passed and the file was not generated
+        with `Velox>0.2.1`.
+    * `velox.exceptions.VeloxConstraintError` if we try to load from a SHA1
+        for which a skip was requested
+    * `TypeError` if the user-defined `_load` function loads an object that
+        does not inherit from `velox.obj.VeloxObject`.
+    * `ValueError` if `mmap` is requested for an object on S3 without a
+        `local_cache_dir`.
+    """
+    if mmap and local_cache_dir is None and is_s3_path(filepath):
+        raise ValueError('memory-mapped loads from S3 require a '
+                         'local_cache_dir to map the object from')
+
+    filesha = sha(get_filename(filepath))
+
+    if skip_sha == filesha:
+        raise VeloxConstraintError('found sha: {} when sha was explicitly '
+                                   'blacklisted'.format(skip_sha))
+
+    if skip_sha is not None:
+        # Compare content hashes from the footer (a single small read) before
+        # fetching anything, so that re-uploads of identical bytes under a new
+        # name are skipped just like the file we already have.
+        metadata = read_metadata(filepath)
+        if metadata is not None and metadata.get('sha256') == skip_sha:
+            raise VeloxConstraintError('found content sha: {} when sha was '
+                                       'explicitly blacklisted'
+                                       .format(skip_sha))
+
+    logger.debug('retrieving from filepath: {}'.format(filepath))
+
+    with _local_copy(filepath, local_cache_dir) as (filepath, pointer), \
+            get_aware_filepath(filepath, 'rb', yield_metadata=True,
+                               stream=stream) as (fileobject, metadata):
+        metadata = pointer or metadata
+        inferred_type = None if metadata is None else metadata.get('class')
+        if inferred_type is not None:
+            logger.debug('found inferred_type={}'.format(inferred_type))
+
+        if cls is None:
+            if inferred_type is None:
+                raise RuntimeError((
+                    'Expected type hint in file footer - this seems to be a '
+                    'file saved with Velox <= 0.2.1. Please use '
+                    'MyClassName.load(...) classmethod, or regenerate the '
+                    'file for Velox > 0.2.1.'
+                ))
+            cls = import_from_qualified_name(inferred_type)
+
+        with default_mmap_mode('r' if mmap else False):
+            obj = cls._load(fileobject)
+        if not issubclass(type(obj), VeloxObject):
+            raise TypeError('loaded object of type {} must inherit from '
+                            'VeloxObject'.format(cls))
+        obj.current_sha = (metadata or {}).get('sha256') or filesha
+
+    return obj
+
+
+@contextmanager
+def _local_copy(filepath, local_cache_dir):
+    """
+    Yields the path to load `filepath` from, which is a copy held in the
+    cache at `local_cache_dir` while loading, if there is one, along with the
+    metadata of the pointer record it was reached through (if it was).
+    """
+    if local_cache_dir is None:
+        yield filepath, None
+        return
+    cache = get_cache(local_cache_dir)
+    with cache.fetched(filepath) as cached:
+        # Pointer records are resolved against their original prefix, and the
+        # blob they point at is cached under its content hash, so that it is
+        # shared by every name and version pointing at it.
+        pointer = read_metadata(cached)
+        target = pointer_target(filepath, pointer)
+        chunked = pointer is not None and pointer.get('chunks') is not None
+        if target is None and not chunked:
+            logger.info('will load from local copy {}'.format(cached))
+            yield cached, None
+            return
+    if target is not None:
+        copy = cache.fetched(target, revalidate=False)
+    else:
+        # only the chunks missing from the cache are fetched
+        copy = fetch_cached(cache, filepath, pointer)
+    with copy as cached:
+        logger.info('will load from local copy {}'.format(cached))
+        yield cached, pointer
 
 
 def get_prefix(filepath):
@@ -867,32 +1218,60 @@ def _find_best_file(registered_name, prefix=None, specifier=None,
         logger.debug('No prefix specified. Falling back to '
                      'default at: {}'.format(prefix))
 
-    sortkey = registered_name + '*'
-
-    if specifier is None:
-        specifier = '*_{}.vx'.format(sortkey)
-    else:
-        specifier = '*{}*_{}.vx'.format(specifier, sortkey)
+    specifier = _file_pattern(registered_name, specifier)
 
     logger.debug('pattern for constraint satisfaction: {}'.format(specifier))
 
-    if version_constraints is not None:
-        if isinstance(version_constraints, six.string_types):
-            version_constraints = Specification(version_constraints)
-        elif not isinstance(version_constraints, Specification):
-            version_constraints = Specification(*version_constraints)
+    version_constraints = _version_specification(version_constraints)
 
     logger.info('Searching for matching file in {} with specifier {}'
                 .format(prefix, specifier))
 
-    filelist = find_matching_files(prefix, specifier)
+    def select(filelist):
+        if not filelist:
+            raise VeloxConstraintError(
+                'No files matching pattern {specifier} '
+                'found in {prefix}'.format(specifier=specifier, prefix=prefix)
+            )
+        return _select_best_file(filelist, version_constraints)
+
+    return stitch_filename(prefix,
+                           resolve_matching_file(prefix, specifier, select))
 
-    if not filelist:
-        raise VeloxConstraintError(
-            'No files matching pattern {specifier} '
-            'found in {prefix}'.format(specifier=specifier, prefix=prefix)
-        )
 
+def _file_pattern(registered_name, specifier=None):
+    """
+    Returns the glob pattern matching the filenames of objects saved under
+    `registered_name`, with `specifier` in their timestamp.
+    """
+    sortkey = registered_name + '*'
+
+    if specifier is None:
+        return '*_{}.vx'.format(sortkey)
+    return '*{}*_{}.vx'.format(specifier, sortkey)
+
+
+def _version_specification(version_constraints):
+    if version_constraints is None or \
+            isinstance(version_constraints, Specification):
+        return version_constraints
+    if isinstance(version_constraints, six.string_types):
+        return Specification(version_constraints)
+    return Specification(*version_constraints)
+
+
+def _select_best_file(filelist, version_constraints=None):
+    """
+    Selects the file to load from `filelist` (sorted from most to least
+    recent), which is the most recent of those with the highest version
+    satisfying `version_constraints`.
+
+    Raises:
+    -------
+
+    * `velox.exceptions.VeloxConstraintError` if no file satisfies
+        `version_constraints`.
+    """
     if version_constraints is not None:
         logger.debug('matching version requirements: '
                      '{}'.format(version_constraints))
@@ -918,4 +1297,4 @@ def _find_best_file(registered_name, prefix=None, specifier=None,
 
     logger.info('will load from {}'.format(filelist[0]))
 
-    return stitch_filename(prefix, filelist[0])
+    return filelist[0]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+## `velox.scheduling`
+
+The `velox.scheduling` submodule provides the reload scheduler shared by every
+`velox.obj.VeloxObject` in a process. Rather than each managed object running
+a scheduler (and a thread) of its own, the scheduled reloads of all of them
+(see `velox.obj.VeloxObject.reload`) are multiplexed onto one background
+scheduler, which runs them on a small, bounded pool of worker threads. The
+scheduler is only started once a reload is first scheduled.
+
+<!--begin_code-->
+
+    #!python
+    from velox import scheduling
+
+    # must be called before the first reload is scheduled
+    scheduling.configure(reload_workers=2)
+
+    for model in models:
+        model.reload(prefix='s3://myprodbucket/ml/models', scheduled=True,
+                     minutes=5)
+<!--end_code-->
+"""
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_SETTINGS = {
+    'reload_workers': 4,
+}
+
+
+def configure(**settings):
+    """
+    Sets process-wide options for the `velox.scheduling` submodule. As the
+    shared scheduler is created when a reload is first scheduled, settings
+    changed afterwards only apply to a scheduler created after a fork.
+
+    Args:
+    -----
+
+    * `reload_workers (int)`: The number of threads running scheduled reloads
+        concurrently, across all managed objects. Defaults to 4.
+
+    Raises:
+    -------
+
+    * `ValueError` if an unknown setting is passed, or if a setting has an
+        invalid value.
+    """
+    unknown = set(settings) - set(_SETTINGS)
+    if unknown:
+        raise ValueError('unknown scheduling settings: {}'
+                         .format(', '.join(sorted(unknown))))
+    if settings.get('reload_workers', 1) < 1:
+        raise ValueError('reload_workers must be positive')
+    if _state()['scheduler'] is not None:
+        logger.warning('the reload scheduler is already running - new '
+                       'settings will not apply to it')
+    logger.debug('updating scheduling settings: {}'.format(settings))
+    _SETTINGS.update(settings)
+
+
+_STATE = {}
+
+
+def _reset_state():
+    _STATE.update(pid=os.getpid(), lock=threading.Lock(), scheduler=None)
+
+
+def _state():
+    # the scheduler thread (and its workers) do not survive a fork, so a
+    # forked child starts a scheduler of its own
+    if _STATE.get('pid') != os.getpid():
+        _reset_state()
+    return _STATE
+
+
+_reset_state()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_state)
+
+
+def get_scheduler():
+    """
+    Returns the `apscheduler.schedulers.background.BackgroundScheduler`
+    shared by this process, creating and starting it on first use (and again
+    after a fork).
+    """
+    state = _state()
+    with state['lock']:
+        if state['scheduler'] is None:
+            from apscheduler.executors.pool import ThreadPoolExecutor
+            from apscheduler.schedulers.background import BackgroundScheduler
+            logger.debug('starting shared reload scheduler with {} workers'
+                         .format(_SETTINGS['reload_workers']))
+            scheduler = BackgroundScheduler(
+                executors={
+                    'default': ThreadPoolExecutor(_SETTINGS['reload_workers'])
+                },
+                job_defaults={'coalesce': True, 'max_instances': 1}
+            )
+            scheduler.start()
+            state['scheduler'] = scheduler
+        return state['scheduler']
+
+
+def schedule(func, args=(), **interval_trigger_args):
+    """
+    Schedules `func(*args)` to run on the shared scheduler at the interval
+    given by `interval_trigger_args` (for example, `minutes=2`), starting
+    the scheduler if need be. Runs that are missed while the worker pool is
+    busy are coalesced, and a job never runs concurrently with itself.
+
+    Returns:
+    --------
+
+    The scheduled `apscheduler.job.Job`, to pass to
+    `velox.scheduling.cancel`.
+    """
+    job = get_scheduler().add_job(func=func, args=args, trigger='interval',
+                                  **interval_trigger_args)
+    logger.debug('scheduled job {}: {}'.format(job.id, job))
+    return job
+
+
+def cancel(job):
+    """
+    Cancels a `job` scheduled through `velox.scheduling.schedule`, if it is
+    still scheduled.
+    """
+    from apscheduler.jobstores.base import JobLookupError
+    try:
+        job.remove()
+        logger.debug('cancelled job {}'.format(job.id))
+    except JobLookupError:
+        pass
+
+
+__all__ = ['configure', 'get_scheduler', 'schedule', 'cancel']
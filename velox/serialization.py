@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+## `velox.serialization`
+
+The `velox.serialization` submodule provides a serializer for objects that
+hold large buffers (such as NumPy arrays), based on the out-of-band buffers of
+pickle protocol 5. Rather than being copied into the pickle stream, large
+buffers are written after it as raw segments aligned to 64 bytes. On load they
+are reconstructed as views, either over a single read buffer or, when the
+serialized object sits in a local file, over a memory map of that file, so
+that no extra copies are made.
+
+<!--begin_code-->
+
+    #!python
+    from velox.lite import save_object, load_object
+    from velox.wrapper import SimplePickle
+
+    save_object(embeddings, 'Embeddings', prefix='/models', out_of_band=True)
+
+    SimplePickle(embeddings, out_of_band=True).save(prefix='/models')
+<!--end_code-->
+
+On Python versions without pickle protocol 5 (before 3.8), everything is
+serialized in-band, in the same format.
+
+Loads through `velox.obj.VeloxObject.load`, `velox.obj.load_velox_object`, and
+`velox.lite.load_object` read segments into private buffers, unless they are
+passed `mmap=True`. They then map segments read-only, so that every process on
+a host loading the same file (or cached copy of it) shares a single copy of its
+arrays in the page cache.
+"""
+
+from contextlib import contextmanager
+import ctypes
+import io
+import logging
+import mmap
+import pickle
+import struct
+import threading
+
+import dill
+
+from . import filesystem
+
+logger = logging.getLogger(__name__)
+
+VELOX_OOB_MAGIC = b'VXOOB001'
+
+OOB_ALIGNMENT = 64
+
+# buffers smaller than this are left in-band, as their bookkeeping would
+# cost more than the copy
+OOB_MIN_BUFFER_SIZE = 4096
+
+_HEADER = struct.Struct('>QI')
+_SEGMENT = struct.Struct('>QQ')
+
+_HAS_OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+
+_MMAP_MODES = {'c': mmap.ACCESS_COPY, 'r': mmap.ACCESS_READ, False: None}
+
+_LOCAL = threading.local()
+
+
+@contextmanager
+def default_mmap_mode(mode):
+    """
+    Context manager setting the `mmap_mode` that `velox.serialization.load`
+    uses in the current thread when none is passed to it, so that it can be
+    set for `_load` methods that call it.
+    """
+    if mode not in _MMAP_MODES:
+        raise ValueError('invalid mmap_mode: {!r}'.format(mode))
+    previous = getattr(_LOCAL, 'mmap_mode', 'c')
+    _LOCAL.mmap_mode = mode
+    try:
+        yield
+    finally:
+        _LOCAL.mmap_mode = previous
+
+
+def _align(position):
+    return -(-position // OOB_ALIGNMENT) * OOB_ALIGNMENT
+
+
+class _OutOfBandPickler(dill.Pickler):
+    """
+    `dill` pickles NumPy arrays through their protocol 2 reduction, which
+    always copies them in-band, so we hand plain arrays back to NumPy's
+    protocol 5 reduction.
+    """
+
+    def reducer_override(self, obj):
+        cls = type(obj)
+        if cls.__name__ == 'ndarray' and cls.__module__ == 'numpy':
+            return obj.__reduce_ex__(self.proto)
+        return NotImplemented
+
+
+def dump(obj, fileobject, out_of_band=True):
+    """
+    Serializes `obj` into the (writable, not necessarily seekable)
+    `fileobject`.
+
+    Args:
+    -----
+
+    * `obj (object)`: a dill-able object.
+
+    * `fileobject (file)`: the file object to write to.
+
+    * `out_of_band (bool)`: whether to write large buffers out-of-band, as
+        raw aligned segments. If `False`, `obj` is simply dumped with `dill`.
+
+    Returns:
+    --------
+
+    A list of the `(offset, length)` of every out-of-band segment, relative to
+    the start of the output.
+    """
+    if not out_of_band:
+        dill.dump(obj, fileobject)
+        return []
+
+    buffers = []
+    if _HAS_OUT_OF_BAND:
+        def buffer_callback(buf):
+            raw = buf.raw()
+            if raw.nbytes < OOB_MIN_BUFFER_SIZE:
+                return True
+            buffers.append(raw)
+            return False
+        buf = io.BytesIO()
+        _OutOfBandPickler(buf, 5, buffer_callback=buffer_callback).dump(obj)
+        data = buf.getvalue()
+    else:  # pragma: no cover
+        logger.debug('pickle protocol 5 unavailable - serializing in-band')
+        data = dill.dumps(obj)
+
+    position = (len(VELOX_OOB_MAGIC) + _HEADER.size +
+                _SEGMENT.size * len(buffers) + len(data))
+    segments = []
+    for buf in buffers:
+        position = _align(position)
+        segments.append((position, buf.nbytes))
+        position += buf.nbytes
+
+    logger.debug('writing {} out-of-band buffers ({} bytes)'.format(
+        len(buffers), sum(n for _, n in segments)))
+
+    fileobject.write(VELOX_OOB_MAGIC)
+    fileobject.write(_HEADER.pack(len(data), len(segments)))
+    for segment in segments:
+        fileobject.write(_SEGMENT.pack(*segment))
+    fileobject.write(data)
+    position = len(VELOX_OOB_MAGIC) + _HEADER.size + \
+        _SEGMENT.size * len(segments) + len(data)
+    for (offset, length), buf in zip(segments, buffers):
+        fileobject.write(b'\0' * (offset - position))
+        fileobject.write(buf)
+        position = offset + length
+    return segments
+
+
+def _has_magic(fileobject):
+    if hasattr(fileobject, 'peek'):
+        return fileobject.peek(len(VELOX_OOB_MAGIC))[:len(VELOX_OOB_MAGIC)] \
+            == VELOX_OOB_MAGIC
+    start = fileobject.tell()
+    magic = fileobject.read(len(VELOX_OOB_MAGIC))
+    fileobject.seek(start)
+    return magic == VELOX_OOB_MAGIC
+
+
+def _read_exactly(fileobject, n):
+    data = fileobject.read(n)
+    if len(data) != n:
+        raise IOError('unexpected end of out-of-band stream')
+    return data
+
+
+def _map_segments(fileobject, start, segments, access=mmap.ACCESS_COPY):
+    """
+    Maps the file `fileobject` is a view over, returning views of `segments`
+    (relative to `start` in `fileobject`), or `None` if it isn't a view over
+    a local file.
+    """
+    region = filesystem.file_region(fileobject)
+    if region is None:
+        return None
+    fileno, offset = region
+    mapped = memoryview(mmap.mmap(fileno, 0, access=access))
+    origin = offset + start
+    if origin + max(o + n for o, n in segments) > len(mapped):
+        raise IOError('out-of-band segments run past the end of the file')
+    return [mapped[origin + o:origin + o + n] for o, n in segments]
+
+
+def _read_segments(fileobject, position, segments):
+    """
+    Reads everything from the current `position` of `fileobject` through the
+    last of the `segments` into a single buffer, returning views of them.
+    """
+    size = max(o + n for o, n in segments) - position
+    # over-allocate so that the buffer can be shifted to keep the segments
+    # aligned in memory as they are in the stream
+    raw = bytearray(size + OOB_ALIGNMENT)
+    address = ctypes.addressof(ctypes.c_char.from_buffer(raw))
+    shift = (position - address) % OOB_ALIGNMENT
+    buf = memoryview(raw)[shift:shift + size]
+    view = buf
+    while len(view):
+        n = fileobject.readinto(view)
+        if not n:
+            raise IOError('unexpected end of out-of-band stream')
+        view = view[n:]
+    return [buf[o - position:o - position + n] for o, n in segments]
+
+
+def load(fileobject, mmap_mode=None):
+    """
+    Deserializes an object from `fileobject`, which holds either the output
+    of `velox.serialization.dump`, or a plain `dill` dump.
+
+    Args:
+    -----
+
+    * `fileobject (file)`: the file object to read from.
+
+    * `mmap_mode (None | bool | str)`: if `fileobject` is (a view over) a
+        local file, out-of-band buffers are reconstructed over a memory map of
+        it, which is copy-on-write if `mmap_mode` is `'c'`, and read-only if
+        it is `'r'`. If `False`, buffers are always read into memory. If
+        `None`, the mode set by `velox.serialization.default_mmap_mode` (by
+        default, `'c'`) is used.
+
+    Raises:
+    -------
+
+    * `ValueError` if `mmap_mode` is invalid.
+    """
+    if mmap_mode is None:
+        mmap_mode = getattr(_LOCAL, 'mmap_mode', 'c')
+    if mmap_mode not in _MMAP_MODES:
+        raise ValueError('invalid mmap_mode: {!r}'.format(mmap_mode))
+
+    if not _has_magic(fileobject):
+        return dill.load(fileobject)
+
+    start = fileobject.tell()
+    _read_exactly(fileobject, len(VELOX_OOB_MAGIC))
+    data_length, count = _HEADER.unpack(_read_exactly(fileobject,
+                                                      _HEADER.size))
+    segments = [_SEGMENT.unpack(_read_exactly(fileobject, _SEGMENT.size))
+                for _ in range(count)]
+    data = _read_exactly(fileobject, data_length)
+
+    buffers = []
+    if segments:
+        if mmap_mode:
+            buffers = _map_segments(fileobject, start, segments,
+                                    _MMAP_MODES[mmap_mode])
+        if buffers:
+            logger.debug('mapped {} out-of-band buffers'.format(count))
+        else:
+            position = (len(VELOX_OOB_MAGIC) + _HEADER.size +
+                        _SEGMENT.size * count + data_length)
+            buffers = _read_segments(fileobject, position, segments)
+
+    if not _HAS_OUT_OF_BAND:  # pragma: no cover
+        return dill.loads(data)
+    return dill.loads(data, buffers=buffers)
+
+
+__all__ = ['dump', 'load', 'default_mmap_mode']
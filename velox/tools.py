@@ -9,12 +9,18 @@ package.
 
 from __future__ import unicode_literals
 
+import atexit
 import datetime
-from hashlib import sha1
+from hashlib import sha1, sha256
+import io
+import json
+import logging
+import os
 import six
-from threading import Thread
+import struct
+import threading
 import importlib
-from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 
 from builtins import bytes
 
@@ -29,6 +35,58 @@ VELOX_NEW_FILE_FORMAT_STRING = (
 )
 VELOX_NEW_FILE_EXTRAS_LENGTH = len(VELOX_NEW_FILE_FORMAT_STRING.format(''))
 
+# The structured footer is laid out as a JSON metadata document, followed by
+# its length and the footer format version, followed by the signature.
+VELOX_FOOTER_SIGNATURE = b'||vxf||'
+VELOX_FOOTER_VERSION = 1
+VELOX_FOOTER_READ_SIZE = 8192
+
+_FOOTER_TRAILER = struct.Struct('>IH')
+VELOX_FOOTER_TRAILER_LENGTH = (_FOOTER_TRAILER.size +
+                               len(VELOX_FOOTER_SIGNATURE))
+
+logger = logging.getLogger(__name__)
+
+_SETTINGS = {
+    'threaded_workers': 4,
+    'threaded_queue_size': 64,
+}
+
+
+def configure(**settings):
+    """
+    Sets process-wide options for the `velox.tools` submodule.
+
+    Args:
+    -----
+
+    * `threaded_workers (int)`: The number of threads running calls to
+        functions decorated with `velox.tools.threaded`. Defaults to 4.
+
+    * `threaded_queue_size (int)`: The number of such calls that can wait
+        for a free thread. Once that many are waiting, further calls block
+        until one of them starts. Defaults to 64.
+
+    Raises:
+    -------
+
+    * `ValueError` if an unknown setting is passed, or if a setting has an
+        invalid value.
+    """
+    unknown = set(settings) - set(_SETTINGS)
+    if unknown:
+        raise ValueError('unknown tools settings: {}'
+                         .format(', '.join(sorted(unknown))))
+    if settings.get('threaded_workers', 1) < 1:
+        raise ValueError('threaded_workers must be positive')
+    if settings.get('threaded_queue_size', 0) < 0:
+        raise ValueError('threaded_queue_size must not be negative')
+    logger.debug('updating tools settings: {}'.format(settings))
+    with _executor_state()['lock']:
+        _SETTINGS.update(settings)
+        # calls already submitted finish on the old executor
+        _retire_executor(wait=False)
+
 
 def sha(s):
     """
@@ -69,14 +127,6 @@ class abstractclassmethod(classmethod):
         super(abstractclassmethod, self).__init__(callable)
 
 
-def call_with_future(fn, future, args, kwargs):
-    try:
-        result = fn(*args, **kwargs)
-        future.set_result(result)
-    except Exception as exc:
-        future.set_exception(exc)
-
-
 def fullname(o):
     module = o.__class__.__module__
     if module is None or module == str.__class__.__module__:
@@ -105,7 +155,7 @@ def obtain_padding_bytes(obj, asbytes=True):
         raise ValueError('Qualified name {} is too long for use in Velox.'
                          .format(qualname))
 
-    pad_bytes = VELOX_NEW_FILE_FORMAT_STRING.format(fullname(obj))
+    pad_bytes = VELOX_NEW_FILE_FORMAT_STRING.format(qualname)
 
     if asbytes:
         return pad_bytes.encode()
@@ -133,7 +183,8 @@ def get_file_meta(filehandle, truncate=False):
     file_signature = filehandle.read()
 
     if isinstance(file_signature, bytes):
-        file_signature = file_signature.decode()
+        # arbitrary binary payloads need not end in valid utf-8
+        file_signature = file_signature.decode('utf-8', 'replace')
 
     # If we're dealing with the old file format, we cannot find the qualname
     if file_signature != VELOX_NEW_FILE_SIGNATURE:
@@ -153,10 +204,233 @@ def get_file_meta(filehandle, truncate=False):
     return meta_string
 
 
+def build_footer(meta):
+    """
+    Returns the bytes of a structured velox footer holding the metadata dict
+    `meta`, to append to a payload.
+    """
+    data = json.dumps(meta, sort_keys=True).encode('utf-8')
+    return (data + _FOOTER_TRAILER.pack(len(data), VELOX_FOOTER_VERSION) +
+            VELOX_FOOTER_SIGNATURE)
+
+
+def footer_length(tail):
+    """
+    Returns the length of the velox footer (structured, or the legacy padded
+    type hint) at the end of `tail`, the last bytes of a file, or `0` if there
+    is none. The length can exceed that of `tail`, if it holds only part of
+    the footer.
+    """
+    tail = bytes(tail)
+    signature = VELOX_NEW_FILE_SIGNATURE.encode()
+    if tail.endswith(VELOX_FOOTER_SIGNATURE) and \
+            len(tail) >= VELOX_FOOTER_TRAILER_LENGTH:
+        length, version = _FOOTER_TRAILER.unpack(
+            tail[-VELOX_FOOTER_TRAILER_LENGTH:-len(VELOX_FOOTER_SIGNATURE)])
+        if version > VELOX_FOOTER_VERSION:
+            raise ValueError('unsupported velox footer version {}'
+                             .format(version))
+        return length + VELOX_FOOTER_TRAILER_LENGTH
+    if tail.endswith(signature) and \
+            len(tail) >= VELOX_NEW_FILE_EXTRAS_LENGTH:
+        return VELOX_NEW_FILE_EXTRAS_LENGTH
+    return 0
+
+
+def parse_footer(tail):
+    """
+    Parses the velox footer at the end of `tail`, returning its metadata as a
+    dict, or `None` if there is no footer. Legacy type hints are returned as
+    `{'class': ...}`.
+
+    Raises:
+    -------
+
+    * `ValueError` if `tail` does not hold the whole footer.
+    """
+    tail = bytes(tail)
+    length = footer_length(tail)
+    if not length:
+        return None
+    if length > len(tail):
+        raise ValueError('need the last {} bytes to parse the velox footer'
+                         .format(length))
+    if length == VELOX_NEW_FILE_EXTRAS_LENGTH and \
+            not tail.endswith(VELOX_FOOTER_SIGNATURE):
+        return {'class': obtain_qualified_name(tail[-length:])}
+    return json.loads(
+        tail[-length:-VELOX_FOOTER_TRAILER_LENGTH].decode('utf-8'))
+
+
+def read_footer(filehandle):
+    """
+    Reads the velox footer (if any) of the binary, seekable `filehandle`,
+    returning a `(meta, length)` tuple of its metadata (see
+    `velox.tools.parse_footer`) and its length in bytes. Leaves `filehandle`
+    at its start.
+    """
+    filehandle.seek(0, 2)
+    size = filehandle.tell()
+    filehandle.seek(max(size - VELOX_FOOTER_READ_SIZE, 0))
+    tail = filehandle.read()
+    length = footer_length(tail)
+    if length > len(tail) and length <= size:
+        filehandle.seek(size - length)
+        tail = filehandle.read()
+    filehandle.seek(0)
+    if length > len(tail):
+        return None, 0
+    return parse_footer(tail), length
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    Writable file object passing everything written to it through to
+    `fileobject`, while computing the SHA256 of the bytes written (available
+    from `hexdigest`) and their number (`length`). If anything is written
+    anywhere but at the end of what was written before (after a seek),
+    `hexdigest` returns `None`.
+    """
+
+    def __init__(self, fileobject):
+        self._fileobject = fileobject
+        self._sha = sha256()
+        self._position = 0
+        self._contiguous = True
+        self.length = 0
+        self.name = getattr(fileobject, 'name', None)
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        try:
+            return self._fileobject.seekable()
+        except AttributeError:
+            return True
+
+    def write(self, b):
+        n = memoryview(b).nbytes
+        self._fileobject.write(b)
+        if self._position == self.length:
+            self._sha.update(b)
+        else:
+            self._contiguous = False
+        self._position += n
+        self.length = max(self.length, self._position)
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._fileobject.seek(offset, whence)
+        self._position = self._fileobject.tell()
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def hexdigest(self):
+        if not self._contiguous:
+            return None
+        return self._sha.hexdigest()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Returns the SHA256 of the file at `path`, reading it in chunks."""
+    m = sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            m.update(chunk)
+    return m.hexdigest()
+
+
+_EXECUTOR = {}
+
+
+def _reset_executor():
+    _EXECUTOR.update(pid=os.getpid(), lock=threading.Lock(), executor=None,
+                     slots=None)
+
+
+def _executor_state():
+    # worker threads do not survive a fork, so a forked child starts an
+    # executor of its own
+    if _EXECUTOR.get('pid') != os.getpid():
+        _reset_executor()
+    return _EXECUTOR
+
+
+def _retire_executor(wait):
+    executor = _EXECUTOR['executor']
+    _EXECUTOR.update(executor=None, slots=None)
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _get_executor():
+    """
+    Returns the executor shared by all `velox.tools.threaded` functions,
+    along with the semaphore bounding the number of calls submitted to it.
+    """
+    state = _executor_state()
+    with state['lock']:
+        if state['executor'] is None:
+            workers = _SETTINGS['threaded_workers']
+            logger.debug('starting threaded executor with {} workers'
+                         .format(workers))
+            state['executor'] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='velox-threaded')
+            state['slots'] = threading.BoundedSemaphore(
+                workers + _SETTINGS['threaded_queue_size'])
+        return state['executor'], state['slots']
+
+
+def _register_shutdown(fn):
+    """
+    Registers `fn` to run when the interpreter exits, before the worker
+    threads of the executor are joined.
+
+    `concurrent.futures` joins its worker threads in an exit hook of
+    `threading`, which runs before any `atexit` one, so ours has to be such
+    a hook too (registered later, it runs first). Those hooks are private
+    to `threading` (Python 3.9 and later), so where they are unavailable,
+    or can no longer be registered because the interpreter is already
+    shutting down, `fn` falls back to `atexit`. It then only runs once the
+    executor has been joined, so calls that are still queued at exit are
+    run rather than abandoned.
+    """
+    register = getattr(threading, '_register_atexit', None)
+    try:
+        if register is None:
+            raise RuntimeError('threading exit hooks unavailable')
+        register(fn)
+    except RuntimeError:
+        atexit.register(fn)
+    return fn
+
+
+@_register_shutdown
+def _shutdown_executor():
+    # calls that haven't started yet are abandoned rather than holding up
+    # interpreter shutdown
+    state = _executor_state()
+    with state['lock']:
+        executor = state['executor']
+        if executor is not None:
+            try:
+                executor.shutdown(wait=True, cancel_futures=True)
+            except TypeError:  # pragma: no cover
+                executor.shutdown(wait=True)
+        state.update(executor=None, slots=None)
+
+
 def threaded(fn):
     """
     A simple decorator that allows a function to be called with its return
-    value given as a `Future` object.
+    value given as a `Future` object. Calls run on a pool of threads shared
+    by every decorated function, sized by `velox.tools.configure`. When too
+    many calls are already waiting for a thread, the caller blocks until one
+    of them starts, so decorated functions must not wait on the results of
+    other decorated functions.
 
     Example:
     --------
@@ -171,10 +445,16 @@ def threaded(fn):
     """
 
     def wrapper(*args, **kwargs):
-        future = Future()
-        Thread(target=call_with_future,
-               args=(fn, future, args, kwargs)).start()
+        executor, slots = _get_executor()
+        slots.acquire()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
         return future
     return wrapper
 
-__all__ = ['threaded', 'timestamp']
+
+__all__ = ['threaded', 'timestamp', 'configure']
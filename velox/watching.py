@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+## `velox.watching`
+
+The `velox.watching` submodule provides prefix watchers, which serve the
+scheduled reloads (see `velox.obj.VeloxObject.reload`) of any number of
+managed objects saved to the same prefix. A watcher lists its prefix once per
+interval (on the shared scheduler of `velox.scheduling`), compares the listing
+against the previous one, and hands the new files to every subscriber whose
+filter matches them. The cost of polling a prefix thus scales with the number
+of prefixes watched, rather than with the number of objects watching them.
+
+Local prefixes can instead be watched through filesystem notifications (with
+inotify, on Linux), in which case there is no periodic listing at all, and
+subscribers hear of a new file as soon as it is completely written (that is,
+closed after writing, or renamed into place). Elsewhere, and for prefixes on
+S3, such watches fall back to polling. Note that notifications are only raised
+for changes made through the local kernel, so prefixes on network filesystems
+that are written to from other hosts should be polled.
+
+<!--begin_code-->
+
+    #!python
+    from velox.watching import watch
+
+    def on_new_files(filenames):
+        print('newest match: {}'.format(filenames[0]))
+
+    subscription = watch('s3://myprodbucket/ml/models',
+                         match=lambda filename: filename.endswith('.vx'),
+                         callback=on_new_files, minutes=5)
+    ...
+    subscription.cancel()
+
+    # reacts within milliseconds of a new file landing in a local prefix
+    subscription = watch('/mnt/models', match=..., callback=on_new_files,
+                         notify=True)
+<!--end_code-->
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import uuid
+
+from . import filesystem
+from . import scheduling
+
+logger = logging.getLogger(__name__)
+
+# how often a watch asking for notifications polls when they are unavailable
+NOTIFY_FALLBACK_INTERVAL = {'seconds': 5}
+
+# how long a notifying watcher waits before retrying a failed subscriber
+NOTIFY_RETRY_SECONDS = 5
+
+
+def _snapshot(prefix):
+    """
+    Returns a `dict` mapping the filenames at `prefix` to their sizes, read
+    from the manifest at `prefix` when manifests are enabled (see
+    `velox.filesystem.configure`), and from a listing otherwise.
+    """
+    entries = None
+    if filesystem._SETTINGS['use_manifest']:
+        entries = filesystem.read_manifest(prefix)
+    if entries is None:
+        entries = filesystem._list_prefix(prefix)
+    return entries
+
+
+class Subscription(object):
+    """
+    A subscription to the files appearing at the prefix of a
+    `velox.watching.PrefixWatcher`, as returned by `velox.watching.watch`.
+
+    Args:
+    -----
+
+    * `watcher (velox.watching.PrefixWatcher)`: the watcher subscribed to.
+
+    * `match (callable)`: called with a filename, returns whether or not the
+        subscription is interested in it.
+
+    * `callback (callable)`: called with the list of every matching filename
+        at the prefix (most recent first, by filename timestamp) whenever a
+        matching file appears, changes size, or is removed. If it raises, it
+        is called again on every poll until it succeeds.
+    """
+
+    def __init__(self, watcher, match, callback):
+        self.id = uuid.uuid4().hex
+        self.watcher = watcher
+        self.match = match
+        self.callback = callback
+        # a pending subscriber is shown what is there on the next poll, which
+        # is the case for new subscribers and for those that failed last time
+        self.pending = True
+
+    def __repr__(self):
+        return '{}(id={!r}, prefix={!r})'.format(type(self).__name__, self.id,
+                                                 self.watcher.prefix)
+
+    def cancel(self):
+        """Stops the subscription, if it hasn't been stopped already."""
+        self.watcher.unsubscribe(self)
+
+
+class PrefixWatcher(object):
+    """
+    Watches the files at `prefix` (which can be on S3), listing it once per
+    interval given by `interval_trigger_args` (for example, `minutes=2`) while
+    it has subscribers. Watchers are shared through `velox.watching.watch`
+    rather than created directly.
+    """
+
+    def __init__(self, prefix, **interval_trigger_args):
+        self.prefix = prefix
+        self.interval_trigger_args = interval_trigger_args
+        self._subscriptions = []
+        self._snapshot = {}
+        self._running = False
+        self._job = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{}(prefix={!r}, {})'.format(
+            type(self).__name__, self.prefix,
+            ', '.join('{}={!r}'.format(k, v) for k, v
+                      in sorted(self.interval_trigger_args.items())))
+
+    @property
+    def subscriptions(self):
+        """The current subscriptions to this watcher."""
+        with self._lock:
+            return list(self._subscriptions)
+
+    def subscribe(self, match, callback):
+        """
+        Subscribes `callback` to the files matching `match` (see
+        `velox.watching.Subscription`), starting to watch the prefix if need
+        be.
+        """
+        subscription = Subscription(self, match, callback)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            if not self._running:
+                logger.debug('starting to watch {}'.format(self.prefix))
+                self._start()
+                self._running = True
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Removes `subscription`, stopping to watch the prefix if it was the
+        last one.
+        """
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+            if not self._subscriptions and self._running:
+                logger.debug('no longer watching {}'.format(self.prefix))
+                self._stop()
+                self._running = False
+                self._snapshot = {}
+        _forget(self)
+
+    def _start(self):
+        self._job = scheduling.schedule(self.poll,
+                                        **self.interval_trigger_args)
+
+    def _stop(self):
+        scheduling.cancel(self._job)
+        self._job = None
+
+    def poll(self):
+        """
+        Lists the prefix once, and notifies the subscribers that match the
+        files that are new, have changed size, or were removed since the
+        previous listing. Subscribers that have not been polled for yet, or
+        that failed to handle the previous notification, are notified
+        regardless.
+        """
+        try:
+            snapshot = _snapshot(self.prefix)
+        except Exception:
+            logger.exception('failed to list {}'.format(self.prefix))
+            return
+
+        with self._lock:
+            changed = [
+                filename for filename, size in snapshot.items()
+                if size > 0 and self._snapshot.get(filename) != size
+            ]
+            changed.extend(filename for filename in self._snapshot
+                           if filename not in snapshot)
+            self._snapshot = snapshot
+        self._route(changed)
+
+    def _route(self, changed):
+        """
+        Hands every file at the prefix to the subscribers that match any of
+        the `changed` filenames (and to pending subscribers), given the
+        current snapshot.
+        """
+        with self._lock:
+            available = sorted((filename for filename, size
+                                in self._snapshot.items() if size > 0),
+                               reverse=True)
+            subscriptions = list(self._subscriptions)
+
+        logger.debug('{} of {} files at {} have changed'
+                     .format(len(changed), len(available), self.prefix))
+
+        for subscription in subscriptions:
+            pending, subscription.pending = subscription.pending, False
+            try:
+                if not pending and not any(map(subscription.match, changed)):
+                    continue
+                matching = [filename for filename in available
+                            if subscription.match(filename)]
+                if matching:
+                    subscription.callback(matching)
+            except Exception:
+                subscription.pending = True
+                logger.exception('subscriber {} failed to handle new files '
+                                 'at {} - will retry'
+                                 .format(subscription.id, self.prefix))
+
+
+# see inotify(7)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+_LIBC = {}
+
+
+def _libc():
+    if 'libc' not in _LIBC:
+        libc = None
+        if sys.platform.startswith('linux'):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                   use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError):
+                libc = None
+        _LIBC['libc'] = libc
+    return _LIBC['libc']
+
+
+def notifications_available(prefix):
+    """
+    Whether or not the files at `prefix` can be watched through filesystem
+    notifications (see `velox.watching.NotifyingPrefixWatcher`).
+    """
+    return not filesystem.is_s3_path(prefix) and _libc() is not None
+
+
+def _inotify_watch(directory):
+    """
+    Returns an inotify file descriptor watching `directory` for files being
+    closed after writing, moved into or out of it, or deleted.
+    """
+    libc = _libc()
+    fd = libc.inotify_init1(_IN_CLOEXEC)
+    if fd < 0:
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+    if not isinstance(directory, bytes):
+        directory = directory.encode(sys.getfilesystemencoding())
+    if libc.inotify_add_watch(fd, directory,
+                              _IN_CLOSE_WRITE | _IN_MOVED_TO |
+                              _IN_MOVED_FROM | _IN_DELETE) < 0:
+        code = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(code, os.strerror(code), directory)
+    return fd
+
+
+def _read_events(fd):
+    """Yields a `(mask, filename)` pair for every pending inotify event."""
+    buf = os.read(fd, 64 * 1024)
+    offset = 0
+    while offset < len(buf):
+        _, mask, _, length = _INOTIFY_EVENT.unpack_from(buf, offset)
+        offset += _INOTIFY_EVENT.size
+        name = buf[offset:offset + length].rstrip(b'\0')
+        offset += length
+        yield mask, name.decode(sys.getfilesystemencoding())
+
+
+class NotifyingPrefixWatcher(PrefixWatcher):
+    """
+    Watches the files at the local `prefix` through inotify, on a thread of
+    its own that sleeps until a file is completely written to the prefix.
+    The prefix is only listed when a subscriber joins (to show it what is
+    already there), or if the kernel drops notifications. Watchers are
+    shared through `velox.watching.watch` rather than created directly.
+
+    Files whose names start with a `.` (such as the temporary files that
+    Velox writes to before renaming them into place) are ignored.
+    """
+
+    def __init__(self, prefix):
+        super(NotifyingPrefixWatcher, self).__init__(prefix)
+        self._wake = None
+
+    def __repr__(self):
+        return '{}(prefix={!r})'.format(type(self).__name__, self.prefix)
+
+    def subscribe(self, match, callback):
+        subscription = super(NotifyingPrefixWatcher, self).subscribe(
+            match, callback)
+        # new subscribers are served by a listing on the watching thread
+        self._signal(b'p')
+        return subscription
+
+    def _signal(self, message):
+        with self._lock:
+            if self._wake is not None:
+                os.write(self._wake, message)
+
+    def _start(self):
+        filesystem.safe_mkdir(self.prefix)
+        fd = _inotify_watch(self.prefix)
+        wake_r, self._wake = os.pipe()
+        thread = threading.Thread(target=self._run, args=(fd, wake_r),
+                                  name='velox-watch-{}'.format(self.prefix))
+        thread.daemon = True
+        thread.start()
+
+    def _stop(self):
+        os.write(self._wake, b's')
+        os.close(self._wake)
+        self._wake = None
+
+    def _run(self, fd, wake):
+        try:
+            while True:
+                # subscribers that failed are retried without waiting for
+                # another notification
+                timeout = None
+                if any(s.pending for s in self.subscriptions):
+                    timeout = NOTIFY_RETRY_SECONDS
+                try:
+                    readable = select.select([fd, wake], [], [], timeout)[0]
+                except (OSError, select.error) as err:
+                    if err.args[0] == errno.EINTR:
+                        continue
+                    raise
+                relist, changed = False, set()
+                if wake in readable:
+                    signals = os.read(wake, 4096)
+                    if not signals or b's' in signals:
+                        return
+                    relist = True
+                if fd in readable:
+                    for mask, filename in _read_events(fd):
+                        if mask & _IN_Q_OVERFLOW:
+                            logger.warning('missed notifications for {} - '
+                                           'listing it'.format(self.prefix))
+                            relist = True
+                        elif filename and not filename.startswith('.'):
+                            changed.add(filename)
+                if relist:
+                    self.poll()
+                elif changed:
+                    self._notify(changed)
+                elif not readable:
+                    self._route([])
+        except Exception:
+            logger.exception('stopped watching {}'.format(self.prefix))
+        finally:
+            os.close(fd)
+            os.close(wake)
+
+    def _notify(self, filenames):
+        changed = []
+        with self._lock:
+            for filename in filenames:
+                path = os.path.join(self.prefix, filename)
+                try:
+                    size = os.path.getsize(path) if os.path.isfile(path) \
+                        else None
+                except OSError:
+                    size = None
+                if size is None:
+                    # removed (or already gone again)
+                    if self._snapshot.pop(filename, None) is not None:
+                        changed.append(filename)
+                    continue
+                self._snapshot[filename] = size
+                if size > 0:
+                    changed.append(filename)
+        logger.debug('notified of {} at {}'.format(changed, self.prefix))
+        self._route(changed)
+
+
+_WATCHERS = {}
+_WATCHERS_LOCK = threading.Lock()
+
+
+def _reset_watchers():
+    # watching threads and scheduled polls do not survive a fork, so a
+    # forked child starts with no watchers
+    _WATCHERS.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_watchers)
+
+
+def _watcher_key(prefix, interval_trigger_args, notify=False):
+    if not filesystem.is_s3_path(prefix):
+        prefix = os.path.abspath(prefix)
+    if notify:
+        return prefix, None
+    return prefix, tuple(sorted(interval_trigger_args.items()))
+
+
+def _forget(watcher):
+    # an idle watcher is dropped, so that the next subscriber starts afresh
+    key = _watcher_key(watcher.prefix, watcher.interval_trigger_args,
+                       isinstance(watcher, NotifyingPrefixWatcher))
+    with _WATCHERS_LOCK:
+        if _WATCHERS.get(key) is watcher and not watcher.subscriptions:
+            del _WATCHERS[key]
+
+
+def get_watcher(prefix, notify=False, **interval_trigger_args):
+    """
+    Returns the `velox.watching.PrefixWatcher` shared by this process for
+    `prefix` and the interval given by `interval_trigger_args`, or if
+    `notify` is set, the `velox.watching.NotifyingPrefixWatcher` shared for
+    `prefix` (see `velox.watching.watch`).
+    """
+    with _WATCHERS_LOCK:
+        return _get_watcher(prefix, notify, interval_trigger_args)
+
+
+def _get_watcher(prefix, notify, interval_trigger_args):
+    if notify and not notifications_available(prefix):
+        logger.warning('filesystem notifications are unavailable for {} - '
+                       'falling back to polling'.format(prefix))
+        notify = False
+        interval_trigger_args = (interval_trigger_args or
+                                 NOTIFY_FALLBACK_INTERVAL)
+    key = _watcher_key(prefix, interval_trigger_args, notify)
+    watcher = _WATCHERS.get(key)
+    if watcher is None:
+        if notify:
+            watcher = NotifyingPrefixWatcher(key[0])
+        else:
+            watcher = PrefixWatcher(key[0], **interval_trigger_args)
+        _WATCHERS[key] = watcher
+    return watcher
+
+
+def watch(prefix, match, callback, notify=False, **interval_trigger_args):
+    """
+    Subscribes `callback` to the files at `prefix` that `match`, through the
+    watcher shared by every subscriber to `prefix` at the same interval (or
+    through filesystem notifications).
+
+    Args:
+    -----
+
+    * `prefix (str)`: the prefix (can be on s3 or on a local filesystem) to
+        watch.
+
+    * `match (callable)`: called with a filename, returns whether or not the
+        subscriber is interested in it.
+
+    * `callback (callable)`: called (on a worker thread of the shared
+        scheduler, or on the thread of a notifying watcher) with the list of
+        every matching filename at the prefix, most recent first, whenever a
+        matching file appears. It is also called on the first poll after
+        subscribing, if any file matches.
+
+    * `notify (bool)`: Whether or not to watch a local `prefix` through
+        filesystem notifications rather than by polling. Where they are
+        unavailable, this falls back to polling at the interval given by
+        `interval_trigger_args`, or every 5 seconds if none is given.
+
+    * `interval_trigger_args`: the polling interval, for example `minutes=2`
+        (see `velox.scheduling.schedule`).
+
+    Returns:
+    --------
+
+    A `velox.watching.Subscription`, which can be cancelled.
+    """
+    # subscribing under the lock keeps an idle watcher from being dropped
+    # between looking it up and subscribing to it
+    with _WATCHERS_LOCK:
+        watcher = _get_watcher(prefix, notify, interval_trigger_args)
+        return watcher.subscribe(match, callback)
+
+
+__all__ = ['PrefixWatcher', 'NotifyingPrefixWatcher', 'Subscription',
+           'get_watcher', 'watch', 'notifications_available']
@@ -7,8 +7,7 @@ The `velox.wrapper` submodule provides pre-packaged wrappers around Keras
 models and around generally pickleable objects in the python ecosystem.
 """
 
-import dill
-
+from . import serialization
 from .obj import VeloxObject, register_object, _fail_bad_init, _zero_downtime
 
 
@@ -22,6 +21,9 @@ class SimplePickle(VeloxObject):
 
     * `managed_object (object)`: an pickleable object
 
+    * `out_of_band (bool)`: whether to save large buffers held by
+        `managed_object` (such as NumPy arrays) out-of-band, so that they are
+        loaded without being copied. See `velox.serialization`.
 
     Example:
     ---------
@@ -35,16 +37,19 @@ class SimplePickle(VeloxObject):
         managed_object.get('foo')
     """
 
-    def __init__(self, managed_object=None):
+    def __init__(self, managed_object=None, out_of_band=False):
         super(SimplePickle, self).__init__()
         self._managed_object = managed_object
+        self._out_of_band = out_of_band
 
     def _save(self, fileobject):
-        dill.dump(self, fileobject)
+        return serialization.dump(
+            self, fileobject,
+            out_of_band=getattr(self, '_out_of_band', False))
 
     @classmethod
     def _load(cls, fileobject):
-        return dill.load(fileobject)
+        return serialization.load(fileobject)
 
     @_fail_bad_init
     @_zero_downtime